@@ -0,0 +1,125 @@
+import gzip
+import os
+
+import numpy as np
+import pandas as pd
+
+from processing import decoding
+from processing.game_data import PLAYER_KEYS, TEAM_KEYS, SeasonData
+from season_store import atomic_write
+
+# player keys the seasons are summed over, a career per player or one stint per player and team
+VIEW_KEYS = {"career": ["PLAYER_ID"],
+             "team": ["PLAYER_ID", "CODETEAM"]}
+
+CONTEXT_COLUMNS = ["2FGM", "3FGM", "AS", "pos", "game_count"]
+
+
+def state_records(state):
+    # json has no inf, it is written as a string and parsed back by pd.to_numeric, nan goes through as null
+    return state.replace({np.inf: "inf", -np.inf: "-inf"}).reset_index().to_dict("list")
+
+
+def read_state(data, keys):
+    # columns that only held nan come back from json as None
+    return pd.DataFrame(data).set_index(keys).apply(pd.to_numeric)
+
+
+def sum_states(values, by):
+    # a sum that is nan in any season stays nan, as it does when the games are summed within a season
+    return values.groupby(by).sum().mask(values.isna().groupby(by).any())
+
+
+class CareerStore:
+    # the player and team sums of every processed season, one gzipped json file per season, multi season views are
+    # combined from these without going back to game level rows
+
+    def __init__(self, root="."):
+        self.path = os.path.join(root, "career")
+        os.makedirs(self.path, exist_ok=True)
+
+    def state_path(self, season):
+        return os.path.join(self.path, f"season_{season}.json.gz")
+
+    def seasons(self):
+        return sorted(int(x[len("season_"):-len(".json.gz")]) for x in os.listdir(self.path)
+                      if x.startswith("season_") and x.endswith(".json.gz"))
+
+    def write_season(self, season_instance):
+        data = {"season": season_instance.season,
+                "players": state_records(season_instance.player_sums),
+                "teams": state_records(season_instance.team_sums)}
+        atomic_write(self.state_path(season_instance.season), decoding.dumps(data), compress=True)
+
+    def read_season(self, season):
+        with gzip.open(self.state_path(season), "rb") as file:
+            data = decoding.loads(file.read())
+
+        return read_state(data["players"], PLAYER_KEYS), read_state(data["teams"], TEAM_KEYS)
+
+    def combine(self, seasons=None, view="career", min_duration=1800):
+        # player rows summed over the seasons per VIEW_KEYS[view], with PER and the percentile ranks worked out
+        # again over the combined rows, returned as a SeasonData holding player_data_agg and team_data_agg
+        seasons = self.seasons() if seasons is None else sorted(seasons)
+        keys = VIEW_KEYS[view]
+
+        player_rows, team_rows = [], []
+        for season in seasons:
+            player_sums, team_sums = self.read_season(season)
+            player_rows.append(player_sums.reset_index().assign(from_season=season))
+            team_rows.append(team_sums.reset_index().assign(from_season=season))
+        player_rows = pd.concat(player_rows, ignore_index=True)
+        team_rows = pd.concat(team_rows, ignore_index=True)
+
+        # rows are labelled with the last season of the window, first_season and last_season give the range
+        label = seasons[-1]
+        window = SeasonData(label)
+        window.team_data_agg = self.combine_teams(team_rows, label)
+        window.player_data_agg, context = self.combine_players(player_rows, team_rows, keys, label)
+
+        # every player row carries the sums of the team seasons it was played in, so a career spread over several
+        # teams is measured against all of them
+        league_vop, league_drp, league_factor, league_foul, league_pace = window.league_constants()
+        df = window.player_data_agg
+        fouls = df["CM"] + df["OF"] + df["CMU"]
+        df_tmp = pd.DataFrame({
+            "uPER_season": SeasonData.u_per(df, context, fouls, league_vop, league_drp, league_factor, league_foul),
+            "team_pace": context["team_pos"] / context["team_game_count"]}).astype(float)
+
+        df["uPER_season"] = df_tmp["uPER_season"]
+        df["PER_season"] = (df_tmp["uPER_season"] * league_pace / df_tmp["team_pace"]) * 15 / np.mean(
+            df.loc[df["duration"] >= min_duration, "uPER_season"])
+        df.loc[df["duration"] < min_duration, "PER_season"] = np.nan
+
+        window.get_percentile_ranks(min_duration)
+        return window
+
+    @staticmethod
+    def combine_teams(team_rows, label):
+        # team names can change between seasons, the latest one is kept
+        state = sum_states(team_rows.drop(columns=["from_season", "CODETEAM", "team_name"]), team_rows["CODETEAM"])
+        state.insert(0, "team_name", team_rows.groupby("CODETEAM")["team_name"].last())
+        return SeasonData.team_aggregates(state.set_index("team_name", append=True), label)
+
+    @staticmethod
+    def combine_players(player_rows, team_rows, keys, label):
+        team_state = team_rows.drop(columns="team_name")
+        context = player_rows[["from_season", "CODETEAM"]].merge(team_state, on=["from_season", "CODETEAM"],
+                                                                how="left")[CONTEXT_COLUMNS]
+        context = context.groupby([player_rows[x] for x in keys]).sum()
+        context = context.rename(columns={x: f"team_{x}" for x in CONTEXT_COLUMNS}).reset_index(drop=True)
+
+        # names, positions and for careers the team come from the latest season the player played in
+        described = [x for x in PLAYER_KEYS if x not in keys]
+        player_rows = player_rows.sort_values("from_season", kind="stable")
+        grouped = player_rows.groupby(keys)
+        state = sum_states(player_rows.drop(columns=PLAYER_KEYS + ["from_season"]), [player_rows[x] for x in keys])
+        state = state.join(grouped[described].last()).join(grouped["from_season"].agg(["min", "max", "nunique"]))
+        state = state.reset_index().set_index(PLAYER_KEYS)
+        first_season, last_season, season_count = state.pop("min"), state.pop("max"), state.pop("nunique")
+
+        df = SeasonData.player_aggregates(state, label)
+        df["first_season"] = first_season.to_numpy()
+        df["last_season"] = last_season.to_numpy()
+        df["season_count"] = season_count.to_numpy()
+        return df, context
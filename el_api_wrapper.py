@@ -1,109 +1,246 @@
 import json
-import sys
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import requests
+from requests.adapters import HTTPAdapter
 from tqdm.auto import tqdm
 
+from processing import decoding
+
+
+class RateLimiter:
+    # token bucket shared by every thread of an ELAPI instance
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, int(rate))
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        # takes a token if one is available, otherwise returns the seconds until the next one
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        wait = self.try_acquire()
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.try_acquire()
+
+
+class IncompleteSeasonError(Exception):
+
+    def __init__(self, season, failed_games):
+        self.season = season
+        self.failed_games = failed_games
+        super().__init__(f"season {season}: could not retrieve games {failed_games}")
+
+
+def is_missing(err):
+    # a 4xx other than 429 will not go away on a retry, usually a game that has not been played yet
+    response = getattr(err, "response", None)
+    return (response is not None) and (400 <= response.status_code < 500) and (response.status_code != 429)
+
 
 class ELAPI:
+    retry_status_codes = {429, 500, 502, 503, 504}
+
+    def __init__(self, max_workers=1, max_retries=5, backoff_factor=0.5, backoff_max=30, timeout=30,
+                 rate_limit=None, burst=None, cache=None, root_url=None, feeds_url=None, recorder=None):
+        self.root_url = root_url or 'https://live.euroleague.net/api/'
+        self.feeds_url = feeds_url or 'https://feeds.incrowdsports.com/provider/euroleague-feeds/v2/'
+        self.max_workers = max_workers
+        self.cache = cache
+        self.recorder = recorder
+        self.recorded = Counter()
+        self.record_lock = threading.Lock()
+        self.checkpoint_every = 10
+
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.rate_limiter = RateLimiter(rate_limit, burst) if rate_limit else None
+
+        # every game keeps up to four requests in flight, size the keep-alive pool accordingly
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(10, 4 * max_workers))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                return min(self.backoff_max, float(retry_after))
+            except ValueError:
+                pass
+
+        # full jitter, keeps concurrent workers from retrying in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_factor * 2 ** attempt))
+
+    def get_response(self, query_url, params):
+        attempt = 0
+
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+
+            try:
+                req = self.session.get(query_url, params=params, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+
+            if (req.status_code in self.retry_status_codes) & (attempt < self.max_retries):
+                time.sleep(self.backoff(attempt, req.headers.get("Retry-After")))
+                attempt += 1
+                continue
+
+            req.raise_for_status()
 
-    def __init__(self):
-        self.root_url = 'https://live.euroleague.net/api/'
+            if self.recorder is not None:
+                self.record(query_url, params, req)
+
+            return req
+
+    def record(self, query_url, params, req):
+        # fixtures are keyed relative to the base urls so they can be served back from any host
+        if query_url.startswith(self.root_url):
+            path = "api/" + query_url[len(self.root_url):]
+        else:
+            path = "feeds/" + query_url[len(self.feeds_url):]
+
+        # asking for the same response again is a poll of a game in progress, every poll is the next snapshot the
+        # replay server moves through with advance(), a poll that got what the one before it did is not written since
+        # a missing snapshot is served from the latest one before it
+        with self.record_lock:
+            key = self.recorder.key(path, params)
+            snapshot = self.recorded[key]
+            self.recorded[key] += 1
+
+            if (snapshot == 0) or (self.recorder.get(path, params, snapshot - 1) != req.content):
+                self.recorder.put(path, params, req.content, snapshot)
+
+    def get_cached(self, endpoint, season, game=0, team=""):
+        if self.cache is None:
+            return None
+        return self.cache.get(endpoint, season, game, team)
+
+    def store_cached(self, endpoint, season, game, team, payload, final=None):
+        if self.cache is None:
+            return
+        if final is None:
+            final = self.cache.is_final(season, game)
+        self.cache.put(endpoint, season, game, team, payload, final)
 
     # TODO points endpoint
     # https://live.euroleague.net/api/Points?gamecode=329&seasoncode=E2022&disp=
 
-    def get_points(self, season, game):
+    def get_points(self, season, game, use_cache=True):
+        # live polling skips the lookup, the fresh response still replaces the cached one
+        cached = self.get_cached("Points", season, game) if use_cache else None
+        if cached is not None:
+            return cached
+
         query_url = f"{self.root_url}Points"
         params = {"gamecode": str(game),
                   "seasoncode": f'E{season}'}
 
-        try:
-            req = requests.get(query_url, params=params)
-            req.raise_for_status()
-        except requests.exceptions.HTTPError as err_h:
-            raise err_h
-        except requests.exceptions.ConnectionError as err_c:
-            raise err_c
-        except requests.exceptions.Timeout as err_t:
-            raise err_t
+        req = self.get_response(query_url, params)
 
         try:
-            return req.json()
+            points = decoding.loads(req.content)
         except json.JSONDecodeError as err:
             return -1
 
+        self.store_cached("Points", season, game, "", points)
+        return points
+
     # TODO players endpoint
     # https://live.euroleague.net/api/Players?gamecode=329&seasoncode=E2022&disp=&equipo=MCO&temp=E2022
 
     def get_players(self, season, game, team):
+        cached = self.get_cached("Players", season, game, team)
+        if cached is not None:
+            return cached
+
         query_url = f'{self.root_url}Players'
         params = {'gamecode': game,
                   'seasoncode': f'E{season}',
                   'temp': f'E{season}',
                   'equipo': team}
 
-        try:
-            req = requests.get(query_url, params=params)
-            req.raise_for_status()
-        except requests.exceptions.HTTPError as err_h:
-            raise err_h
-        except requests.exceptions.ConnectionError as err_c:
-            raise err_c
-        except requests.exceptions.Timeout as err_t:
-            raise err_t
+        req = self.get_response(query_url, params)
 
         try:
-            return req.json()
+            players = decoding.loads(req.content)
         except json.JSONDecodeError as err:
             return -1
 
+        self.store_cached("Players", season, game, team, players)
+        return players
+
     # TODO header endpoint
     # https://live.euroleague.net/api/Header?gamecode=329&seasoncode=E2022&disp=
 
     def get_header(self, season, game):
+        cached = self.get_cached("Header", season, game)
+        if cached is not None:
+            return cached
+
         query_url = f'{self.root_url}Header'
         params = {"gamecode": game,
                   "seasoncode": f'E{season}'}
 
-        try:
-            req = requests.get(query_url, params=params)
-            req.raise_for_status()
-        except requests.exceptions.HTTPError as err_h:
-            raise err_h
-        except requests.exceptions.ConnectionError as err_c:
-            raise err_c
-        except requests.exceptions.Timeout as err_t:
-            raise err_t
+        req = self.get_response(query_url, params)
 
         try:
-            return req.json()
+            header = decoding.loads(req.content)
         except json.JSONDecodeError as err:
             return -1
 
+        self.store_cached("Header", season, game, "", header, final=not header.get("Live", False))
+        return header
+
     # TODO PlayByPlay endpoint
     # https://live.euroleague.net/api/PlayByPlay?gamecode=1&seasoncode=E2022&disp=
 
-    def get_playbyplay(self, season, game):
+    def get_playbyplay(self, season, game, use_cache=True):
+        cached = self.get_cached("PlayByPlay", season, game) if use_cache else None
+        if cached is not None:
+            return cached
+
         query_url = f'{self.root_url}PlayByPlay'
         params = {"gamecode": game,
                   "seasoncode": f'E{season}'}
 
-        try:
-            req = requests.get(query_url, params=params)
-            req.raise_for_status()
-        except requests.exceptions.HTTPError as err_h:
-            raise err_h
-        except requests.exceptions.ConnectionError as err_c:
-            raise err_c
-        except requests.exceptions.Timeout as err_t:
-            raise err_t
+        req = self.get_response(query_url, params)
 
         try:
-            return req.json()
+            play_by_play = decoding.loads(req.content)
         except json.JSONDecodeError as err:
             return -1
 
+        self.store_cached("PlayByPlay", season, game, "", play_by_play)
+        return play_by_play
+
     # TODO game_stats, handle errors
 
     def get_game_stats(self, season, game):
@@ -112,56 +249,73 @@ class ELAPI:
         if header == -1:
             raise json.JSONDecodeError('Non-Existent Game', f"{season}-{game}", 1)
         else:
-            home_team = header.get("CodeTeamA")
-            away_team = header.get("CodeTeamB")
-
-            points = self.get_points(season, game)
-            home_players = self.get_players(season, game, home_team)
-            away_players = self.get_players(season, game, away_team)
-            play_by_play = self.get_playbyplay(season, game)
-
-            game_dict = {"season": season,
-                         "game_code": game,
-                         "home_team": home_team,
-                         "away_team": away_team,
-                         "points": points,
-                         "home_players": home_players,
-                         "away_players": away_players,
-                         "play_by_play": play_by_play}
+            team_codes = decoding.decode_header(header, season, game)
+            home_team = team_codes["CodeTeamA"]
+            away_team = team_codes["CodeTeamB"]
+
+            # the remaining endpoints only depend on the team codes from the header, fetch them together
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                points = executor.submit(self.get_points, season, game)
+                home_players = executor.submit(self.get_players, season, game, home_team)
+                away_players = executor.submit(self.get_players, season, game, away_team)
+                play_by_play = executor.submit(self.get_playbyplay, season, game)
+
+                game_dict = {"season": season,
+                             "game_code": game,
+                             "final": not header.get("Live", False),
+                             "home_team": home_team,
+                             "away_team": away_team,
+                             "points": points.result(),
+                             "home_players": home_players.result(),
+                             "away_players": away_players.result(),
+                             "play_by_play": play_by_play.result()}
 
             return game_dict
 
     def get_number_of_games(self, season):
+        cached = self.get_cached("games", season)
+        if cached is not None:
+            return cached
 
-        query_url = f"https://feeds.incrowdsports.com/provider/euroleague-feeds/v2/competitions/E/seasons/E{season}/games?"
+        query_url = f"{self.feeds_url}competitions/E/seasons/E{season}/games"
 
         if season == 2019:
             params = {"phaseTypeCode": "RS"}
         else:
             params = {"phaseTypeCode": "FF"}
 
-        try:
-            req = requests.get(query_url, params=params)
-            req.raise_for_status()
-        except requests.exceptions.HTTPError as err_h:
-            raise err_h
-        except requests.exceptions.ConnectionError as err_c:
-            raise err_c
-        except requests.exceptions.Timeout as err_t:
-            raise err_t
+        req = self.get_response(query_url, params)
 
         try:
-            req = req.json().get("data")
+            req = decoding.loads(req.content).get("data")
             codes_list = [x.get("code") for x in req]
+            self.store_cached("games", season, 0, "", max(codes_list), final=False)
             return max(codes_list)
         except json.JSONDecodeError:
             return -1
 
-    def get_season_stats(self, season, game=1):
+    def pin_game_count(self, season, game_count):
+        # a season whose games are all final gets no new games, its game count is cached for good from then on so a
+        # later run of the finished season is served without any request
+        if (self.cache is None) or (game_count < 1):
+            return
+
+        if all(self.cache.is_final(season, x) for x in range(1, game_count + 1)):
+            self.store_cached("games", season, 0, "", game_count, final=True)
+
+    def get_season_stats(self, season, game=1, max_workers=None, checkpoint=None):
+        max_workers = self.max_workers if max_workers is None else max_workers
+
+        if max_workers > 1:
+            return self.get_season_stats_concurrent(season, game, max_workers, checkpoint)
+
         json_error_count = 50
         game = game
         max_game_count = self.get_number_of_games(season)
         season_games_list = []
+        failed_games = []
+        missing_games = []
+        pending = []
 
         pbar = tqdm(total=max_game_count)
         pbar.set_description("Retrieving Game Data")
@@ -170,16 +324,124 @@ class ELAPI:
             try:
                 game_dict = self.get_game_stats(season, game)
                 season_games_list.append(game_dict)
+                pending = self.checkpoint_games(checkpoint, pending + [game_dict])
             except json.JSONDecodeError:
                 json_error_count = json_error_count - 1
-            except:
-                e = sys.exc_info()[0]
-                with open("crash_dump.json", "w") as file:
-                    json.dump(season_games_list, file)
-
-                print('Unhandled Exception: ', e, "game: ", game, " season: ", season, " .json file saved")
+            except requests.exceptions.RequestException as err:
+                if is_missing(err):
+                    json_error_count = json_error_count - 1
+                    missing_games.append(game)
+                else:
+                    failed_games.append(game)
 
             game = game + 1
             pbar.update(1)
         pbar.close()
+
+        self.checkpoint_games(checkpoint, pending, force=True)
+        self.report_missing(season, missing_games)
+        season_games_list = season_games_list + self.retry_or_dump(season, season_games_list, failed_games, checkpoint)
+        self.pin_game_count(season, max_game_count)
+        self.report_cache()
+        return sorted(season_games_list, key=lambda x: x["game_code"])
+
+    def get_season_stats_concurrent(self, season, game=1, max_workers=8, checkpoint=None):
+        max_game_count = self.get_number_of_games(season)
+        season_games_list = self.get_games_stats(season, list(range(game, max_game_count + 1)), max_workers,
+                                                 checkpoint)
+        self.pin_game_count(season, max_game_count)
         return season_games_list
+
+    def get_games_stats(self, season, game_codes, max_workers=8, checkpoint=None):
+        season_games_dict = {}
+        failed_games = []
+        missing_games = []
+        pending = []
+
+        pbar = tqdm(total=len(game_codes))
+        pbar.set_description("Retrieving Game Data")
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self.get_game_stats, season, x): x for x in game_codes}
+
+            for future in as_completed(futures):
+                game_code = futures[future]
+                try:
+                    season_games_dict[game_code] = future.result()
+                    pending = self.checkpoint_games(checkpoint, pending + [season_games_dict[game_code]])
+                except json.JSONDecodeError:
+                    pass
+                except requests.exceptions.RequestException as err:
+                    (missing_games if is_missing(err) else failed_games).append(game_code)
+
+                pbar.update(1)
+        pbar.close()
+
+        self.checkpoint_games(checkpoint, pending, force=True)
+        self.report_missing(season, sorted(missing_games))
+
+        # keep the game code order of the serial download
+        season_games_list = [season_games_dict[x] for x in sorted(season_games_dict)]
+        season_games_list = season_games_list + self.retry_or_dump(season, season_games_list, sorted(failed_games),
+                                                                   checkpoint)
+        self.report_cache()
+        return sorted(season_games_list, key=lambda x: x["game_code"])
+
+    def checkpoint_games(self, checkpoint, pending, force=False):
+        # hands every retrieved game to the checkpoint exactly once, in batches of checkpoint_every
+        if checkpoint is None:
+            return []
+
+        if (len(pending) >= self.checkpoint_every) | (force & (len(pending) > 0)):
+            checkpoint(pending)
+            return []
+
+        return pending
+
+    def report_cache(self):
+        if self.cache is None:
+            return
+
+        self.cache.report()
+        self.cache.prune()
+
+    @staticmethod
+    def report_missing(season, missing_games):
+        if len(missing_games) > 0:
+            print("Missing games: ", missing_games, " season: ", season)
+
+    def retry_or_dump(self, season, season_games_list, failed_games, checkpoint=None):
+        # without a checkpoint nothing retrieved so far is on disk, it is saved before the season is given up on
+        try:
+            return self.retry_failed_games(season, failed_games, checkpoint)
+        except IncompleteSeasonError:
+            if checkpoint is None:
+                with open("crash_dump.json", "wb") as file:
+                    file.write(decoding.dumps(season_games_list))
+                print("Retrieved games of season ", season, " saved to crash_dump.json")
+            raise
+
+    def retry_failed_games(self, season, failed_games, checkpoint=None):
+        # games that exhausted their retries get one more serial pass, the season is never returned with holes,
+        # games the api answers with a 4xx other than 429 are left out
+        recovered = []
+        still_failing = []
+        missing_games = []
+
+        for game in failed_games:
+            try:
+                recovered.append(self.get_game_stats(season, game))
+            except json.JSONDecodeError:
+                pass
+            except requests.exceptions.RequestException as err:
+                (missing_games if is_missing(err) else still_failing).append(game)
+
+        self.checkpoint_games(checkpoint, recovered, force=True)
+        self.report_missing(season, missing_games)
+
+        if len(still_failing) > 0:
+            # everything retrieved so far went through the checkpoint, a later sync only fetches the missing games
+            print("Failed games: ", still_failing, " season: ", season)
+            raise IncompleteSeasonError(season, still_failing)
+
+        return recovered
@@ -0,0 +1,83 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from el_api_wrapper import ELAPI
+from processing import decoding
+from processing.live_game import LiveGame, starting_lineup
+
+
+class LivePoller:
+    # polls the PlayByPlay and Points endpoints of games in progress and feeds only the new plays to each LiveGame
+
+    def __init__(self, el, season, game_codes, interval=30):
+        self.el = el
+        self.season = season
+        self.game_codes = game_codes
+        self.interval = interval
+        self.games = {}
+
+    def start_game(self, game_code):
+        header = decoding.decode_header(self.el.get_header(self.season, game_code), self.season, game_code)
+        home_team = header["CodeTeamA"]
+        away_team = header["CodeTeamB"]
+
+        home_players = decoding.decode_players(self.el.get_players(self.season, game_code, home_team), self.season,
+                                               game_code)
+        away_players = decoding.decode_players(self.el.get_players(self.season, game_code, away_team), self.season,
+                                               game_code)
+        player_names = {x.replace(" ", ""): y.title() for x, y in zip(home_players["ac"] + away_players["ac"],
+                                                                       home_players["na"] + away_players["na"])}
+
+        return LiveGame(self.season, game_code, home_team, away_team, starting_lineup(home_players),
+                        starting_lineup(away_players), player_names)
+
+    def poll_game(self, game_code):
+        if game_code not in self.games:
+            self.games[game_code] = self.start_game(game_code)
+
+        play_by_play = self.el.get_playbyplay(self.season, game_code, use_cache=False)
+        points = self.el.get_points(self.season, game_code, use_cache=False)
+        return self.games[game_code].update(play_by_play, points)
+
+    def poll_once(self):
+        # returns the number of new plays per game, games that already ended are not polled again
+        game_codes = [x for x in self.game_codes if (x not in self.games) or not self.games[x].final]
+
+        with ThreadPoolExecutor(max_workers=max(1, len(game_codes))) as executor:
+            return dict(zip(game_codes, executor.map(self.poll_game, game_codes)))
+
+    def run(self):
+        while True:
+            new_plays = self.poll_once()
+
+            for game_code, count in new_plays.items():
+                game = self.games[game_code]
+                home_pts, away_pts = game.score()
+                status = "final" if game.final else f"{game.time // 60}:{game.time % 60:02d}"
+                print(f"{self.season}-{game_code} {game.home_team} {home_pts}-{away_pts} {game.away_team} ({status}), "
+                      f"{count} new plays")
+
+            if all(x.final for x in self.games.values()):
+                return self.games
+
+            time.sleep(self.interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("season", type=int)
+    parser.add_argument("games", help="game codes to follow", type=int, nargs="+")
+    parser.add_argument("--interval", help="seconds between polls", type=float, default=30)
+    parser.add_argument("--retries", help="retries per request on 5xx responses and timeouts", type=int, default=5)
+    parser.add_argument("--api-url", help="base url of the live api, e.g. a local replay_server", default=None)
+    parser.add_argument("--feeds-url", help="base url of the games feed, e.g. a local replay_server", default=None)
+    args = parser.parse_args()
+
+    el = ELAPI(max_workers=len(args.games), max_retries=args.retries, root_url=args.api_url,
+               feeds_url=args.feeds_url)
+    games = LivePoller(el, args.season, args.games, args.interval).run()
+
+    for game in games.values():
+        print(game.box_score()[["playerName", "CODETEAM", "duration", "pts", "REB", "AS", "PIR",
+                                "plus_minus"]].to_string(index=False))
@@ -0,0 +1,416 @@
+import json
+import multiprocessing
+import resource
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from itertools import islice
+
+import requests
+from tqdm.auto import tqdm
+
+from career_store import CareerStore
+from el_api_wrapper import IncompleteSeasonError, is_missing
+from processing.db_connection import MongoConnectionSeason
+from processing.decoding import decode_game
+from processing.game_data import GameData, SeasonData, process_game
+from processing.season_batch import SeasonBatch
+from processing.sketches import DEFAULT_K, k_for_error
+from season_store import SeasonStore, games_to_sync
+
+
+# bumped whenever processing changes what a saved season state holds, older states are rebuilt from the games
+STATE_VERSION = 3
+
+
+def parse_seasons(value):
+    # "2022" or an inclusive range "2016-2025"
+    if "-" in value:
+        first, last = value.split("-")
+        return list(range(int(first), int(last) + 1))
+    return [int(value)]
+
+
+def process_games_streaming(season_instance, game_list):
+    # games are decoded and processed one at a time, only their output frames are kept and everything else is
+    # released before the next game is read
+    pbar = tqdm()
+    pbar.set_description(f"Processing Game Data {season_instance.season}:")
+    for x in game_list:
+        season_instance.add_game(process_game(x))
+        pbar.update(1)
+    pbar.close()
+
+
+def process_game_chunk(game_list):
+    # runs in a worker process, also returns the peak memory of the worker while processing the chunk
+    reset_peak_memory()
+    return [process_game(x) for x in game_list], peak_memory()
+
+
+def process_games_parallel(season_instance, game_list, executor, chunksize=4, max_chunks=8):
+    # raw games are decoded and processed in the worker processes, only the frames SeasonData needs come back,
+    # games are read from game_list as chunks are handed out so at most max_chunks chunks of raw games are held,
+    # returns the highest peak memory of a worker in MB
+    pbar = tqdm()
+    pbar.set_description(f"Processing Game Data {season_instance.season}:")
+    season_instance.game_list = []
+    worker_peak = 0.0
+
+    def collect(future):
+        nonlocal worker_peak
+        outputs, chunk_peak = future.result()
+        worker_peak = max(worker_peak, chunk_peak)
+        for x in outputs:
+            season_instance.add_game(x)
+            pbar.update(1)
+
+    pending = deque()
+    game_list = iter(game_list)
+    chunk = list(islice(game_list, chunksize))
+    while len(chunk) > 0:
+        pending.append(executor.submit(process_game_chunk, chunk))
+        if len(pending) >= max_chunks:
+            collect(pending.popleft())
+        chunk = list(islice(game_list, chunksize))
+
+    while len(pending) > 0:
+        collect(pending.popleft())
+    pbar.close()
+    return worker_peak
+
+
+def process_games_batched(season_instance, game_list):
+    # only the stints are found game by game, the rest runs once over the stacked season and fills the frames
+    # concatenate_season would build, returns the number of games
+    batch = SeasonBatch(season_instance.season)
+
+    pbar = tqdm()
+    pbar.set_description(f"Processing Game Data {season_instance.season}:")
+    for x in game_list:
+        batch.add_game(GameData(**decode_game(x)))
+        pbar.update(1)
+    pbar.close()
+
+    batch.process()
+    season_instance.player_data = batch.player_data
+    season_instance.lineup_data = batch.lineup_data
+    season_instance.team_data = batch.team_data
+    season_instance.points_data = batch.points_data
+    season_instance.assists_data = batch.assists_data
+    return batch.game_count
+
+
+def concatenate_season(season_instance):
+    season_instance.concatenate_lineup_data()
+    season_instance.concatenate_team_data()
+    season_instance.concatenate_player_data()
+    season_instance.concatenate_points_data()
+    season_instance.concatenate_assists_data()
+
+
+def reset_peak_memory():
+    # linux resets the peak resident memory of a process (VmHWM) when 5 is written to its clear_refs
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+    except OSError:
+        pass
+
+
+def peak_memory():
+    # peak resident memory of this process since reset_peak_memory in MB, without /proc it is the peak since the
+    # process started, ru_maxrss is in kilobytes on linux
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def aggregate_season(season_instance):
+    season_instance.aggregate_lineup_data()
+    season_instance.aggregate_team_data()
+    season_instance.aggregate_player_data()
+    season_instance.sketch_game_data(season_instance.player_data, season_instance.team_data, reset=True)
+
+    finish_season(season_instance)
+
+
+def update_season(season_instance, game_list):
+    # folds new or re-downloaded games into an aggregated season, the sums are only updated for the players,
+    # lineups and teams of those games, returns the number of games
+    new_games = SeasonData(season_instance.season)
+    process_games_streaming(new_games, game_list)
+    season_instance.apply_games(new_games.game_list)
+
+    finish_season(season_instance)
+    return len(new_games.game_list)
+
+
+def save_state(store, season_instance):
+    store.write_state({"version": STATE_VERSION, "revisions": store.game_revisions(), "season": season_instance})
+
+
+def sync_season(store, sketch_k=DEFAULT_K):
+    # the saved state of the season with the games written to the store since it was saved folded in, returns the
+    # season and the number of games processed, or None when the season has to be built from all of its games
+    state = store.read_state()
+    if (state is None) or (state["version"] != STATE_VERSION) or (state["season"].sketch_k != sketch_k):
+        return None, 0
+
+    season_instance = state["season"]
+    changed = [x for x, y in store.game_revisions().items() if state["revisions"].get(x) != y]
+    if len(changed) == 0:
+        return season_instance, 0
+    return season_instance, update_season(season_instance, store.iter_games(changed))
+
+
+def finish_season(season_instance):
+    # league constants, quantiles and ranks depend on every game of the season
+    season_instance.concatenate_quantile_data()
+    season_instance.aggregate_quantile_data()
+
+    season_instance.calculate_per_game_based()
+    season_instance.calculate_per_season_based()
+    season_instance.get_percentile_ranks()
+    season_instance.update_leaderboards()
+
+
+def store_season(season_instance, client=None, batch_size=1000):
+    conn = MongoConnectionSeason(season_instance, client, batch_size)
+    return conn.insert_season()
+
+
+class SeasonProgress:
+
+    def __init__(self, season):
+        self.season = season
+        self.game_count = 0
+        self.to_fetch = 0
+        self.fetched = 0
+        self.pending_codes = set()
+        self.failed_games = []
+        self.missing_games = []
+        self.pending_games = []
+        self.error = None
+
+        self.fetch_start = None
+        self.fetch_end = None
+        self.fetch_time = 0.0
+        self.process_time = 0.0
+        self.store_time = 0.0
+        self.stored = {}
+        self.processed_games = 0
+        # peak resident memory while the season was processed, of the main process (which also runs the store
+        # thread) and of the busiest worker process
+        self.peak_memory = 0.0
+        self.worker_peak_memory = 0.0
+
+    def mark_fetched(self, future=None):
+        # runs on the download threads, keeps the download time independent of when the main thread gets to it
+        self.fetch_end = time.time()
+
+    def summary(self):
+        fetch_rate = self.fetched / self.fetch_time if self.fetch_time > 0 else 0
+        process_rate = self.processed_games / self.process_time if self.process_time > 0 else 0
+        status = "failed" if self.error is not None else "ok"
+
+        memory = f"peak memory {self.peak_memory:.0f}MB"
+        if self.worker_peak_memory > 0:
+            memory += f" main process, {self.worker_peak_memory:.0f}MB per worker"
+
+        # one line per collection under the season line
+        stored = "".join(f"\n  {x}: {y} documents in {z:.1f}s ({y / z if z > 0 else 0:.0f} documents/s)"
+                         for x, (y, z) in self.stored.items())
+
+        return (f"{self.season}: {status}, {self.fetched}/{self.to_fetch} games fetched in {self.fetch_time:.1f}s "
+                f"({fetch_rate:.2f} games/s), {self.processed_games} processed in {self.process_time:.1f}s "
+                f"({process_rate:.2f} games/s), stored in {self.store_time:.1f}s, {memory}{stored}")
+
+
+class BatchRunner:
+    # downloads every season through one worker pool and processes each season as soon as its games are in,
+    # storing runs on its own thread so the next season is processed meanwhile
+
+    def __init__(self, el, seasons, mode="load", workers=1, client=None, store=True, processes=1, chunksize=4,
+                 batched=False, sketch_error=None, store_batch_size=1000):
+        self.el = el
+        self.seasons = seasons
+        self.mode = mode
+        self.workers = workers
+        self.client = client
+        self.store = store
+        self.store_batch_size = store_batch_size
+        self.processes = processes
+        self.chunksize = chunksize
+        self.batched = batched
+        self.sketch_k = DEFAULT_K if sketch_error is None else k_for_error(sketch_error)
+        self.process_executor = None
+
+        self.stores = {x: SeasonStore(x) for x in seasons}
+        self.career = CareerStore()
+        self.progress = {x: SeasonProgress(x) for x in seasons}
+
+    def resolve_game_counts(self):
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(self.seasons))) as executor:
+            counts = dict(zip(self.seasons, executor.map(self.el.get_number_of_games, self.seasons)))
+
+        for season, count in counts.items():
+            self.progress[season].game_count = count
+            print(f"season {season}: {count} games, {len(self.stores[season])} stored")
+
+        return counts
+
+    def games_to_fetch(self, season, game_count):
+        if self.mode == "download":
+            return list(range(1, game_count + 1))
+        return games_to_sync(self.stores[season].stored_games(), game_count)
+
+    def checkpoint(self, progress, force=False):
+        progress.pending_games = self.el.checkpoint_games(self.stores[progress.season].write_games,
+                                                          progress.pending_games, force)
+
+    def finish_download(self, progress):
+        self.checkpoint(progress, force=True)
+        self.el.report_missing(progress.season, sorted(progress.missing_games))
+
+        if len(progress.failed_games) > 0:
+            try:
+                recovered = self.el.retry_failed_games(progress.season, sorted(progress.failed_games),
+                                                       self.stores[progress.season].write_games)
+                progress.fetched += len(recovered)
+            except IncompleteSeasonError as err:
+                progress.error = err
+            progress.mark_fetched()
+
+        if progress.error is None:
+            self.el.pin_game_count(progress.season, progress.game_count)
+
+        fetch_end = progress.fetch_end if progress.fetch_end is not None else progress.fetch_start
+        progress.fetch_time = fetch_end - progress.fetch_start
+
+    def run(self):
+        store_executor = ThreadPoolExecutor(max_workers=1)
+        store_futures = []
+        if (self.processes > 1) and not self.batched:
+            # the download and store threads are running by the time workers start, a forked worker could inherit a
+            # lock one of them holds, spawned workers start from a fresh interpreter
+            self.process_executor = ProcessPoolExecutor(max_workers=self.processes,
+                                                        mp_context=multiprocessing.get_context("spawn"))
+
+        try:
+            if self.mode == "load":
+                for season in self.seasons:
+                    self.process(season, store_executor, store_futures)
+            else:
+                self.fetch_and_process(store_executor, store_futures)
+        finally:
+            if self.process_executor is not None:
+                self.process_executor.shutdown()
+
+        for future in store_futures:
+            future.result()
+        store_executor.shutdown()
+
+        self.el.report_cache()
+        for season in self.seasons:
+            print(self.progress[season].summary())
+
+        errors = [self.progress[x].error for x in self.seasons if self.progress[x].error is not None]
+        if len(errors) > 0:
+            raise errors[0]
+
+    def fetch_and_process(self, store_executor, store_futures):
+        counts = self.resolve_game_counts()
+
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        futures = {}
+        for season in self.seasons:
+            progress = self.progress[season]
+            codes = self.games_to_fetch(season, counts[season])
+            progress.to_fetch = len(codes)
+            progress.pending_codes = set(codes)
+            progress.fetch_start = time.time()
+
+            for x in codes:
+                future = executor.submit(self.el.get_game_stats, season, x)
+                future.add_done_callback(progress.mark_fetched)
+                futures[future] = (season, x)
+
+        # seasons with nothing left to fetch can be processed right away
+        ready = [x for x in self.seasons if len(self.progress[x].pending_codes) == 0]
+        for season in ready:
+            self.finish_download(self.progress[season])
+            self.process(season, store_executor, store_futures)
+
+        pbar = tqdm(total=len(futures))
+        pbar.set_description("Retrieving Game Data")
+
+        for future in as_completed(futures):
+            season, game_code = futures[future]
+            progress = self.progress[season]
+
+            try:
+                progress.pending_games.append(future.result())
+                progress.fetched += 1
+                self.checkpoint(progress)
+            except json.JSONDecodeError:
+                pass
+            except requests.exceptions.RequestException as err:
+                (progress.missing_games if is_missing(err) else progress.failed_games).append(game_code)
+
+            progress.pending_codes.discard(game_code)
+            pbar.update(1)
+
+            if len(progress.pending_codes) == 0:
+                self.finish_download(progress)
+                pbar.write(f"season {season}: {progress.fetched} games retrieved in {progress.fetch_time:.1f}s")
+                self.process(season, store_executor, store_futures)
+
+        pbar.close()
+        executor.shutdown()
+
+    def process(self, season, store_executor, store_futures):
+        progress = self.progress[season]
+        if progress.error is not None:
+            return
+
+        start = time.time()
+        reset_peak_memory()
+        season_instance = None
+        if self.mode == "sync":
+            season_instance, progress.processed_games = sync_season(self.stores[season], self.sketch_k)
+        if season_instance is None:
+            season_instance = self.build_season(season, progress)
+        save_state(self.stores[season], season_instance)
+        self.career.write_season(season_instance)
+        progress.process_time = time.time() - start
+        progress.peak_memory = peak_memory()
+
+        if self.store:
+            store_futures.append(store_executor.submit(self.store_season, season_instance, progress))
+
+    def build_season(self, season, progress):
+        season_instance = SeasonData(season, self.sketch_k)
+        if self.batched:
+            progress.processed_games = process_games_batched(season_instance, self.stores[season].iter_games())
+        else:
+            if self.process_executor is not None:
+                progress.worker_peak_memory = process_games_parallel(
+                    season_instance, self.stores[season].iter_games(), self.process_executor, self.chunksize,
+                    2 * self.processes)
+            else:
+                process_games_streaming(season_instance, self.stores[season].iter_games())
+            concatenate_season(season_instance)
+            progress.processed_games = season_instance.release_games()
+        aggregate_season(season_instance)
+        return season_instance
+
+    def store_season(self, season_instance, progress):
+        start = time.time()
+        progress.stored = store_season(season_instance, self.client, self.store_batch_size)
+        progress.store_time = time.time() - start
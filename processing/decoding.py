@@ -0,0 +1,133 @@
+import orjson
+
+NoneType = type(None)
+
+
+class GameDecodeError(ValueError):
+
+    def __init__(self, season, game_code, endpoint, detail):
+        self.season = season
+        self.game_code = game_code
+        self.endpoint = endpoint
+        super().__init__(f"game {season}-{game_code}, {endpoint}: {detail}")
+
+
+class Schema:
+    # field name -> accepted python types of a single row, rows are decoded into one list per field
+
+    def __init__(self, endpoint, fields):
+        self.endpoint = endpoint
+        self.fields = fields
+
+    def decode_rows(self, rows, season, game_code):
+        if not isinstance(rows, list):
+            raise GameDecodeError(season, game_code, self.endpoint,
+                                  f"expected a list of rows, got {type(rows).__name__}")
+
+        columns = {}
+        for field, types in self.fields.items():
+            try:
+                column = [x[field] for x in rows]
+            except KeyError:
+                raise GameDecodeError(season, game_code, self.endpoint, f"missing field {field}") from None
+            except TypeError:
+                raise GameDecodeError(season, game_code, self.endpoint, "rows are not objects") from None
+
+            for idx, value in enumerate(column):
+                if not isinstance(value, types):
+                    raise GameDecodeError(season, game_code, self.endpoint,
+                                          f"row {idx} field {field} is {type(value).__name__}")
+
+            columns[field] = column
+
+        return columns
+
+
+HEADER_SCHEMA = Schema("Header", {"CodeTeamA": (str,),
+                                  "CodeTeamB": (str,)})
+
+POINTS_SCHEMA = Schema("Points", {"TEAM": (str,),
+                                  "ID_PLAYER": (str,),
+                                  "PLAYER": (str, NoneType),
+                                  "ID_ACTION": (str,),
+                                  "COORD_X": (int, float),
+                                  "COORD_Y": (int, float),
+                                  "ZONE": (str, NoneType)})
+
+PLAYERS_SCHEMA = Schema("Players", {"ac": (str,),
+                                    "na": (str,),
+                                    "st": (int,),
+                                    "sl": (int,),
+                                    "nn": (int,),
+                                    "p": (str, NoneType),
+                                    "im": (str, NoneType)})
+
+PLAY_BY_PLAY_SCHEMA = Schema("PlayByPlay", {"CODETEAM": (str,),
+                                            "PLAYER_ID": (str, NoneType),
+                                            "PLAYTYPE": (str,),
+                                            "PLAYER": (str, NoneType),
+                                            "MARKERTIME": (str,),
+                                            "MINUTE": (int, float)})
+
+
+def loads(data):
+    return orjson.loads(data)
+
+
+def dumps(obj):
+    return orjson.dumps(obj)
+
+
+def decode_header(header, season, game_code):
+    if not isinstance(header, dict):
+        raise GameDecodeError(season, game_code, "Header", f"expected an object, got {type(header).__name__}")
+
+    return {key: val[0] for key, val in HEADER_SCHEMA.decode_rows([header], season, game_code).items()}
+
+
+def decode_points(points, season, game_code):
+    if not isinstance(points, dict):
+        raise GameDecodeError(season, game_code, "Points", f"expected an object, got {type(points).__name__}")
+
+    rows = points.get("Rows")
+    return POINTS_SCHEMA.decode_rows([] if rows is None else rows, season, game_code)
+
+
+def decode_players(players, season, game_code):
+    return PLAYERS_SCHEMA.decode_rows(players, season, game_code)
+
+
+def play_by_play_rows(play_by_play, season, game_code):
+    if not isinstance(play_by_play, dict):
+        raise GameDecodeError(season, game_code, "PlayByPlay", f"expected an object, got {type(play_by_play).__name__}")
+
+    # every list valued key is a period, periods are kept in payload order
+    return [x for val in play_by_play.values() if type(val) == list for x in val]
+
+
+def decode_play_by_play(play_by_play, season, game_code):
+    rows = play_by_play_rows(play_by_play, season, game_code)
+    if len(rows) == 0:
+        raise GameDecodeError(season, game_code, "PlayByPlay", "no plays")
+
+    return PLAY_BY_PLAY_SCHEMA.decode_rows(rows, season, game_code)
+
+
+def decode_game(game_dict):
+    # returns the GameData fields with every payload validated and turned into columns
+    season = game_dict.get("season")
+    game_code = game_dict.get("game_code")
+
+    for key in ["season", "game_code", "home_team", "away_team", "points", "home_players", "away_players",
+                "play_by_play"]:
+        if key not in game_dict:
+            raise GameDecodeError(season, game_code, "game", f"missing {key}")
+
+    return {"season": season,
+            "game_code": game_code,
+            "home_team": game_dict["home_team"],
+            "away_team": game_dict["away_team"],
+            "points": decode_points(game_dict["points"], season, game_code),
+            "home_players": decode_players(game_dict["home_players"], season, game_code),
+            "away_players": decode_players(game_dict["away_players"], season, game_code),
+            "play_by_play": decode_play_by_play(game_dict["play_by_play"], season, game_code)}
@@ -1,10 +1,29 @@
 from dataclasses import dataclass
 from dataclasses_json import dataclass_json
 from processing.processing_functions import make_pbp_df, make_players_df, make_points_df
+from processing.decoding import decode_game
+from processing.leaderboards import LeaderboardIndex
+from processing.lineups import Stints, find_stints, lineup_membership, membership_totals
+from processing.play_flags import (BOX_STAT_KEYS, EXTRA_KEYS, REPLACE_DICT, decode_flags, get_flag, playtype_flags,
+                                   set_flag)
+from processing.sketches import DEFAULT_K, QuantileSketch
 import re
 import pandas as pd
 import numpy as np
 
+PLAYER_KEYS = ["PLAYER_ID", "playerName", "CODETEAM", "p", "im"]
+TEAM_KEYS = ["CODETEAM", "team_name"]
+
+# per game ratios that are summed over the season, besides the player _ratio columns, any of them can be inf
+PLAYER_RATIO_COLUMNS = ["DREBR", "OREBR", "usage", "on_ORtg", "off_ORtg", "on_DRtg", "off_DRtg", "eFG", "ORtg"]
+TEAM_RATIO_COLUMNS = ["2FGR", "3FGR", "FTR", "DRBEBR", "ORBEBR", "PPP", "TOR", "FT_four"]
+
+# rank columns and the metrics get_percentile_ranks reads them off, the sketches also serve percentiles of any value
+PLAYER_RANK_COLUMNS = {"PIR_rank": "PIR_avg", "PPG_rank": "pts_avg", "PER_rank": "PER_season", "EFG_rank": "eFG",
+                       "MPG_rank": "duration_avg", "USG_rank": "usage"}
+PLAYER_RANK_METRICS = list(PLAYER_RANK_COLUMNS.values())
+TEAM_RANK_METRICS = ["ORtg", "DRtg", "FG", "pace", "2FGR", "3FGR", "TOR", "AS_avg", "DREBR", "OREBR", "FT_four"]
+
 
 @dataclass_json
 @dataclass
@@ -14,26 +33,33 @@ class GameData:
     home_team: str
     away_team: str
     points: dict
-    home_players: list
-    away_players: list
+    home_players: dict
+    away_players: dict
     play_by_play: dict
 
     def __post_init__(self):
 
         self.play_by_play = make_pbp_df(self.play_by_play)
-        self.play_by_play.loc[[0, self.play_by_play.shape[0] - 1], "CODETEAM"] = f"{self.home_team}-{self.away_team}"
+        code_team = self.play_by_play["CODETEAM"].cat.add_categories(f"{self.home_team}-{self.away_team}")
+        code_team.iloc[[0, -1]] = f"{self.home_team}-{self.away_team}"
+        self.play_by_play["CODETEAM"] = code_team
 
         self.home_players = make_players_df(self.home_players)
         self.away_players = make_players_df(self.away_players)
 
         self.points = make_points_df(self.points)
 
+        self.pbp_team_rows = None
+
         self.pbp_processed_home: pd.DataFrame
         self.pbp_processed_away: pd.DataFrame
 
         self.lineups_home: pd.DataFrame
         self.lineups_away: pd.DataFrame
 
+        self.stints_home: Stints
+        self.stints_away: Stints
+
         self.home_players_processed: pd.DataFrame
         self.away_players_processed: pd.DataFrame
 
@@ -43,23 +69,29 @@ class GameData:
         self.team_stats: pd.DataFrame
         self.home_team_name, self.away_team_name = self.get_team_names()
 
-    def get_pbp(self, home=True):
-        team = self.home_team if home else self.away_team
-        self.play_by_play = self.play_by_play.groupby("time").apply(lambda x: x.sort_values("PLAYTYPE")).reset_index(
-            drop=True)
+    def normalize_pbp(self):
+        # one stable sort by time and PLAYTYPE, the end of game row moved last and the rows of each team indexed,
+        # both team views are then plain slices
+        pbp = self.play_by_play.sort_values(["time", "PLAYTYPE"], kind="stable").reset_index(drop=True)
 
-        def swap_rows(df, row1, row2):
-            df.iloc[row1, :], df.iloc[row2, :] = df.iloc[row2, :].copy(), df.iloc[row1, :].copy()
-            return df
+        order = np.arange(pbp.shape[0])
+        end_game = np.flatnonzero(pbp["PLAYTYPE"].to_numpy() == "EG")
+        if (len(end_game) > 0) and (pbp["PLAYTYPE"].iloc[-1] != "EG"):
+            order[[end_game[0], -1]] = order[[-1, end_game[0]]]
+            pbp = pbp.iloc[order].reset_index(drop=True)
 
-        end_game_check = self.play_by_play.iloc[-1]["PLAYTYPE"] == "EG"
-        if end_game_check is False:
-            idx = self.play_by_play.index.values[self.play_by_play['PLAYTYPE'] == "EG"][0]
-            self.play_by_play = swap_rows(self.play_by_play, -1, idx).reset_index(drop=True)
-            pass
+        # the first and last rows carry both team codes and belong to both teams
+        team_codes = pbp["CODETEAM"].unique()
+        self.pbp_team_rows = {x: np.flatnonzero(pbp["CODETEAM"].isin([y for y in team_codes if x in y]).to_numpy())
+                              for x in [self.home_team, self.away_team]}
+        self.play_by_play = pbp
 
-        check_team = self.play_by_play["CODETEAM"].str.contains(team).tolist()
-        return self.play_by_play.loc[check_team, :].reset_index().rename(
+    def get_pbp(self, home=True):
+        if self.pbp_team_rows is None:
+            self.normalize_pbp()
+
+        team = self.home_team if home else self.away_team
+        return self.play_by_play.iloc[self.pbp_team_rows[team]].reset_index().rename(
             columns={"index": "index_pbp"})
 
     def get_points_data(self):
@@ -114,116 +146,18 @@ class GameData:
     def get_lineups(self, home=True):
         pbp = self.get_pbp(home)
 
-        ins_and_outs = pbp.loc[pbp["playerIn"] | pbp["playerOut"], :]
-
-        inc_player = ins_and_outs.loc[ins_and_outs["playerIn"], ["PLAYER_ID", "time"]].reset_index().rename(
-            columns={"index": "index_inc",
-                     "PLAYER_ID": "PLAYER_ID_IN"})
-        out_player = ins_and_outs.loc[ins_and_outs["playerOut"], ["PLAYER_ID", "time"]].reset_index().rename(
-            columns={"index": "index_out",
-                     "PLAYER_ID": "PLAYER_ID_OUT"})
-
-        inc_player = inc_player.groupby('time').agg(
-            {"PLAYER_ID_IN": lambda x: list(x), "index_inc": lambda x: list(x)}).reset_index()
-        out_player = out_player.groupby('time').agg(
-            {"PLAYER_ID_OUT": lambda x: list(x), "index_out": lambda x: list(x)}).reset_index()
-
-        subs_df = pd.concat([inc_player, out_player], axis=1).copy()
-
-        def length_finder(x):
-            if type(x) == list:
-                return len(x)
-            elif x is None:
-                return 0
-            elif x is np.nan:
-                return 0
-            else:
-                return 1
-
-        subs_df_check = [length_finder(x) == length_finder(y) for x, y in zip(
-            subs_df["PLAYER_ID_OUT"], subs_df["PLAYER_ID_IN"])]
-
-        if all(subs_df_check) is False:
-            subs_df_test = subs_df.loc[~pd.Series(subs_df_check), :]
-            in_row = subs_df_test["PLAYER_ID_IN"].explode().dropna().tolist()
-            out_row = subs_df_test["PLAYER_ID_OUT"].explode().dropna().tolist()
-
-            in_row_idx = subs_df_test["index_inc"].explode().dropna().tolist()
-            out_row_idx = subs_df_test["index_out"].explode().dropna().tolist()
-
-            idx = min(subs_df_test.loc[:, "PLAYER_ID_IN"].index)
-
-            subs_df.loc[:, "PLAYER_ID_IN"][idx] = in_row
-            subs_df.loc[:, "PLAYER_ID_OUT"][idx] = out_row
-            subs_df.loc[:, "index_inc"][idx] = in_row_idx
-            subs_df.loc[:, "index_out"][idx] = out_row_idx
+        stints = find_stints(pbp["PLAYER_ID"].to_numpy(), pbp["time"].to_numpy(), pbp["playerIn"].to_numpy(),
+                             pbp["playerOut"].to_numpy(), self.get_starting_lineup(home))
 
-            subs_df = subs_df.dropna()
-
-            pass
-
-        current_lineup = self.get_starting_lineup(home)
-        anti_zone = []
-        prev_lineup = current_lineup
-
-        def substitution(in_player, off_player):
-            nonlocal current_lineup
-            nonlocal anti_zone
-            nonlocal prev_lineup
-
-            err_count = 0
-            prev_lineup = current_lineup
-            current_lineup = [*current_lineup, *in_player]
-
-            for x in off_player:
-                try:
-                    current_lineup.remove(x)
-                    if len(anti_zone) > 0:
-                        current_lineup.remove(anti_zone.pop())
-                        prev_lineup = current_lineup
-                except ValueError:
-                    anti_zone.append(x)
-                    err_count += 1
-
-            if err_count > 0:
-                return tuple(prev_lineup)
-            else:
-                return tuple(current_lineup)
-
-        # because tuples are immutable
-        lineups = ()
-
-        for idx, tup in enumerate(zip(subs_df["PLAYER_ID_IN"], subs_df["PLAYER_ID_OUT"])):
-            try:
-                lineups = lineups + (substitution(tup[0], tup[1]),)
-            except ValueError as err:
-                pbp.to_csv("pbp.csv")
-
-        lineups = list(lineups)
-        subs_df["lineups"] = pd.Series([sorted(list(x)) for x in lineups])
-        subs_df["index_left"] = subs_df.apply(lambda x: max(max(x["index_inc"]), max(x["index_out"])), axis=1)
-        subs_df = subs_df.drop(columns=["index_inc", "index_out"])
-        subs_df["index_right"] = subs_df["index_left"].tolist()[1:] + [pbp.shape[0]]
-
-        pbp_lineups = [None] * pbp.shape[0]
-        left_right_indices = [None] * pbp.shape[0]
-        pbp_lineups[0:subs_df["index_left"][0]] = [self.get_starting_lineup()] * subs_df["index_left"][0] if home else [
-                                                                                                                           self.get_starting_lineup(
-                                                                                                                               home=False)] * \
-                                                                                                                       subs_df[
-                                                                                                                           "index_left"][
-                                                                                                                           0]
-        left_right_indices[0:subs_df["index_left"][0]] = [[0, subs_df["index_left"][0]]] * subs_df["index_left"][0]
-
-        for x, y, z in zip(subs_df["index_left"], subs_df["index_right"], subs_df["lineups"]):
-            pbp_lineups[x:y] = [z] * (y - x)
-            left_right_indices[x:y] = [[x, y]] * (y - x)
-
-        pbp["lineups"] = pbp_lineups
-        pbp["index_left"] = pd.Series([x[0] for x in left_right_indices])
-        pbp["index_right"] = pd.Series([x[1] for x in left_right_indices])
+        # the lineup of every row is kept as its stint, the players on court are in the stints' count arrays
+        pbp["stint"] = stints.row_stint
         pbp["OPP"] = self.away_team if home else self.home_team
 
+        if home:
+            self.stints_home = stints
+        else:
+            self.stints_away = stints
+
         return pbp
 
     def extract_home_away_lineups(self):
@@ -233,25 +167,12 @@ class GameData:
     def stat_calculator(self, home=True):
 
         df = self.pbp_processed_home if home else self.pbp_processed_away
-        replace_dict = {"2FGAB": "2FGA", "LAYUPATT": "2FGA", "LAYUPMD": "2FGM", "DUNK": "2FGM"}
-        df.loc[:, "PLAYTYPE"] = df["PLAYTYPE"].map(lambda rep: replace_dict.get(rep, rep))
+        df["PLAYTYPE"] = df["PLAYTYPE"].replace(REPLACE_DICT)
 
         time_comp = pd.Series([0] + df["time"].tolist()[:-1])
         df["duration"] = df["time"] - time_comp
 
-        stat_keys = ["AS", "TO", "3FGM", "2FGM", "FTM", "D", "O", "RV",
-                     "CM", "FV", "AG", "ST", "OF", "CMT", "CMU", "CMD"]
-
-        for x in stat_keys:
-            df[x] = df["PLAYTYPE"] == x
-
-        stat_composite_keys = {"3FGA": "3FGA|3FGM",
-                               "2FGA": "2FGA|2FGM",
-                               "FTA": "FTA|FTM",
-                               "REB": "D$|O$"}
-
-        for key, val in zip(stat_composite_keys, stat_composite_keys.values()):
-            df[key] = df["PLAYTYPE"].str.match(val)
+        df["flags"] = playtype_flags(df["PLAYTYPE"])
 
     def opp_stat_calculator(self, home=True):
 
@@ -259,39 +180,36 @@ class GameData:
         df_lineups["CODETEAM"] = self.home_team if home else self.away_team
         df_lineups_opp = self.pbp_processed_away if home else self.pbp_processed_home
 
-        stat_keys = ["duration", "AS", "TO", "3FGM", "3FGA", "2FGA", "2FGM",
-                     "3FGA", "FTM", "FTA", "D", "O", "REB",
-                     "RV", "CM", "FV", "AG", "ST", "OF", "CMT", "CMU", "CMD",
-                     "multi_ft", "multi_ft_count", "tech_ft", "assisted_2fg", "assisted_3fg",
-                     "assisted_ft", "and_one_2fg", "and_one_3fg", "pos"]
+        stat_keys = ["duration"] + BOX_STAT_KEYS
 
         stat_dict = {x: "sum" for x in stat_keys}
 
-        df_lineups["lineups_string"] = df_lineups["lineups"].apply(lambda x: "; ".join(x))
-
-        df = df_lineups.groupby(["lineups_string", "CODETEAM", "index_left", "index_right"]).agg(
-            stat_dict).reset_index()
-
-        df["min"] = df.apply(lambda x: df_lineups["time"][x["index_left"]], axis=1)
-        df["max"] = df.apply(lambda x: df_lineups["time"][x["index_right"] - 1], axis=1)
-        df = df.loc[df["min"] != df["max"], :]
+        stints = self.stints_home if home else self.stints_away
+        stint_strings = np.array(["; ".join(x) for x in stints.lineups()], dtype=object)
+        lineup_strings, stint_lineups = np.unique(stint_strings, return_inverse=True)
+        df_lineups["lineup_code"] = stint_lineups[df_lineups["stint"].to_numpy()]
 
-        game_epochs = sorted(pd.concat([df["min"], df["max"]]).unique().tolist())
+        time = df_lineups["time"].to_numpy()
+        game_epochs = self.game_epochs(time, stints)
 
-        df_lineups["game_epochs"] = pd.cut(df_lineups["time"], game_epochs).astype(
-            str)
-        df_lineups_opp["game_epochs"] = pd.cut(df_lineups_opp["time"], game_epochs).astype(str)
+        df_lineups["game_epochs"] = self.epoch_index(time, game_epochs)
+        df_lineups_opp["game_epochs"] = self.epoch_index(df_lineups_opp["time"].to_numpy(), game_epochs)
 
-        df = df_lineups.groupby(["game_epochs", "lineups_string", "CODETEAM", "OPP"]).agg(
-            stat_dict).reset_index()
+        df = decode_flags(df_lineups, list(stat_dict)).groupby(
+            [df_lineups[x] for x in ["game_epochs", "lineup_code", "CODETEAM", "OPP"]]).agg(stat_dict).reset_index()
+        df.insert(1, "lineups_string", lineup_strings[df.pop("lineup_code").to_numpy()])
 
-        df = df.loc[df["duration"] != 0, :]
+        df = df.loc[df["duration"] != 0, :].reset_index(drop=True)
 
-        df_opp = df_lineups_opp.groupby("game_epochs").agg(stat_dict).reset_index()
+        # opponent totals looked up by epoch position, epochs without opponent plays stay empty like a left merge
+        df_opp = decode_flags(df_lineups_opp, list(stat_dict)).groupby(df_lineups_opp["game_epochs"]).agg(stat_dict)
         rename_dict = {x: f"opp_{x}" for x in stat_keys}
-        df_opp = df_opp.rename(columns=rename_dict)
+        df_opp = df_opp.reindex(df["game_epochs"].to_numpy()).rename(columns=rename_dict).reset_index(drop=True)
 
-        df = df.merge(df_opp, how="left", on="game_epochs")
+        epoch_labels = np.append(pd.IntervalIndex.from_breaks(game_epochs).astype(str).to_numpy(dtype=object), "nan")
+        df["game_epochs"] = epoch_labels[df["game_epochs"].to_numpy()]
+
+        df = pd.concat([df, df_opp], axis=1)
         df["game_code"] = self.game_code
 
         if home:
@@ -299,169 +217,153 @@ class GameData:
         else:
             self.lineups_away = df
 
+    @staticmethod
+    def game_epochs(time, stints):
+        # every stint that covers plays and lasts bounds the game epochs, epochs are the integer positions of the
+        # (left, right] intervals between consecutive bounds, -1 outside of them, and are shared by both teams
+        stint_ids = np.unique(stints.row_stint)
+        stint_min = time[stints.index_left[stint_ids]]
+        stint_max = time[stints.index_right[stint_ids] - 1]
+        lasting = stint_min != stint_max
+        return np.unique(np.concatenate([stint_min[lasting], stint_max[lasting]]))
+
+    @staticmethod
+    def epoch_index(time, game_epochs):
+        # same buckets as pd.cut(time, game_epochs), times outside every bucket get -1
+        epochs = np.searchsorted(game_epochs, time, side="left") - 1
+        epochs[epochs >= len(game_epochs) - 1] = -1
+        return epochs
+
     def extra_stats_finder(self, home=True):
         pbp = self.pbp_processed_home if home else self.pbp_processed_away
-        pbp_sub = pbp.groupby(["time", "PLAYER_ID"]).apply(
-            lambda x: list(x["PLAYTYPE"])).reset_index().rename(columns={0: "PLAYTYPE"})
-
-        def finder(row):
-            if len(row) > 1:
-                multi_ft = sum([bool(re.match("FT", a)) for a in row]) > 1 or (
-                        (sum([bool(re.match("FT", a)) for a in row]) == 1) &
-                        any([bool(re.match("RV", a)) for a in row]) &
-                        all([not (item in row) for item in ["3FGM", "2FGM"]])
-                )
-
-                and_one_2fg = all([item in row for item in ["2FGM", "RV"]]) and (sum(
-                    [bool(re.match("FT", a)) for a in row]) == 1)
-                and_one_3fg = all([item in row for item in ["3FGM", "RV"]]) and (sum(
-                    [bool(re.match("FT", a)) for a in row]) == 1)
-                tech_ft = (sum([bool(re.match("FT", a)) for a in row]) == 1) & (
-                    all([not (item in row) for item in ["3FGM", "2FGM", "RV"]]))
-
-                return {"multi_ft": multi_ft,
-                        "and_one_2fg": and_one_2fg,
-                        "and_one_3fg": and_one_3fg,
-                        "tech_ft": tech_ft
-                        }
-
-            elif (len(row) == 1) & ((row[0] == "FTM") | (row[0] == "FTA")):
-
-                tech_dict = {"multi_ft": False,
-                             "and_one_2fg": False,
-                             "and_one_3fg": False,
-                             "tech_ft": True}
-
-                return tech_dict
+        flags, pos, assisting_player = self.extra_stats(pbp)
 
-            else:
-                return {"multi_ft": False,
-                        "and_one_2fg": False,
-                        "and_one_3fg": False,
-                        "tech_ft": False}
-
-        pbp_sub["extra_stats"] = pbp_sub["PLAYTYPE"].apply(lambda x: finder(x))
-        pbp_sub2 = pd.json_normalize(pbp_sub["extra_stats"])
-        pbp_sub3 = pbp.loc[pbp["PLAYTYPE"].isin(["2FGM", "3FGM", "AS", "FTM"]), ["PLAYER_ID", "PLAYTYPE", "time"]]
-        pbp_sub3["PLAYTYPE"] = pbp_sub3["PLAYTYPE"].replace({"2FGM": "Two",
-                                                             "3FGM": "Three",
-                                                             "FTM": "FTM",
-                                                             "AS": "AS"})
-
-        pbp_sub3 = pbp_sub3.reset_index()
-        pbp_sub3 = pbp_sub3.groupby("time").apply(lambda x: x.sort_values("PLAYTYPE", ascending=False)).reset_index(
-            drop=True)
+        pbp["assisting_player"] = assisting_player
+        pbp["flags"] = flags
+        pbp["pos"] = pos
 
-        assist_queue = []
-        idx = pbp_sub3.shape[0] - 1
-        pbp_sub3["assisting_player"] = np.nan
+        if home:
+            self.pbp_processed_home = pbp
+        else:
+            self.pbp_processed_away = pbp
+
+    @staticmethod
+    def extra_stats(pbp, frame=None):
+        # returns the flags with the free throw and assist keys set, the possessions and the assisting players, rows
+        # are only compared within the same frame column when one is given
+        playtype = pbp["PLAYTYPE"]
+        flags = pbp["flags"].to_numpy()
+        keys = ([] if frame is None else [frame]) + ["time", "PLAYER_ID"]
+
+        # free throw situations are decided per player and second, group totals of the coded play types are spread
+        # back onto every row of the group
+        codes = pd.DataFrame({"plays": 1,
+                              "ft": playtype.str.startswith("FT"),
+                              "rv_prefix": playtype.str.startswith("RV"),
+                              "rv": playtype == "RV",
+                              "fgm2": playtype == "2FGM",
+                              "fgm3": playtype == "3FGM",
+                              "single_ft": playtype.isin(["FTM", "FTA"])}).astype(int)
+        group = codes.groupby([pbp[x] for x in keys], observed=True).transform("sum")
+
+        one_ft = group["ft"] == 1
+        no_fgm = (group["fgm2"] == 0) & (group["fgm3"] == 0)
+        several = group["plays"] > 1
+
+        extra = pd.DataFrame(index=pbp.index)
+        extra["multi_ft"] = several & ((group["ft"] > 1) | (one_ft & (group["rv_prefix"] > 0) & no_fgm))
+        extra["and_one_2fg"] = several & (group["fgm2"] > 0) & (group["rv"] > 0) & one_ft
+        extra["and_one_3fg"] = several & (group["fgm3"] > 0) & (group["rv"] > 0) & one_ft
+        extra["tech_ft"] = (several & one_ft & no_fgm & (group["rv"] == 0)) | (~several & (group["single_ft"] == 1))
+
+        extra["multi_ft"] = extra["multi_ft"] & get_flag(flags, "FTA")
+        extra["multi_ft_count"] = extra["multi_ft"] & get_flag(flags, "FTA")
+
+        mask = pbp.duplicated(keys)
+        extra.loc[mask, ["and_one_2fg", "and_one_3fg", "tech_ft"]] = False
+
+        ft_mask = pd.concat([extra["multi_ft_count"]] + [pbp[x] for x in keys[:-1]], axis=1).duplicated()
+        extra.loc[ft_mask, "multi_ft"] = False
+
+        assisting_player = GameData.assist_finder(pbp, frame)
+        assisted = assisting_player.notna()
+
+        extra["assisted_2fg"] = (playtype == "2FGM") & assisted
+        extra["assisted_3fg"] = (playtype == "3FGM") & assisted
+        extra["assisted_ft"] = (playtype == "FTM") & assisted
+
+        for x in EXTRA_KEYS:
+            flags = set_flag(flags, x, extra[x].to_numpy())
+
+        pos = extra["multi_ft"].astype(int) + get_flag(flags, "2FGA").astype(int) + get_flag(
+            flags, "3FGA").astype(int) + get_flag(flags, "TO").astype(int) - get_flag(flags, "O").astype(int)
+        return flags, pos, assisting_player
+
+    @staticmethod
+    def assist_finder(pbp, frame=None):
+        # scoring plays of every second ordered made two, made three, free throw, then assists, walked from the end
+        # of the game so each assist is handed to the scoring play logged before it
+        scoring_rank = {"2FGM": 0, "3FGM": 1, "FTM": 2, "AS": 3}
+        rank = pbp["PLAYTYPE"].map(scoring_rank)
+        frames = np.zeros(pbp.shape[0], dtype=np.int64) if frame is None else pbp[frame].to_numpy()
+        rows = np.flatnonzero(rank.notna().to_numpy())
+        rows = rows[np.lexsort((rows, rank.to_numpy()[rows], pbp["time"].to_numpy()[rows], frames[rows]))]
+
+        player_ids = [None if pd.isna(x) else x for x in pbp["PLAYER_ID"].to_numpy()[rows]]
+        is_assist = (rank.to_numpy()[rows] == 3).tolist()
+        frames = frames[rows].tolist()
+        assisting_player = [np.nan] * len(rows)
 
         # due to inconsistencies in the pbp, need to make sure assists are not being assigned to the same player
         # , but it is almost impossible to get every one of them right, a very small error margin to be expected
-        while idx >= 0:
+        assist_queue = []
+        for idx in range(len(rows) - 1, -1, -1):
+            # assists left over at the start of a frame are not handed to the frame before it
+            if (idx < len(rows) - 1) and (frames[idx] != frames[idx + 1]):
+                assist_queue = []
 
-            if pbp_sub3.loc[:, "PLAYTYPE"].iloc[idx] == "AS":
-                assist_queue.append(pbp_sub3.loc[:, "PLAYER_ID"].iloc[idx])
+            if is_assist[idx]:
+                assist_queue.append(player_ids[idx])
             elif len(assist_queue) > 0:
-                if pbp_sub3.loc[idx, "PLAYER_ID"] == assist_queue[0]:
-                    pbp_sub3.loc[idx, "assisting_player"] = assist_queue.pop()
+                if player_ids[idx] == assist_queue[0]:
+                    assisting_player[idx] = assist_queue.pop()
                 else:
-                    pbp_sub3.loc[idx, "assisting_player"] = assist_queue.pop(0)
-            else:
-                pass
-
-            idx -= 1
-
-        pbp_sub3 = pbp_sub3.set_index("index")
-        sub3_index = pbp_sub3.index
-        pbp_sub3["index_to_fix"] = sub3_index
-
-        pbp_sub3 = pbp_sub3.groupby("time").apply(
-            lambda x: x.sort_values("assisting_player", ascending=False)).reset_index(
-            drop=True)
-
-        pbp_sub3 = pbp_sub3.set_index("index_to_fix")
-        pbp_sub3["assisted_2fg"] = (pbp_sub3["PLAYTYPE"] == "Two") & (~pbp_sub3["assisting_player"].isna())
-        pbp_sub3["assisted_3fg"] = (pbp_sub3["PLAYTYPE"] == "Three") & (~pbp_sub3["assisting_player"].isna())
-
-        pbp_sub3["assisted_ft"] = (pbp_sub3["PLAYTYPE"] == "FTM") & (~pbp_sub3["assisting_player"].isna())
-
-        pbp_sub = pbp_sub.drop("extra_stats", axis=1)
-        pbp_sub = pd.concat([pbp_sub, pbp_sub2], axis=1)
-        pbp_sub.loc[pbp_sub.shape[0] - 1, "check"] = ["EG"]
-        pbp_sub = pbp_sub.drop(["PLAYTYPE", "check"], axis=1)
-        mask = pbp.duplicated(["PLAYER_ID", "time"])
-
-        col_names = [str(x) for x in pbp_sub.columns]
-        pbp = pbp.merge(pbp_sub, how="left", on=["time", "PLAYER_ID"])
-        pbp["multi_ft"] = pbp["multi_ft"] & pbp["FTA"]
-        pbp["multi_ft_count"] = pbp["multi_ft"] & pbp["FTA"]
-        pbp.loc[mask, col_names[3:]] = False
-
-        ft_mask = pbp[["multi_ft_count", "time"]].duplicated()
-        pbp.loc[ft_mask, "multi_ft"] = False
+                    assisting_player[idx] = assist_queue.pop(0)
 
-        pbp["assisted_2fg"] = pbp_sub3["assisted_2fg"]
-        pbp["assisted_3fg"] = pbp_sub3["assisted_3fg"]
-        pbp["assisted_ft"] = pbp_sub3["assisted_ft"]
-
-        pbp["assisted_2fg"].fillna(False, inplace=True)
-        pbp["assisted_3fg"].fillna(False, inplace=True)
-        pbp["assisted_ft"].fillna(False, inplace=True)
-
-        pbp["assisting_player"] = pbp_sub3["assisting_player"]
-
-        if np.any(pbp["PLAYER_ID"] == pbp["assisting_player"]):
-            pass
-
-        pbp["pos"] = pbp["multi_ft"].astype(int) + pbp["2FGA"].astype(int) + pbp["3FGA"].astype(int) + pbp["TO"].astype(
-            int) - pbp["O"].astype(int)
-
-        if home:
-            self.pbp_processed_home = pbp
-        else:
-            self.pbp_processed_away = pbp
+        return pd.Series(assisting_player, index=pbp.index[rows]).reindex(pbp.index)
 
     def calculate_player_stats(self, home=True):
 
         pbp = self.pbp_processed_home if home else self.pbp_processed_away
         lineup = self.lineups_home if home else self.lineups_away
 
-        stat_keys = ["AS", "TO", "3FGM", "3FGA", "2FGA", "2FGM",
-                     "3FGA", "FTM", "FTA", "D", "O", "REB",
-                     "RV", "CM", "FV", "AG", "ST", "OF", "CMT", "CMU", "CMD",
-                     "multi_ft", "multi_ft_count", "tech_ft", "assisted_2fg", "assisted_3fg",
-                     "assisted_ft", "and_one_2fg", "and_one_3fg", "pos"]
+        stat_keys = BOX_STAT_KEYS
 
         stat_dict = {x: "sum" for x in stat_keys}
 
-        df = pbp.groupby(["PLAYER_ID", "CODETEAM", "OPP"]).agg(stat_dict).reset_index()
+        df = decode_flags(pbp, list(stat_dict)).groupby([pbp[x] for x in ["PLAYER_ID", "CODETEAM", "OPP"]],
+                                                        observed=True).agg(stat_dict).sort_index().reset_index()
+        df["PLAYER_ID"] = df["PLAYER_ID"].astype(object)
         df = df.loc[df["PLAYER_ID"] != "", :]
 
-        player_df_list = []
-        player_df_list_off = []
-        for idx, x in enumerate(df["PLAYER_ID"]):
-            dfx = lineup.loc[lineup["lineups_string"].str.contains(x), :].copy()
-            dfx_off = lineup.loc[~lineup["lineups_string"].str.contains(x), :].copy()
-
-            if dfx.shape[0] > 0:
-                dfx["PLAYER_ID"] = x
-                dfx["PLAYER_ID"] = x
-                dfx_off["PLAYER_ID"] = x
-                player_df_list.append(dfx)
-                player_df_list_off.append(dfx_off)
-
         stat_keys_extended = stat_keys + [f"opp_{x}" for x in stat_keys]
         stat_keys_extended.insert(0, "duration")
         stat_dict_extended = {x: "sum" for x in stat_keys_extended}
         stat_keys_off = stat_keys + ["opp_pos", "opp_2FGM", "opp_3FGM", "opp_FTM"]
         stat_dict_off = {x: "sum" for x in stat_keys_off}
-        player_df_list = pd.concat(player_df_list, axis=0)
-        player_df_list = player_df_list.groupby("PLAYER_ID").agg(stat_dict_extended).reset_index()
 
-        player_df_list_off = pd.concat(player_df_list_off, axis=0)
+        # on court totals of every player in one product, players never on court get neither on nor off totals and
+        # players on court for the whole game get no off totals
+        player_ids = df["PLAYER_ID"].unique()
+        membership = lineup_membership(player_ids, lineup["lineups_string"])
+        lineup_count = np.asarray(membership.sum(axis=1)).ravel()
+        on_court = lineup_count > 0
+        some_off = on_court & (lineup_count < lineup.shape[0])
 
-        player_df_list_off = player_df_list_off.groupby("PLAYER_ID").agg(stat_dict_off).reset_index()
+        player_df_list = membership_totals(membership[on_court], lineup[list(stat_dict_extended)],
+                                           player_ids[on_court])
+        player_df_list_off = membership_totals(membership[some_off], lineup[list(stat_dict_off)],
+                                               player_ids[some_off], off=True)
 
         rename_dict = {x: f"team_{x}" for x in stat_keys}
         player_df_list = player_df_list.rename(columns=rename_dict)
@@ -488,6 +390,19 @@ class GameData:
         df["game_code"] = self.game_code
         df["home"] = self.home_team == df["CODETEAM"]
         df = df.loc[df["PLAYER_ID"].str.match("^P"), :]
+        self.player_ratings(df)
+
+        ft_test = (df["multi_ft_count"] + df["and_one_2fg"] + df["tech_ft"] + df["and_one_3fg"] - df["FTA"])
+        if ~np.all(ft_test == 0):
+            pass
+
+        if home:
+            self.home_players_processed = df
+        else:
+            self.away_players_processed = df
+
+    @staticmethod
+    def player_ratings(df):
         df["DREBR"] = df["D"] / (df["team_D"] + df["opp_O"])
         df["OREBR"] = df["O"] / (df["team_O"] + df["opp_D"])
         df["usage"] = (df["multi_ft"] + df["2FGA"] + df["3FGA"] + df["TO"]) / (
@@ -559,15 +474,6 @@ class GameData:
 
         df["ORtg"] = 100 * (points_produced / ind_pos)
 
-        ft_test = (df["multi_ft_count"] + df["and_one_2fg"] + df["tech_ft"] + df["and_one_3fg"] - df["FTA"])
-        if ~np.all(ft_test == 0):
-            pass
-
-        if home:
-            self.home_players_processed = df
-        else:
-            self.away_players_processed = df
-
     def calculate_team_stats(self):
         home_stats = self.lineups_home.drop("lineups_string", axis=1).groupby(
             ["CODETEAM", "OPP"]).agg(sum).reset_index()
@@ -585,38 +491,31 @@ class GameData:
         home_stats["home"] = True
         away_stats["home"] = False
 
-        home_stats["2FGR"] = home_stats["2FGM"] / home_stats["2FGA"]
-        home_stats["3FGR"] = home_stats["3FGM"] / home_stats["3FGA"]
-        home_stats["FTR"] = home_stats["FTM"] / home_stats["FTA"]
-        home_stats["DRBEBR"] = home_stats["D"] / (home_stats["D"] + home_stats["opp_O"])
-        home_stats["ORBEBR"] = home_stats["O"] / (home_stats["O"] + home_stats["opp_D"])
-        home_stats["PPP"] = home_stats["points_scored"] / home_stats["pos"]
-        home_stats["TOR"] = home_stats["TO"] / (
-                home_stats["2FGA"] + home_stats["3FGA"] + home_stats["multi_ft"] + home_stats["TO"])
-        home_stats["FT_four"] = home_stats["FTM"] / (
-                home_stats["2FGA"] + home_stats["3FGA"])
-
+        self.team_ratios(home_stats)
         home_stats["team_name"] = self.home_team_name
 
-        away_stats["2FGR"] = away_stats["2FGM"] / away_stats["2FGA"]
-        away_stats["3FGR"] = away_stats["3FGM"] / away_stats["3FGA"]
-        away_stats["FTR"] = away_stats["FTM"] / away_stats["FTA"]
-        away_stats["DRBEBR"] = away_stats["D"] / (away_stats["D"] + away_stats["opp_O"])
-        away_stats["ORBEBR"] = away_stats["O"] / (away_stats["O"] + away_stats["opp_D"])
-        away_stats["PPP"] = away_stats["points_scored"] / away_stats["pos"]
-        away_stats["TOR"] = away_stats["TO"] / (
-                away_stats["2FGA"] + away_stats["3FGA"] + away_stats["multi_ft"] + away_stats["TO"])
-        away_stats["FT_four"] = away_stats["FTM"] / (away_stats["2FGA"] + away_stats["3FGA"])
-
+        self.team_ratios(away_stats)
         away_stats["team_name"] = self.away_team_name
 
         self.team_stats = pd.concat([home_stats, away_stats])
         self.team_stats["game_code"] = self.game_code
 
+    @staticmethod
+    def team_ratios(stats):
+        stats["2FGR"] = stats["2FGM"] / stats["2FGA"]
+        stats["3FGR"] = stats["3FGM"] / stats["3FGA"]
+        stats["FTR"] = stats["FTM"] / stats["FTA"]
+        stats["DRBEBR"] = stats["D"] / (stats["D"] + stats["opp_O"])
+        stats["ORBEBR"] = stats["O"] / (stats["O"] + stats["opp_D"])
+        stats["PPP"] = stats["points_scored"] / stats["pos"]
+        stats["TOR"] = stats["TO"] / (stats["2FGA"] + stats["3FGA"] + stats["multi_ft"] + stats["TO"])
+        stats["FT_four"] = stats["FTM"] / (stats["2FGA"] + stats["3FGA"])
+
     def get_assist_data(self, home=True):
         df = self.pbp_processed_home if home else self.pbp_processed_away
         df_assists = df.loc[
             ~df["assisting_player"].isna(), ["PLAYER_ID", "assisting_player", "CODETEAM", "PLAYTYPE", "time"]]
+        df_assists = df_assists.astype({"PLAYER_ID": object, "PLAYTYPE": object})
         df_assists["OPP"] = self.away_team if home else self.home_team
         df_assists["game_code"] = self.game_code
         df_assists["season"] = self.season
@@ -638,8 +537,8 @@ class GameData:
         self.home_players_processed["playerName"] = self.home_players_processed["PLAYER_ID"].map(home_dict).str.title()
         self.away_players_processed["playerName"] = self.away_players_processed["PLAYER_ID"].map(away_dict).str.title()
 
-        self.lineups_home["lineups"] = self.lineups_home["lineups_string"].replace(home_dict, regex=True).str.title()
-        self.lineups_away["lineups"] = self.lineups_away["lineups_string"].replace(away_dict, regex=True).str.title()
+        self.lineups_home["lineups"] = self.lineup_names(self.lineups_home["lineups_string"], home_dict)
+        self.lineups_away["lineups"] = self.lineup_names(self.lineups_away["lineups_string"], away_dict)
 
         self.assists_home["playerName"] = self.assists_home["PLAYER_ID"].map(home_dict).str.title()
         self.assists_away["playerName"] = self.assists_away["PLAYER_ID"].map(away_dict).str.title()
@@ -649,6 +548,13 @@ class GameData:
 
         pass
 
+    @staticmethod
+    def lineup_names(lineups_string, names):
+        # every distinct lineup is rendered once and spread back over its rows, ids without a name are kept
+        codes, lineups = pd.factorize(lineups_string)
+        rendered = np.array(["; ".join(names.get(x, x) for x in y.split("; ")).title() for y in lineups], dtype=object)
+        return rendered[codes]
+
     def add_player_info(self):
 
         self.home_players_processed = self.home_players_processed.merge(
@@ -691,6 +597,34 @@ class GameData:
         self.add_player_info()
 
 
+@dataclass
+class GameOutput:
+    # the processed frames SeasonData.concatenate_* reads, all a worker process has to send back
+    season: int
+    game_code: int
+    home_players_processed: pd.DataFrame
+    away_players_processed: pd.DataFrame
+    lineups_home: pd.DataFrame
+    lineups_away: pd.DataFrame
+    team_stats: pd.DataFrame
+    points: pd.DataFrame
+    assists_home: pd.DataFrame
+    assists_away: pd.DataFrame
+
+
+def game_output(game):
+    return GameOutput(game.season, game.game_code, game.home_players_processed, game.away_players_processed,
+                      game.lineups_home, game.lineups_away, game.team_stats, game.points, game.assists_home,
+                      game.assists_away)
+
+
+def process_game(game_dict):
+    game = GameData(**decode_game(game_dict))
+    game.process_game_data()
+
+    return game_output(game)
+
+
 @dataclass
 class SeasonData:
     game_list: list
@@ -704,13 +638,33 @@ class SeasonData:
     points_data: pd.DataFrame
     assists_data: pd.DataFrame
     quantiles: pd.DataFrame
-
-    def __init__(self, season):
+    lineup_keys: pd.DataFrame
+    player_sums: pd.DataFrame
+    lineup_sums: pd.DataFrame
+    team_sums: pd.DataFrame
+    sketches: dict
+    sketch_k: int
+    leaderboards: LeaderboardIndex
+
+    def __init__(self, season, sketch_k=DEFAULT_K):
         self.season = season
         self.game_list = []
+        self.sketches = {}
+        self.sketch_k = sketch_k
+        self.leaderboards = LeaderboardIndex()
 
     def store_games_list(self, game_list):
-        self.game_list = [GameData.from_dict(x) for x in game_list]
+        self.game_list = [GameData(**decode_game(x)) for x in game_list]
+
+    def add_game(self, game):
+        # keeps only the output frames of a processed game, the raw data and intermediates go with the GameData
+        self.game_list.append(game if isinstance(game, GameOutput) else game_output(game))
+
+    def release_games(self):
+        # the per game frames are not needed once concatenate_* has built the season frames
+        game_count = len(self.game_list)
+        self.game_list = []
+        return game_count
 
     def concatenate_player_data(self):
         player_data_list = [x.home_players_processed for x in self.game_list] + [x.away_players_processed for x in
@@ -743,8 +697,9 @@ class SeasonData:
     def concatenate_quantile_data(self):
         percentiles = [0.25, 0.50, 0.75, 0.95, 1]
 
-        player_quantiles = [self.player_data["PIR"].quantile(x) for x in percentiles]
-        team_quantiles = [self.team_data["PPP"].quantile(x) for x in percentiles]
+        # read off the per game sketches, which follow the games as they are added
+        player_quantiles = self.sketches["player_PIR"].quantile(percentiles).tolist()
+        team_quantiles = self.sketches["team_PPP"].quantile(percentiles).tolist()
 
         df = pd.DataFrame.from_dict({0: [player_quantiles, "player"],
                                      1: [team_quantiles, "team"]},
@@ -753,107 +708,309 @@ class SeasonData:
         self.quantiles = df
 
     def aggregate_player_data(self):
-        self.player_data["game_count"] = 1
-        numeric_columns = self.player_data.select_dtypes(include=np.number).columns.tolist()
+        self.player_sums = None
+        self.player_data_agg = None
+        self.leaderboards.touch("player")
+        self.update_player_aggregates(self.player_data)
+
+    def update_player_aggregates(self, player_data, sign=1):
+        player_data["game_count"] = 1
+        numeric_columns = player_data.select_dtypes(include=np.number).columns.tolist()
 
         cols_to_average = [x for x in numeric_columns if re.search("_ratio", x)]
         cols_to_sum = [x for x in numeric_columns if not re.search("_ratio", x)]
+        ratio_columns = cols_to_average + [x for x in PLAYER_RATIO_COLUMNS if x in cols_to_sum]
+
+        # the ratio columns are averaged over the games they are set in, so their counts are kept next to the sums
+        counts = {f"{x}_count": player_data[x].notna().to_numpy(dtype=int) for x in cols_to_average}
+        df = self.split_ratios(player_data.assign(**counts), ratio_columns)
+        sums = df.groupby(PLAYER_KEYS)[cols_to_sum + cols_to_average + list(counts) +
+                                       self.inf_columns(ratio_columns)].sum()
+        self.player_sums = self.add_sums(self.player_sums, sums, sign)
+        self.leaderboards.touch("player", sums.index)
+
+        df = self.player_aggregates(self.player_sums[self.player_sums.index.isin(sums.index)], self.season)
+        self.player_data_agg = self.merge_aggregates(self.player_data_agg, df, self.player_sums.index)
+
+    @staticmethod
+    def player_aggregates(state, season):
+        # aggregated player rows of summed state rows, averages and ratios are worked out from the sums
+        state = SeasonData.join_ratios(state)
+        cols_to_count = [x for x in state.columns if x.endswith("_ratio_count")]
+        cols_to_average = [x[:-len("_count")] for x in cols_to_count]
+        cols_to_sum = [x for x in state.columns if (x not in cols_to_count) and (x not in cols_to_average)]
+
+        df = state[cols_to_sum].join(state[cols_to_average] / state[cols_to_count].to_numpy())
+        df = df.reset_index()
+        df["season"] = season
+
+        df_averages = df[cols_to_sum].div(df["game_count"], axis=0).add_suffix("_avg")
+
+        df = df.join(df_averages)
+        df["2FGP"] = df["2FGM"] / df["2FGA"]
+        df["3FGR"] = df["3FGM"] / df["3FGA"]
+        df["FTR"] = df["FTM"] / df["FTA"]
+
+        df["DREBR"] = df["D"] / (df["team_D"] + df["opp_O"])
+        df["OREBR"] = df["O"] / (df["team_O"] + df["opp_D"])
+        df["usage"] = (df["multi_ft"] + df["2FGA"] + df["3FGA"] + df["TO"]) / (
+                df["team_multi_ft"] + df["team_2FGA"] + df["team_3FGA"] + df["team_TO"])
+        df["a2Pr"] = df["assisted_2fg"] / df["2FGM"]
+        df["a3Pr"] = df["assisted_3fg"] / df["3FGM"]
+
+        df["eFG"] = (df["pts"] - df["FTM"]) / (2 * df["2FGA"] + 2 * df["3FGA"])
 
-        cols_dict = {x: "sum" for x in cols_to_sum} | {x: "mean" for x in cols_to_average}
-
-        self.player_data_agg = self.player_data.groupby(["PLAYER_ID", "playerName", "CODETEAM", "p", "im"]).agg(
-            cols_dict)
-        self.player_data_agg = self.player_data_agg.reset_index()
-        self.player_data_agg["season"] = self.season
-
-        df_averages = pd.DataFrame({
-            f"{x}_avg": self.player_data_agg[x] / self.player_data_agg["game_count"] for x in cols_to_sum})
-
-        self.player_data_agg = self.player_data_agg.join(df_averages)
-        self.player_data_agg["2FGP"] = self.player_data_agg["2FGM"] / self.player_data_agg["2FGA"]
-        self.player_data_agg["3FGR"] = self.player_data_agg["3FGM"] / self.player_data_agg["3FGA"]
-        self.player_data_agg["FTR"] = self.player_data_agg["FTM"] / self.player_data_agg["FTA"]
-
-        self.player_data_agg["DREBR"] = self.player_data_agg["D"] / \
-                                        (self.player_data_agg["team_D"] + self.player_data_agg["opp_O"])
-        self.player_data_agg["OREBR"] = self.player_data_agg["O"] / \
-                                        (self.player_data_agg["team_O"] + self.player_data_agg["opp_D"])
-        self.player_data_agg["usage"] = (self.player_data_agg["multi_ft"] +
-                                         self.player_data_agg["2FGA"] +
-                                         self.player_data_agg["3FGA"] +
-                                         self.player_data_agg["TO"]) / (
-                                                self.player_data_agg["team_multi_ft"] +
-                                                self.player_data_agg["team_2FGA"] +
-                                                self.player_data_agg["team_3FGA"] +
-                                                self.player_data_agg["team_TO"])
-        self.player_data_agg["a2Pr"] = self.player_data_agg["assisted_2fg"] / self.player_data_agg["2FGM"]
-        self.player_data_agg["a3Pr"] = self.player_data_agg["assisted_3fg"] / self.player_data_agg["3FGM"]
-
-        self.player_data_agg["eFG"] = (self.player_data_agg["pts"] - self.player_data_agg["FTM"]) / \
-                                      (2 * self.player_data_agg["2FGA"] + 2 * self.player_data_agg["3FGA"])
-
-        self.player_data_agg["TS"] = self.player_data_agg["pts"] / (
-                2 * (self.player_data_agg["2FGA"] + self.player_data_agg["3FGA"]) + self.player_data_agg["multi_ft"])
+        df["TS"] = df["pts"] / (2 * (df["2FGA"] + df["3FGA"]) + df["multi_ft"])
+        return df
 
     def aggregate_lineup_data(self):
-        self.lineup_data["game_count"] = 1
-        numeric_columns = self.lineup_data.select_dtypes(include=np.number).columns.tolist()
+        self.lineup_sums = None
+        self.lineup_data_agg = None
+        self.lineup_keys = pd.DataFrame({"lineups_string": pd.Series(dtype=object), "lineups": pd.Series(dtype=object)})
+        self.leaderboards.touch("lineup")
+        self.update_lineup_aggregates(self.lineup_data)
+
+    def update_lineup_aggregates(self, lineup_data, sign=1):
+        lineup_data["game_count"] = 1
+        numeric_columns = lineup_data.select_dtypes(include=np.number).columns.tolist()
 
         cols_to_sum = [x for x in numeric_columns]
-        cols_dict = {x: "sum" for x in cols_to_sum}
 
-        self.lineup_data_agg = self.lineup_data.groupby(["lineups_string", "lineups", "CODETEAM"]).agg(cols_dict)
-        self.lineup_data_agg = self.lineup_data_agg.reset_index()
+        lineup_key = self.lineup_key(lineup_data)
+        sums = lineup_data[cols_to_sum].groupby([lineup_key, lineup_data["CODETEAM"].to_numpy()]).sum()
+        sums.index.names = ["lineup_key", "CODETEAM"]
+        self.lineup_sums = self.add_sums(self.lineup_sums, sums, sign)
+        self.leaderboards.touch("lineup", self.lineup_index(sums.index))
 
-        df_averages = pd.DataFrame({
-            f"{x}_avg": self.lineup_data_agg[x] / self.lineup_data_agg["game_count"] for x in cols_to_sum})
+        # the lineup strings and names are only looked up for the output rows
+        df = self.lineup_sums[self.lineup_sums.index.isin(sums.index)].reset_index()
+        lineup_key = df.pop("lineup_key").to_numpy()
+        df.insert(0, "lineups_string", self.lineup_keys["lineups_string"].to_numpy()[lineup_key])
+        df.insert(1, "lineups", self.lineup_keys["lineups"].to_numpy()[lineup_key])
 
-        self.lineup_data_agg = self.lineup_data_agg.join(df_averages)
-        self.lineup_data_agg["2FGR"] = self.lineup_data_agg["2FGM"] / self.lineup_data_agg["2FGA"]
-        self.lineup_data_agg["3FGR"] = self.lineup_data_agg["3FGM"] / self.lineup_data_agg["3FGA"]
-        self.lineup_data_agg["FTR"] = self.lineup_data_agg["FTM"] / self.lineup_data_agg["FTA"]
+        df_averages = df[cols_to_sum].div(df["game_count"], axis=0).add_suffix("_avg")
 
-        self.lineup_data_agg["season"] = self.season
+        df = df.join(df_averages)
+        df["2FGR"] = df["2FGM"] / df["2FGA"]
+        df["3FGR"] = df["3FGM"] / df["3FGA"]
+        df["FTR"] = df["FTM"] / df["FTA"]
+        df["net_rating"] = 100 * ((2 * df["2FGM"] + 3 * df["3FGM"] + df["FTM"]) / df["pos"] -
+                                  (2 * df["opp_2FGM"] + 3 * df["opp_3FGM"] + df["opp_FTM"]) / df["opp_pos"])
 
-        pass
+        df["season"] = self.season
+
+        self.lineup_data_agg = self.merge_aggregates(self.lineup_data_agg, df,
+                                                     self.lineup_index(self.lineup_sums.index).sort_values())
+
+    def lineup_key(self, lineup_data):
+        # every distinct lineup of the season keeps the integer key it was first seen with, lineup_keys is indexed by
+        # that key and maps it to the player ids and names of the lineup, keys are never reused
+        codes, lineups_string = pd.factorize(lineup_data["lineups_string"])
+        keys = pd.Index(self.lineup_keys["lineups_string"]).get_indexer(lineups_string)
+        new = keys < 0
+        if new.any():
+            lineups = lineup_data["lineups"].groupby(codes).first().to_numpy()
+            keys[new] = np.arange(len(self.lineup_keys), len(self.lineup_keys) + new.sum())
+            self.lineup_keys = pd.concat([self.lineup_keys, pd.DataFrame({"lineups_string": lineups_string[new],
+                                                                          "lineups": lineups[new]})],
+                                         ignore_index=True)
+        return keys[codes]
+
+    def lineup_index(self, index):
+        # lineup_key, CODETEAM keys of the sums as the lineups_string, CODETEAM keys of the output rows
+        lineup_key = index.get_level_values("lineup_key").to_numpy()
+        return pd.MultiIndex.from_arrays([self.lineup_keys["lineups_string"].to_numpy()[lineup_key],
+                                          index.get_level_values("CODETEAM")], names=["lineups_string", "CODETEAM"])
 
     def aggregate_team_data(self):
-        self.team_data["game_count"] = 1
-        numeric_columns = self.team_data.select_dtypes(include=np.number).columns.tolist()
+        self.team_sums = None
+        self.team_data_agg = None
+        self.leaderboards.touch("team")
+        self.update_team_aggregates(self.team_data)
+
+    def update_team_aggregates(self, team_data, sign=1):
+        team_data["game_count"] = 1
+        numeric_columns = team_data.select_dtypes(include=np.number).columns.tolist()
         cols_to_sum = [x for x in numeric_columns]
-        cols_dict = {x: "sum" for x in cols_to_sum}
-        self.team_data_agg = self.team_data.groupby(["CODETEAM", "team_name"]).agg(cols_dict)
-        self.team_data_agg = self.team_data_agg.reset_index()
-
-        df_averages = pd.DataFrame({
-            f"{x}_avg": self.team_data_agg[x] / self.team_data_agg["game_count"] for x in cols_to_sum})
-
-        self.team_data_agg = self.team_data_agg.join(df_averages)
-        self.team_data_agg["2FGR"] = self.team_data_agg["2FGM"] / self.team_data_agg["2FGA"]
-        self.team_data_agg["3FGR"] = self.team_data_agg["3FGM"] / self.team_data_agg["3FGA"]
-        self.team_data_agg["FTR"] = self.team_data_agg["FTM"] / self.team_data_agg["FTA"]
-        self.team_data_agg["FG"] = (self.team_data_agg["2FGM"] + self.team_data_agg["3FGM"]) / \
-                                   (self.team_data_agg["2FGA"] + self.team_data_agg["3FGA"])
-        self.team_data_agg["season"] = self.season
-        self.team_data_agg["ORtg"] = 100 * self.team_data_agg["points_scored"] / self.team_data_agg["pos"]
-        self.team_data_agg["DRtg"] = 100 * self.team_data_agg["opp_points_scored"] / self.team_data_agg["opp_pos"]
-
-        self.team_data_agg["TOR"] = self.team_data_agg["TO"] / (
-                self.team_data_agg["2FGA"] + self.team_data_agg["3FGA"] + self.team_data_agg["multi_ft"] +
-                self.team_data_agg["TO"])
-        self.team_data_agg["FT_four"] = self.team_data_agg["FTM"] / (
-                self.team_data_agg["2FGA"] + self.team_data_agg["3FGA"])
-        self.team_data_agg["eFG"] = (self.team_data_agg["points_scored"] -
-                                     self.team_data_agg["FTM"]) / (
-                                            2 * (self.team_data_agg["2FGA"] + self.team_data_agg["3FGA"]))
-
-        self.team_data_agg["pace"] = (self.team_data_agg["pos"] +
-                                      self.team_data_agg["opp_pos"]) / (2 * self.team_data_agg["game_count"])
-
-        self.team_data_agg["DREBR"] = self.team_data_agg["D"] / (self.team_data_agg["opp_O"] + self.team_data_agg["D"])
-        self.team_data_agg["OREBR"] = self.team_data_agg["O"] / (self.team_data_agg["opp_D"] + self.team_data_agg["O"])
-
-    def calculate_per_game_based(self):
+        ratio_columns = [x for x in TEAM_RATIO_COLUMNS if x in cols_to_sum]
+
+        sums = self.split_ratios(team_data, ratio_columns).groupby(TEAM_KEYS)[
+            cols_to_sum + self.inf_columns(ratio_columns)].sum()
+        self.team_sums = self.add_sums(self.team_sums, sums, sign)
+        self.leaderboards.touch("team", sums.index)
+
+        df = self.team_aggregates(self.team_sums[self.team_sums.index.isin(sums.index)], self.season)
+        self.team_data_agg = self.merge_aggregates(self.team_data_agg, df, self.team_sums.index)
+
+    @staticmethod
+    def team_aggregates(state, season):
+        state = SeasonData.join_ratios(state)
+        cols_to_sum = state.columns.tolist()
+        df = state.reset_index()
+
+        df_averages = df[cols_to_sum].div(df["game_count"], axis=0).add_suffix("_avg")
+
+        df = df.join(df_averages)
+        df["2FGR"] = df["2FGM"] / df["2FGA"]
+        df["3FGR"] = df["3FGM"] / df["3FGA"]
+        df["FTR"] = df["FTM"] / df["FTA"]
+        df["FG"] = (df["2FGM"] + df["3FGM"]) / (df["2FGA"] + df["3FGA"])
+        df["season"] = season
+        df["ORtg"] = 100 * df["points_scored"] / df["pos"]
+        df["DRtg"] = 100 * df["opp_points_scored"] / df["opp_pos"]
+        df["net_rating"] = df["ORtg"] - df["DRtg"]
+
+        df["TOR"] = df["TO"] / (df["2FGA"] + df["3FGA"] + df["multi_ft"] + df["TO"])
+        df["FT_four"] = df["FTM"] / (df["2FGA"] + df["3FGA"])
+        df["eFG"] = (df["points_scored"] - df["FTM"]) / (2 * (df["2FGA"] + df["3FGA"]))
+
+        df["pace"] = (df["pos"] + df["opp_pos"]) / (2 * df["game_count"])
+
+        df["DREBR"] = df["D"] / (df["opp_O"] + df["D"])
+        df["OREBR"] = df["O"] / (df["opp_D"] + df["O"])
+        return df
+
+    @staticmethod
+    def inf_columns(columns):
+        return [f"{x}_{y}" for x in columns for y in ["inf", "ninf"]]
+
+    @staticmethod
+    def split_ratios(df, columns):
+        # a ratio summed as is turns into nan once a game where it was inf is taken back out again, so it is summed
+        # as its finite values next to counts of its inf values and only put back together by join_ratios, nan values
+        # are left out as groupby sums do
+        values = df[columns].to_numpy(dtype=float)
+        split = {x: np.where(np.isfinite(values[:, idx]), values[:, idx], 0) for idx, x in enumerate(columns)}
+        for idx, x in enumerate(columns):
+            split[f"{x}_inf"] = (values[:, idx] == np.inf).astype(int)
+            split[f"{x}_ninf"] = (values[:, idx] == -np.inf).astype(int)
+        return df.assign(**split)
+
+    @staticmethod
+    def join_ratios(state):
+        # the sums a plain groupby sum would give, inf or -inf where an inf value went in and nan where both did
+        columns = [x[:-len("_inf")] for x in state.columns if x.endswith("_inf")]
+        if len(columns) == 0:
+            return state
+
+        pos = state[[f"{x}_inf" for x in columns]].to_numpy() > 0
+        neg = state[[f"{x}_ninf" for x in columns]].to_numpy() > 0
+        values = state[columns].to_numpy(dtype=float)
+        values = np.where(pos & neg, np.nan, np.where(pos, np.inf, np.where(neg, -np.inf, values)))
+
+        state = state.drop(columns=SeasonData.inf_columns(columns))
+        return state.assign(**{x: values[:, idx] for idx, x in enumerate(columns)})
+
+    @staticmethod
+    def add_sums(state, sums, sign=1):
+        # running sums per key, sign -1 takes games back out and keys no game counts towards any more are dropped
+        if sign < 0:
+            sums = -sums
+        if state is None:
+            return sums
+
+        # the sums are finite, ratios that can be inf are kept split by split_ratios
+        index = state.index.union(sums.index)
+        state = state.reindex(index, fill_value=0) + sums.reindex(index, fill_value=0)
+        return state[state["game_count"] != 0]
+
+    @staticmethod
+    def merge_aggregates(agg, df, index):
+        # the recomputed rows replace their previous versions, rows follow the sorted keys of the sums
+        keys = list(index.names)
+        if agg is not None:
+            kept = ~pd.MultiIndex.from_frame(agg[keys]).isin(pd.MultiIndex.from_frame(df[keys]))
+            df = pd.concat([agg[kept], df], ignore_index=True)
+
+        # keys no longer in the sums have no position and are left out
+        position = index.get_indexer(pd.MultiIndex.from_frame(df[keys]))
+        order = np.argsort(position)
+        return df.take(order[position[order] >= 0]).reset_index(drop=True)
+
+    def apply_games(self, game_list):
+        # folds processed games into an aggregated season, games already in it are replaced, only the keys the games
+        # touch are regrouped, the season wide steps (quantiles, PER, ranks) still have to run after this
+        new_season = SeasonData(self.season)
+        new_season.game_list = list(game_list)
+        new_season.concatenate_player_data()
+        new_season.concatenate_lineup_data()
+        new_season.concatenate_team_data()
+        new_season.concatenate_points_data()
+        new_season.concatenate_assists_data()
+
+        game_codes = [x.game_code for x in new_season.game_list]
+        replaced = self.remove_games(game_codes)
+
+        self.update_player_aggregates(new_season.player_data)
+        self.update_lineup_aggregates(new_season.lineup_data)
+        self.update_team_aggregates(new_season.team_data)
+
+        self.player_data = pd.concat([self.player_data, new_season.player_data])
+        self.lineup_data = pd.concat([self.lineup_data, new_season.lineup_data])
+        self.team_data = pd.concat([self.team_data, new_season.team_data])
+        self.points_data = pd.concat([self.points_data, new_season.points_data])
+        self.assists_data = pd.concat([self.assists_data, new_season.assists_data])
+
+        if replaced:
+            self.sketch_game_data(self.player_data, self.team_data, reset=True)
+        else:
+            self.sketch_game_data(new_season.player_data, new_season.team_data)
+
+    def remove_games(self, game_codes):
+        if not self.team_data["game_code"].isin(game_codes).any():
+            return False
+
+        player_rows = self.player_data["game_code"].isin(game_codes)
+        lineup_rows = self.lineup_data["game_code"].isin(game_codes)
+        team_rows = self.team_data["game_code"].isin(game_codes)
+
+        # uPER and PER are worked out over the whole season after aggregating and are not part of the sums
+        self.update_player_aggregates(self.player_data[player_rows].drop(columns=["uPER", "PER"], errors="ignore"),
+                                      sign=-1)
+        self.update_lineup_aggregates(self.lineup_data[lineup_rows].copy(), sign=-1)
+        self.update_team_aggregates(self.team_data[team_rows].copy(), sign=-1)
+
+        self.player_data = self.player_data[~player_rows]
+        self.lineup_data = self.lineup_data[~lineup_rows]
+        self.team_data = self.team_data[~team_rows]
+        self.points_data = self.points_data[~self.points_data["game_code"].isin(game_codes)]
+        self.assists_data = self.assists_data[~self.assists_data["game_code"].isin(game_codes)]
+        return True
+
+    def sketch_game_data(self, player_data, team_data, reset=False):
+        # per game values only ever get added, so these sketches follow the games as they come in and are rebuilt
+        # only when games are replaced
+        for name, values in [("player_PIR", player_data["PIR"]), ("team_PPP", team_data["PPP"])]:
+            if reset or (name not in self.sketches):
+                self.sketches[name] = self.new_sketch(values)
+            else:
+                self.sketches[name].update(values)
+
+    def sketch_aggregates(self, min_duration=1800):
+        # aggregates change with every game and are rebuilt from the aggregated rows, players are ranked once they
+        # have played min_duration seconds
+        qualified = self.player_data_agg.loc[self.player_data_agg["duration"] >= min_duration]
+        for x in PLAYER_RANK_METRICS:
+            self.sketches[f"player_{x}"] = self.new_sketch(qualified[x])
+        for x in TEAM_RANK_METRICS:
+            self.sketches[f"team_{x}"] = self.new_sketch(self.team_data_agg[x])
+
+    def new_sketch(self, values):
+        # seeded, so the same games give the same quantiles and ranks on every run
+        return QuantileSketch(self.sketch_k, seed=0).update(values)
+
+    def update_leaderboards(self):
+        # run after the season wide steps, the PER and rank leaderboards are rebuilt from the finished rows
+        self.leaderboards.update({"player": (self.player_data_agg, PLAYER_KEYS),
+                                  "lineup": (self.lineup_data_agg, ["lineups_string", "CODETEAM"]),
+                                  "team": (self.team_data_agg, TEAM_KEYS)})
+
+    def percentile(self, name, values):
+        # nan values are not ranked, as in Series.rank
+        values = np.asarray(values, dtype=float)
+        return np.where(np.isnan(values), np.nan, self.sketches[name].rank(values) * 100)
+
+    def league_constants(self):
         league_vop = np.sum(self.team_data_agg["points_scored"]) / np.sum(self.team_data_agg["pos"])
         league_drp = np.sum(self.team_data_agg["D"]) / np.sum(self.team_data_agg["D"] + self.team_data_agg["O"])
         league_factor = (2 / 3) - np.sum(self.team_data_agg["AS"] / (2 * np.sum(self.team_data_agg["2FGM"] +
@@ -868,107 +1025,79 @@ class SeasonData:
         league_pace = np.mean(
             (self.team_data_agg["pos"] + self.team_data_agg["opp_pos"]) / self.team_data_agg["game_count"] / 2)
 
-        # TODO merging could be faster
-        def u_per(row):
-            team_stats = self.team_data.loc[
-                         (self.team_data["game_code"] == row["game_code"]) &
-                         (self.team_data["CODETEAM"] == row["CODETEAM"]), :]
-
-            fg = row["2FGM"] + row["3FGM"]
-            fga = row["2FGA"] + row["3FGA"]
-            team_fg = team_stats["2FGM"].iloc[0] + team_stats["3FGM"].iloc[0]
-            c0 = (1 / (row["duration"] / 60))
-            c1 = row["3FGM"] + 0.66 * row["AS"]
-            c2 = (2 - league_factor * team_stats["AS"] / team_fg) * fg
-            c3_1 = 0.5 * row["FTM"]
-            c3_2 = 2 - team_stats["AS"] / (team_fg * 3)
-            c4 = league_vop * row["TO"]
-            c5 = league_vop * league_drp * (fga - fg)
-            c6 = league_vop * 0.44 * (0.44 + (0.56 * league_drp)) * (row["FTA"] - row["FTM"])
-            c7 = league_vop * (1 - league_drp) * row["D"]
-            c8 = league_vop * league_drp * row["O"]
-            c9 = league_vop * row["ST"]
-            c10 = league_vop * league_drp * row["FV"]
-            c11 = league_foul * row["CM"]
-
-            uper_stat = c0 * (c1 + c2 + (c3_1 * c3_2) - c4 - c5 - c6 + c7 + c8 + c9 + c10 - c11)
-            team_pace = (team_stats["pos"].iloc[0] + team_stats["opp_pos"].iloc[0]) / 2
-
-            return uper_stat.iloc[0], team_pace
-
-        df_tmp = self.player_data.apply(lambda x: u_per(x), axis=1, result_type="expand")
-        df_tmp.columns = ["uPER", "team_pace"]
+        return league_vop, league_drp, league_factor, league_foul, league_pace
+
+    @staticmethod
+    def team_context(df, team_df, keys, columns):
+        # the first team row matching every player row, joined once and aligned with df
+        team_df = team_df.drop_duplicates(subset=keys)[keys + columns]
+        team_df = team_df.rename(columns={x: f"team_{x}" for x in columns})
+        context = df[keys].merge(team_df, on=keys, how="left")
+        context.index = df.index
+        return context
+
+    @staticmethod
+    def u_per(df, context, fouls, league_vop, league_drp, league_factor, league_foul):
+        # whole-column uPER, context holds the team row of every player row
+        fg = df["2FGM"] + df["3FGM"]
+        fga = df["2FGA"] + df["3FGA"]
+        team_fg = context["team_2FGM"] + context["team_3FGM"]
+        c0 = (1 / (df["duration"] / 60))
+        c1 = df["3FGM"] + 0.66 * df["AS"]
+        c2 = (2 - league_factor * context["team_AS"] / team_fg) * fg
+        c3_1 = 0.5 * df["FTM"]
+        c3_2 = 2 - context["team_AS"] / (team_fg * 3)
+        c4 = league_vop * df["TO"]
+        c5 = league_vop * league_drp * (fga - fg)
+        c6 = league_vop * 0.44 * (0.44 + (0.56 * league_drp)) * (df["FTA"] - df["FTM"])
+        c7 = league_vop * (1 - league_drp) * df["D"]
+        c8 = league_vop * league_drp * df["O"]
+        c9 = league_vop * df["ST"]
+        c10 = league_vop * league_drp * df["FV"]
+        c11 = league_foul * fouls
+
+        return c0 * (c1 + c2 + (c3_1 * c3_2) - c4 - c5 - c6 + c7 + c8 + c9 + c10 - c11)
+
+    def calculate_per_game_based(self):
+        league_vop, league_drp, league_factor, league_foul, league_pace = self.league_constants()
+
+        context = self.team_context(self.player_data, self.team_data, ["game_code", "CODETEAM"],
+                                    ["2FGM", "3FGM", "AS", "pos", "opp_pos"])
+        df_tmp = pd.DataFrame({
+            "uPER": self.u_per(self.player_data, context, self.player_data["CM"], league_vop, league_drp,
+                               league_factor, league_foul),
+            "team_pace": (context["team_pos"] + context["team_opp_pos"]) / 2}).astype(float)
 
         self.player_data["uPER"] = df_tmp["uPER"]
         self.player_data["PER"] = (df_tmp["uPER"] * league_pace / df_tmp["team_pace"]) * 15 / np.mean(
             self.player_data.loc[self.player_data["duration"] >= 180, "uPER"])
         self.player_data.loc[self.player_data["duration"] < 180, "PER"] = np.nan
 
-    def calculate_per_season_based(self):
-        league_vop = np.sum(self.team_data_agg["points_scored"]) / np.sum(self.team_data_agg["pos"])
-        league_drp = np.sum(self.team_data_agg["D"]) / np.sum(self.team_data_agg["D"] + self.team_data_agg["O"])
-        league_factor = (2 / 3) - np.sum(self.team_data_agg["AS"] / (2 * np.sum(self.team_data_agg["2FGM"] +
-                                                                                np.sum(self.team_data_agg["3FGM"]))) / (
-                                                 2 * (np.sum(self.team_data_agg["2FGM"]) +
-                                                      np.sum(self.team_data_agg["3FGM"])) / np.sum(
-                                             self.team_data_agg["FTM"])))
-        league_foul = np.sum(self.team_data_agg["FTM"] -
-                             (league_vop * self.team_data_agg["multi_ft"])) / np.sum(
-            self.team_data_agg["CM"] + self.team_data_agg["CMU"] + self.team_data_agg["OF"] + self.team_data_agg["CMT"])
-
-        league_pace = np.mean(
-            (self.team_data_agg["pos"] + self.team_data_agg["opp_pos"]) / self.team_data_agg["game_count"] / 2)
+    def calculate_per_season_based(self, min_duration=1800):
+        league_vop, league_drp, league_factor, league_foul, league_pace = self.league_constants()
 
-        # TODO merging could be faster
-        def u_per(row):
-            team_stats = self.team_data_agg.loc[(self.team_data_agg["CODETEAM"] == row["CODETEAM"]), :]
-
-            fg = row["2FGM"] + row["3FGM"]
-            fga = row["2FGA"] + row["3FGA"]
-            team_fg = (team_stats["2FGM"] + team_stats["3FGM"]).iloc[0]
-            c0 = (1 / (row["duration"] / 60))
-            c1 = row["3FGM"] + 0.66 * row["AS"]
-            c2 = (2 - league_factor * team_stats["AS"].iloc[0] / team_fg) * fg
-            c3_1 = 0.5 * row["FTM"]
-            c3_2 = 2 - team_stats["AS"].iloc[0] / (team_fg * 3)
-            c4 = league_vop * row["TO"]
-            c5 = league_vop * league_drp * (fga - fg)
-            c6 = league_vop * 0.44 * (0.44 + (0.56 * league_drp)) * (row["FTA"] - row["FTM"])
-            c7 = league_vop * (1 - league_drp) * row["D"]
-            c8 = league_vop * league_drp * row["O"]
-            c9 = league_vop * row["ST"]
-            c10 = league_vop * league_drp * row["FV"]
-            c11 = league_foul * (row["CM"] + row["OF"] + row["CMU"])
-
-            uper_stat = c0 * (c1 + c2 + (c3_1 * c3_2) - c4 - c5 - c6 + c7 + c8 + c9 + c10 - c11)
-            team_pace = team_stats["pos"].iloc[0] / team_stats["game_count"].iloc[0]
-
-            return uper_stat, team_pace
-
-        df_tmp = self.player_data_agg.apply(lambda x: u_per(x), axis=1, result_type="expand")
-        df_tmp.columns = ["uPER_season", "team_pace"]
+        context = self.team_context(self.player_data_agg, self.team_data_agg, ["CODETEAM"],
+                                    ["2FGM", "3FGM", "AS", "pos", "game_count"])
+        fouls = self.player_data_agg["CM"] + self.player_data_agg["OF"] + self.player_data_agg["CMU"]
+        df_tmp = pd.DataFrame({
+            "uPER_season": self.u_per(self.player_data_agg, context, fouls, league_vop, league_drp, league_factor,
+                                      league_foul),
+            "team_pace": context["team_pos"] / context["team_game_count"]}).astype(float)
 
         self.player_data_agg["uPER_season"] = df_tmp["uPER_season"]
         self.player_data_agg["PER_season"] = (df_tmp["uPER_season"] * league_pace / df_tmp["team_pace"]) * 15 / np.mean(
-            self.player_data_agg.loc[self.player_data_agg["duration"] >= 1800, "uPER_season"])
-        self.player_data_agg.loc[self.player_data_agg["duration"] < 1800, "PER_season"] = np.nan
+            self.player_data_agg.loc[self.player_data_agg["duration"] >= min_duration, "uPER_season"])
+        self.player_data_agg.loc[self.player_data_agg["duration"] < min_duration, "PER_season"] = np.nan
         return df_tmp
 
-    def get_percentile_ranks(self):
-        self.player_data_agg["PIR_rank"] = self.player_data_agg.loc[
-                                               self.player_data_agg["duration"] >= 1800, "PIR_avg"].rank(pct=True) * 100
-        self.player_data_agg["PPG_rank"] = self.player_data_agg.loc[
-                                               self.player_data_agg["duration"] >= 1800, "pts_avg"].rank(pct=True) * 100
-        self.player_data_agg["PER_rank"] = self.player_data_agg.loc[
-                                               self.player_data_agg["duration"] >= 1800, "PER_season"].rank(
-            pct=True) * 100
-        self.player_data_agg["EFG_rank"] = self.player_data_agg.loc[
-                                               self.player_data_agg["duration"] >= 1800, "eFG"].rank(pct=True) * 100
-        self.player_data_agg["MPG_rank"] = self.player_data_agg.loc[
-                                               self.player_data_agg["duration"] >= 1800, "duration_avg"].rank(
-            pct=True) * 100
-        self.player_data_agg["USG_rank"] = self.player_data_agg.loc[
-                                               self.player_data_agg["duration"] >= 1800, "usage"].rank(pct=True) * 100
+    def get_percentile_ranks(self, min_duration=1800):
+        # player ranks are the share of qualified players at or below each value, read off the sketches within their
+        # rank error, team ranks are positions among the teams and stay exact
+        self.sketch_aggregates(min_duration)
+        qualified = self.player_data_agg["duration"] >= min_duration
+        for x, y in PLAYER_RANK_COLUMNS.items():
+            values = self.player_data_agg.loc[qualified, y]
+            self.player_data_agg[x] = pd.Series(self.percentile(f"player_{y}", values), index=values.index)
 
         self.team_data_agg["ORtg_rank"] = self.team_data_agg["ORtg"].rank(ascending=False).astype(int)
         self.team_data_agg["DRtg_rank"] = self.team_data_agg["DRtg"].rank().astype(int)
@@ -987,7 +1116,8 @@ class SeasonData:
     def aggregate_quantile_data(self):
         percentiles = [0.25, 0.50, 0.75, 0.95, 1]
 
-        player_quantiles = [self.player_data_agg["PIR_avg"].quantile(x) for x in percentiles]
+        self.sketches["player_agg_PIR"] = self.new_sketch(self.player_data_agg["PIR_avg"])
+        player_quantiles = self.sketches["player_agg_PIR"].quantile(percentiles).tolist()
 
         df = pd.DataFrame.from_dict({0: [player_quantiles, "player_agg"]
                                      },
@@ -0,0 +1,152 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# columns shown next to the keys and the metric
+TABLE_COLUMNS = {"player": [],
+                 "lineup": ["lineups"],
+                 "team": []}
+
+# metrics worked out against league constants or the other rows change for every row with every game
+SEASON_WIDE_METRICS = ["uPER_season", "PER_season"]
+
+
+@dataclass
+class Leaderboard:
+    # the best k rows of a table by metric, one list per value of group_by or a single one for the season, rows
+    # below min_duration seconds are left out
+    table: str
+    metric: str
+    ascending: bool = False
+    min_duration: float = 0
+    group_by: str = None
+    k: int = 10
+
+    @property
+    def name(self):
+        name = f"{self.table}_{self.metric}"
+        if self.ascending:
+            name += "_asc"
+        if self.group_by is not None:
+            name += f"_by_{self.group_by}"
+        if self.min_duration > 0:
+            name += f"_min_{self.min_duration:g}"
+        return name
+
+    @property
+    def depth(self):
+        # rows kept per group, the extra ones let updates drop rows off the top without going back to the table
+        return 2 * self.k
+
+    def season_wide(self):
+        return (self.metric in SEASON_WIDE_METRICS) or self.metric.endswith("_rank")
+
+    def rows(self, df, keys):
+        columns = keys + [x for x in TABLE_COLUMNS[self.table] + [self.group_by, self.metric]
+                          if (x is not None) and (x not in keys)]
+
+        qualified = np.isfinite(df[self.metric].astype(float)) & (df["duration"] >= self.min_duration)
+        if self.group_by is not None:
+            qualified &= df[self.group_by].notna()
+        return df.loc[qualified, columns]
+
+    def best(self, rows):
+        # best rows first and the value no row left out beats, nan when every row is kept
+        rows = rows.sort_values(self.metric, ascending=self.ascending, kind="stable")
+        if len(rows) <= self.depth:
+            return rows.reset_index(drop=True), np.nan
+        rows = rows.head(self.depth).reset_index(drop=True)
+        return rows, rows[self.metric].iloc[-1]
+
+    def group_rows(self, rows):
+        if self.group_by is None:
+            return {None: rows}
+        return {x: y for x, y in rows.groupby(self.group_by, sort=True)}
+
+    def build(self, df, keys):
+        return {x: self.best(y) for x, y in self.group_rows(self.rows(df, keys)).items() if len(y) > 0}
+
+    def update(self, df, keys, buffers, touched):
+        # touched rows are taken out of the kept rows and put back with their new values, a group is only built
+        # from the table again when fewer than k of its rows are known to be the best ones
+        touched_rows = self.rows(df[pd.MultiIndex.from_frame(df[keys]).isin(touched)], keys)
+        touched_groups = self.group_rows(touched_rows)
+
+        empty = touched_rows.iloc[:0]
+        updated = {}
+        for group in sorted(set(buffers) | set(touched_groups), key=str):
+            rows, bound = buffers.get(group, (empty, np.nan))
+            rows = rows[~pd.MultiIndex.from_frame(rows[keys]).isin(touched)]
+            rows = pd.concat([rows, touched_groups.get(group, empty)])
+
+            if not np.isnan(bound):
+                rows = rows[(rows[self.metric] <= bound) if self.ascending else (rows[self.metric] >= bound)]
+            rows, new_bound = self.best(rows)
+            bound = new_bound if not np.isnan(new_bound) else bound
+
+            if np.isnan(bound) or (len(rows) >= self.k):
+                updated[group] = (rows, bound)
+                continue
+
+            rows = self.rows(df, keys)
+            if self.group_by is not None:
+                rows = rows[rows[self.group_by] == group]
+            updated[group] = self.best(rows)
+
+        # groups without any rows left are dropped
+        return {x: y for x, y in updated.items() if len(y[0]) > 0}
+
+
+DEFAULT_LEADERBOARDS = ([Leaderboard("player", x, min_duration=1800, group_by=y)
+                         for x in ["PIR_avg", "PER_season", "eFG", "pts_avg", "usage"]
+                         for y in [None, "CODETEAM", "p"]] +
+                        [Leaderboard("team", "ORtg"), Leaderboard("team", "DRtg", ascending=True),
+                         Leaderboard("team", "net_rating"), Leaderboard("team", "pace"), Leaderboard("team", "eFG")] +
+                        [Leaderboard("lineup", "net_rating", min_duration=600, group_by=x) for x in [None, "CODETEAM"]])
+
+
+class LeaderboardIndex:
+    # top rows of every leaderboard kept per group, tables report the keys their aggregates changed for with touch
+    # and update only re-sorts what those keys can have moved
+
+    def __init__(self, leaderboards=None):
+        self.boards = DEFAULT_LEADERBOARDS if leaderboards is None else leaderboards
+        self.buffers = {}
+        self.touched = {}
+
+    def touch(self, table, keys=None):
+        # keys None marks every row of the table as changed
+        if (keys is None) or ((table in self.touched) and (self.touched[table] is None)):
+            self.touched[table] = None
+        elif table in self.touched:
+            self.touched[table] = self.touched[table].union(keys)
+        else:
+            self.touched[table] = keys
+
+    def update(self, tables):
+        # tables maps each table to its aggregated frame and key columns
+        for x in self.boards:
+            if x.table not in self.touched:
+                continue
+
+            df, keys = tables[x.table]
+            touched = self.touched[x.table]
+            if (x.name not in self.buffers) or (touched is None) or x.season_wide():
+                self.buffers[x.name] = x.build(df, keys)
+            else:
+                self.buffers[x.name] = x.update(df, keys, self.buffers[x.name], touched)
+
+        self.touched = {}
+
+    def top(self, name, group=None):
+        leaderboard = next(x for x in self.boards if x.name == name)
+        rows, bound = self.buffers[name].get(group, (pd.DataFrame(), np.nan))
+        return rows.head(leaderboard.k)
+
+    def documents(self, season):
+        # one small document per leaderboard and group, holding just the k rows shown
+        return [{"season": season, "leaderboard": x.name, "table": x.table, "metric": x.metric,
+                 "group_by": x.group_by, "group": group, "min_duration": x.min_duration,
+                 "rows": rows.head(x.k).to_dict("records")}
+                for x in self.boards for group, (rows, bound) in self.buffers.get(x.name, {}).items()]
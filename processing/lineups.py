@@ -0,0 +1,174 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+@dataclass
+class Stints:
+    # stint 0 is the starting lineup, counts holds one row of on-court counts per stint over the players array,
+    # row_stint maps every play-by-play row to its stint
+    players: np.ndarray
+    counts: np.ndarray
+    index_left: np.ndarray
+    index_right: np.ndarray
+    row_stint: np.ndarray
+
+    def lineups(self):
+        # sorted player ids of every stint, players is sorted so expanding the counts keeps that order
+        return [self.players[np.repeat(np.arange(len(self.players)), x)].tolist() for x in self.counts]
+
+
+def group_by_time(times, rows):
+    # the rows of one substitution type split into groups of equal time, in time order
+    order = np.argsort(times[rows], kind="stable")
+    rows = rows[order]
+    bounds = np.flatnonzero(np.diff(times[rows])) + 1
+    return np.split(rows, bounds) if len(rows) > 0 else []
+
+
+def pair_substitutions(times, player_in, player_out):
+    # the i-th group of players coming in is paired with the i-th group going out whatever their times, groups
+    # with a different number of players on each side are merged into the first of them and pairs missing a side
+    # are dropped
+    in_groups = group_by_time(times, np.flatnonzero(player_in))
+    out_groups = group_by_time(times, np.flatnonzero(player_out))
+    empty = np.array([], dtype=np.int64)
+
+    pair_count = max(len(in_groups), len(out_groups))
+    in_groups = in_groups + [None] * (pair_count - len(in_groups))
+    out_groups = out_groups + [None] * (pair_count - len(out_groups))
+
+    in_len = np.array([0 if x is None else len(x) for x in in_groups], dtype=np.int64)
+    out_len = np.array([0 if x is None else len(x) for x in out_groups], dtype=np.int64)
+    complete = (in_len > 0) & (out_len > 0)
+    mismatched = np.flatnonzero(in_len != out_len)
+
+    if len(mismatched) > 0:
+        first = mismatched[0]
+        in_groups[first] = np.concatenate([empty] + [in_groups[x] for x in mismatched if in_groups[x] is not None])
+        out_groups[first] = np.concatenate([empty] + [out_groups[x] for x in mismatched if out_groups[x] is not None])
+
+    return [(in_groups[x], out_groups[x]) for x in np.flatnonzero(complete)]
+
+
+def substitute(counts, anti_zone, in_codes, out_codes):
+    # one substitution group on a count vector, players going out who are not on court are parked in anti_zone and
+    # taken off with the next valid substitution, returns the new state and the lineup reported for the group
+    new_counts = counts.copy()
+    np.add.at(new_counts, in_codes, 1)
+
+    errors = 0
+    reports_new = False
+    for x in out_codes:
+        if new_counts[x] == 0:
+            anti_zone.append(x)
+            errors += 1
+            continue
+
+        new_counts[x] -= 1
+        if len(anti_zone) > 0:
+            y = anti_zone.pop()
+            if new_counts[y] == 0:
+                anti_zone.append(x)
+                errors += 1
+                continue
+            new_counts[y] -= 1
+            reports_new = True
+
+    if (errors > 0) and not reports_new:
+        return new_counts, counts
+    return new_counts, new_counts
+
+
+def find_stints(player_ids, times, player_in, player_out, starting_lineup):
+    # one pass over the substitutions, every play-by-play row is then mapped to its stint at once
+    row_count = len(player_ids)
+    player_ids = np.array(["" if pd.isna(x) else x for x in player_ids], dtype=object)
+    pairs = pair_substitutions(times, player_in, player_out)
+
+    players, codes = np.unique(np.concatenate([np.array(starting_lineup, dtype=object),
+                                               player_ids[player_in | player_out]]).astype(str),
+                               return_inverse=True)
+    row_codes = np.zeros(row_count, dtype=np.int64)
+    row_codes[player_in | player_out] = codes[len(starting_lineup):]
+
+    counts = np.zeros(len(players), dtype=np.int8)
+    np.add.at(counts, codes[:len(starting_lineup)], 1)
+
+    stint_counts = [counts]
+    index_left = [0]
+    anti_zone = []
+    for in_rows, out_rows in pairs:
+        counts, reported = substitute(counts, anti_zone, row_codes[in_rows], row_codes[out_rows])
+        stint_counts.append(reported)
+        index_left.append(max(in_rows.max(), out_rows.max()))
+
+    index_left = np.array(index_left, dtype=np.int64)
+    index_right = np.append(index_left[1:], row_count)
+
+    # a stint covers its rows up to the next stint's first row, later stints win where substitutions went back in
+    # time
+    if np.all(np.diff(index_left[1:]) >= 0):
+        row_stint = np.searchsorted(index_left[1:], np.arange(row_count), side="right")
+    else:
+        row_stint = np.full(row_count, -1, dtype=np.int64)
+        for idx, (x, y) in enumerate(zip(index_left, index_right)):
+            row_stint[x:y] = idx
+        row_stint = pd.Series(row_stint).replace(-1, np.nan).ffill().fillna(0).to_numpy(dtype=np.int64)
+
+    return Stints(players, np.array(stint_counts), index_left, index_right, row_stint)
+
+
+def lineup_membership(player_ids, lineup_strings, player_frames=None, lineup_frames=None):
+    # sparse players x lineup rows matrix, 1 where the player is part of the row's lineup, ids are matched exactly
+    # and only within the same frame when frames are given
+    if player_frames is None:
+        player_frames = np.zeros(len(player_ids), dtype=np.int64)
+        lineup_frames = np.zeros(len(lineup_strings), dtype=np.int64)
+
+    lineup_codes, unique_lineups = pd.factorize(pd.MultiIndex.from_arrays([lineup_frames, lineup_strings]))
+    player_index = {x: idx for idx, x in enumerate(zip(player_frames, player_ids))}
+
+    rows, cols = [], []
+    for idx, (frame, lineup) in enumerate(unique_lineups):
+        for x in set(lineup.split("; ")):
+            if (frame, x) in player_index:
+                rows.append(player_index[(frame, x)])
+                cols.append(idx)
+
+    unique_membership = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                                          shape=(len(player_ids), len(unique_lineups)))
+    return unique_membership[:, lineup_codes].tocsr()
+
+
+def frame_membership(player_frames, lineup_frames, frame_count):
+    # sparse players x lineup rows matrix, 1 where the lineup row belongs to the player's frame
+    order = np.argsort(lineup_frames, kind="stable")
+    sizes = np.bincount(lineup_frames, minlength=frame_count)
+    starts = np.cumsum(sizes) - sizes
+
+    lengths = sizes[player_frames]
+    rows = np.repeat(np.arange(len(player_frames)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    cols = order[np.repeat(starts[player_frames], lengths) + offsets]
+
+    return sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(player_frames), len(lineup_frames)))
+
+
+def membership_totals(membership, stats, player_ids, off=False):
+    # column sums of the stats rows selected by each membership row, or of the rows left out with off, integer
+    # columns stay integers
+    values = stats.fillna(0).astype(float).to_numpy()
+    totals = membership @ values
+    if off:
+        totals = values.sum(axis=0) - totals
+
+    totals = pd.DataFrame(totals, columns=stats.columns)
+    for x in stats.columns:
+        if stats[x].dtype.kind in "iub":
+            totals[x] = totals[x].astype(np.int64)
+
+    totals.insert(0, "PLAYER_ID", player_ids)
+    return totals
@@ -0,0 +1,286 @@
+import math
+import re
+
+import pandas as pd
+
+from processing import decoding
+from processing.play_flags import REPLACE_DICT, STAT_COMPOSITE_KEYS, STAT_KEYS
+
+BOX_KEYS = STAT_KEYS + list(STAT_COMPOSITE_KEYS)
+
+
+def event_time(minute, marker_time):
+    # seconds since tip off, same clock as make_pbp_df
+    if minute <= 40:
+        quarter = math.ceil(minute / 10)
+    elif minute <= 45:
+        quarter = 5
+    elif minute <= 50:
+        quarter = 6
+    elif minute <= 55:
+        quarter = 7
+    else:
+        quarter = 8
+
+    mins, secs = marker_time.split(":")[:2]
+    elapsed = int(mins) * 60 + (int(secs) if secs != "" else 0)
+
+    if quarter <= 4:
+        return quarter * 600 - elapsed
+    return 2400 + (quarter - 4) * 300 - elapsed
+
+
+def event_stats(playtype):
+    # same matching as playtype_flags
+    composite = [x for x, y in STAT_COMPOSITE_KEYS.items() if re.match(y, playtype)]
+    return [x for x in STAT_KEYS if x == playtype] + composite
+
+
+def points_scored(stats):
+    return stats.get("FTM", 0) + 2 * stats.get("2FGM", 0) + 3 * stats.get("3FGM", 0)
+
+
+def starting_lineup(players):
+    # players is the decoded Players columns, same filter as GameData.get_starting_lineup
+    players = pd.DataFrame(players)
+    if players.shape[0] == 0:
+        return []
+
+    players = players.loc[(players["st"] == 1) & (players["sl"] == 1) & (players["nn"] == 1), :].drop_duplicates(
+        subset=["ac"], keep=False)
+    return sorted(list(players["ac"].str.replace(" ", "")))
+
+
+class Stint:
+
+    def __init__(self, team, opp, lineup, start):
+        self.team = team
+        self.opp = opp
+        self.lineup = lineup
+        self.start = start
+        self.end = start
+        self.duration = 0
+        self.stats = dict.fromkeys(BOX_KEYS, 0)
+        self.opp_stats = dict.fromkeys(BOX_KEYS, 0)
+
+
+class TeamState:
+
+    def __init__(self, team, opp, starters):
+        self.team = team
+        self.opp = opp
+        self.on_court = set(starters)
+        self.pending_subs = []
+        self.stint = Stint(team, opp, tuple(sorted(self.on_court)), 0)
+        self.stints = [self.stint]
+        self.totals = dict.fromkeys(BOX_KEYS, 0)
+        self.players = {x: self.new_player() for x in starters}
+
+    @staticmethod
+    def new_player():
+        return {"duration": 0, "plus_minus": 0, **dict.fromkeys(BOX_KEYS, 0)}
+
+    def player(self, player_id):
+        if player_id not in self.players:
+            self.players[player_id] = self.new_player()
+        return self.players[player_id]
+
+    def commit_subs(self, time):
+        # substitutions take effect once the clock moves on, plays logged at the same second belong to the old five
+        if len(self.pending_subs) == 0:
+            return
+
+        lineup = set(self.on_court)
+        for playtype, player_id in self.pending_subs:
+            if playtype == "IN":
+                lineup.add(player_id)
+                self.player(player_id)
+            else:
+                lineup.discard(player_id)
+        self.pending_subs = []
+
+        if lineup != self.on_court:
+            self.on_court = lineup
+            self.stint = Stint(self.team, self.opp, tuple(sorted(lineup)), time)
+            self.stints.append(self.stint)
+
+    def run_clock(self, time, elapsed):
+        self.stint.duration += elapsed
+        self.stint.end = time
+        for x in self.on_court:
+            self.player(x)["duration"] += elapsed
+
+
+class LiveGame:
+    # running lineups, box scores and team totals of a game in progress, fed only with the plays added since the
+    # last poll
+
+    def __init__(self, season, game_code, home_team, away_team, home_starters, away_starters, player_names=None):
+        self.season = season
+        self.game_code = game_code
+        self.home_team = home_team
+        self.away_team = away_team
+        self.home_starters = home_starters
+        self.away_starters = away_starters
+        self.player_names = player_names if player_names is not None else {}
+        self.resets = 0
+        self.reset()
+
+    def reset(self):
+        self.teams = {self.home_team: TeamState(self.home_team, self.away_team, self.home_starters),
+                      self.away_team: TeamState(self.away_team, self.home_team, self.away_starters)}
+        self.time = 0
+        self.final = False
+
+        self.pbp_cursor = 0
+        self.last_play = None
+        self.points_cursor = 0
+        self.shots = []
+
+    @staticmethod
+    def play_key(row):
+        return tuple(row.get(x) for x in ["CODETEAM", "PLAYER_ID", "PLAYTYPE", "MARKERTIME", "MINUTE"])
+
+    def update(self, play_by_play, points=None):
+        # returns the number of plays consumed by this update
+        rows = decoding.play_by_play_rows(play_by_play, self.season, self.game_code)
+
+        # plays are only ever appended, anything else means the feed corrected a play we already consumed
+        if (len(rows) < self.pbp_cursor) or ((self.pbp_cursor > 0) and
+                                             (self.play_key(rows[self.pbp_cursor - 1]) != self.last_play)):
+            self.reset()
+            self.resets += 1
+
+        new_rows = rows[self.pbp_cursor:]
+        if len(new_rows) > 0:
+            columns = decoding.PLAY_BY_PLAY_SCHEMA.decode_rows(new_rows, self.season, self.game_code)
+            for idx in range(len(new_rows)):
+                self.add_play({key: val[idx] for key, val in columns.items()}, self.pbp_cursor + idx)
+
+            self.pbp_cursor = len(rows)
+            self.last_play = self.play_key(rows[-1])
+
+        if points is not None:
+            self.update_points(points)
+
+        return len(new_rows)
+
+    def update_points(self, points):
+        columns = decoding.decode_points(points, self.season, self.game_code)
+        row_count = len(columns["TEAM"])
+
+        if row_count < self.points_cursor:
+            self.points_cursor = 0
+            self.shots = []
+
+        for idx in range(self.points_cursor, row_count):
+            self.shots.append({key: val[idx] for key, val in columns.items()})
+        self.points_cursor = row_count
+
+    def add_play(self, play, position):
+        playtype = play["PLAYTYPE"].replace(" ", "")
+        marker_time = play["MARKERTIME"]
+        minute = play["MINUTE"]
+
+        if position == 0:
+            playtype, marker_time = "BG", "10:00"
+        elif playtype == "EG":
+            marker_time, minute = "00:00", minute - 1
+
+        if (playtype in ["BP", "EP"]) or (":" not in marker_time):
+            return
+
+        time = event_time(minute, marker_time)
+        if time > self.time:
+            for team in self.teams.values():
+                team.commit_subs(self.time)
+                team.run_clock(time, time - self.time)
+            self.time = time
+
+        team = self.teams.get(play["CODETEAM"].replace(" ", ""))
+        player_id = (play["PLAYER_ID"] or "").replace(" ", "")
+
+        if playtype == "EG":
+            for x in self.teams.values():
+                x.commit_subs(self.time)
+            self.final = True
+            return
+
+        if team is None:
+            return
+
+        if playtype in ["IN", "OUT"]:
+            team.pending_subs.append((playtype, player_id))
+            return
+
+        stats = event_stats(REPLACE_DICT.get(playtype, playtype))
+        if len(stats) > 0:
+            self.add_stats(team, player_id, stats)
+
+    def add_stats(self, team, player_id, stats):
+        opp = self.teams[team.opp]
+
+        for x in stats:
+            team.totals[x] += 1
+            team.stint.stats[x] += 1
+            opp.stint.opp_stats[x] += 1
+            if player_id != "":
+                team.player(player_id)[x] += 1
+
+        pts = points_scored(dict.fromkeys(stats, 1))
+        if pts > 0:
+            for x in team.on_court:
+                team.player(x)["plus_minus"] += pts
+            for x in opp.on_court:
+                opp.player(x)["plus_minus"] -= pts
+
+    def score(self):
+        return points_scored(self.teams[self.home_team].totals), points_scored(self.teams[self.away_team].totals)
+
+    def box_score(self):
+        rows = []
+        for team in self.teams.values():
+            for player_id, stats in team.players.items():
+                rows.append({"PLAYER_ID": player_id, "CODETEAM": team.team, "OPP": team.opp,
+                             "playerName": self.player_names.get(player_id), **stats})
+
+        df = pd.DataFrame(rows, columns=["PLAYER_ID", "CODETEAM", "OPP", "playerName", "duration", "plus_minus",
+                                         *BOX_KEYS])
+        df["pts"] = points_scored(df)
+        df["PIR"] = df["pts"] + df["O"] + df["D"] + df["AS"] + df["ST"] + df["FV"] + df["RV"] - df["2FGA"] - df[
+            "3FGA"] - df["FTA"] + df["2FGM"] + df["3FGM"] + df["FTM"] - df["TO"] - df["AG"] - df["CM"] - df["OF"] - \
+                    df["CMT"] - df["CMU"] - df["CMD"]
+        df["game_code"] = self.game_code
+        return df
+
+    def team_stats(self):
+        home_pts, away_pts = self.score()
+        rows = []
+        for team, pts, opp_pts in [(self.home_team, home_pts, away_pts), (self.away_team, away_pts, home_pts)]:
+            rows.append({"CODETEAM": team, "OPP": self.teams[team].opp, **self.teams[team].totals,
+                         "points_scored": pts, "opp_points_scored": opp_pts, "home": team == self.home_team})
+
+        df = pd.DataFrame(rows)
+        df["game_code"] = self.game_code
+        return df
+
+    def lineups(self):
+        rows = []
+        for team in self.teams.values():
+            for x in team.stints:
+                if (x.duration == 0) and (sum(x.stats.values()) + sum(x.opp_stats.values()) == 0):
+                    continue
+                rows.append({"lineups_string": "; ".join(x.lineup), "CODETEAM": x.team, "OPP": x.opp,
+                             "min": x.start, "max": x.end, "duration": x.duration, **x.stats,
+                             **{f"opp_{key}": val for key, val in x.opp_stats.items()}})
+
+        df = pd.DataFrame(rows)
+        df["game_code"] = self.game_code
+        return df
+
+    def points(self):
+        df = pd.DataFrame(self.shots, columns=list(decoding.POINTS_SCHEMA.fields))
+        df.loc[:, "TEAM"] = df["TEAM"].str.replace(" ", "")
+        df.loc[:, "ID_PLAYER"] = df["ID_PLAYER"].str.replace(" ", "")
+        df["game_code"] = self.game_code
+        return df
@@ -0,0 +1,58 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# play types counted as another one
+REPLACE_DICT = {"2FGAB": "2FGA", "LAYUPATT": "2FGA", "LAYUPMD": "2FGM", "DUNK": "2FGM"}
+
+STAT_KEYS = ["AS", "TO", "3FGM", "2FGM", "FTM", "D", "O", "RV",
+             "CM", "FV", "AG", "ST", "OF", "CMT", "CMU", "CMD"]
+
+STAT_COMPOSITE_KEYS = {"3FGA": "3FGA|3FGM",
+                       "2FGA": "2FGA|2FGM",
+                       "FTA": "FTA|FTM",
+                       "REB": "D$|O$"}
+
+EXTRA_KEYS = ["multi_ft", "multi_ft_count", "tech_ft", "assisted_2fg", "assisted_3fg", "assisted_ft", "and_one_2fg",
+              "and_one_3fg"]
+
+# box score columns summed per player and lineup, flags first and then pos
+BOX_STAT_KEYS = ["AS", "TO", "3FGM", "3FGA", "2FGA", "2FGM", "FTM", "FTA", "D", "O", "REB",
+                 "RV", "CM", "FV", "AG", "ST", "OF", "CMT", "CMU", "CMD",
+                 "multi_ft", "multi_ft_count", "tech_ft", "assisted_2fg", "assisted_3fg",
+                 "assisted_ft", "and_one_2fg", "and_one_3fg", "pos"]
+
+# one bit per key, every processed play-by-play row carries all of its stat flags in a single int32
+FLAG_KEYS = STAT_KEYS + list(STAT_COMPOSITE_KEYS) + EXTRA_KEYS
+FLAG_BITS = {x: np.int32(1 << idx) for idx, x in enumerate(FLAG_KEYS)}
+
+
+def playtype_flags(playtype):
+    # the flags are worked out once per distinct play type and looked up for every row, same matching as comparing
+    # against the stat keys and str.match on the composite patterns
+    playtype = playtype.astype("category")
+    table = np.zeros(len(playtype.cat.categories) + 1, dtype=np.int32)
+    for idx, x in enumerate(playtype.cat.categories):
+        for key in STAT_KEYS:
+            if x == key:
+                table[idx] |= FLAG_BITS[key]
+        for key, val in STAT_COMPOSITE_KEYS.items():
+            if re.match(val, x):
+                table[idx] |= FLAG_BITS[key]
+
+    # missing play types have code -1 and pick up the empty last entry
+    return table[playtype.cat.codes.to_numpy()]
+
+
+def set_flag(flags, key, mask):
+    return np.where(mask, flags | FLAG_BITS[key], flags & ~FLAG_BITS[key]).astype(np.int32)
+
+
+def get_flag(flags, key):
+    return (np.asarray(flags) & FLAG_BITS[key]) != 0
+
+
+def decode_flags(df, keys):
+    # the requested columns of df as a frame, flag keys decoded to bools and anything else taken as is
+    return pd.DataFrame({x: get_flag(df["flags"], x) if x in FLAG_BITS else df[x] for x in keys}, index=df.index)
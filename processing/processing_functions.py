@@ -3,11 +3,9 @@ import numpy as np
 
 
 def make_pbp_df(pbp_data: dict) -> pd.DataFrame:
-    pbp_quarters = {key: val for key, val in pbp_data.items() if type(val) == list}
-    pbp_quarters = {key: pd.DataFrame(val) for key, val in pbp_quarters.items()}
-
-    pbp_quarters = pd.concat(pbp_quarters).reset_index()
-    pbp_quarters = pbp_quarters[["CODETEAM", "PLAYER_ID", "PLAYTYPE", "PLAYER", "MARKERTIME", "MINUTE"]]
+    # pbp_data holds one list per column, all periods already concatenated by the decoding layer
+    pbp_quarters = pd.DataFrame(pbp_data, columns=["CODETEAM", "PLAYER_ID", "PLAYTYPE", "PLAYER", "MARKERTIME",
+                                                   "MINUTE"])
 
     pbp_quarters.loc[0, "MARKERTIME"] = "10:00"
     pbp_quarters.loc[pbp_quarters.shape[0] - 1, "MARKERTIME"] = "00:00"
@@ -45,14 +43,18 @@ def make_pbp_df(pbp_data: dict) -> pd.DataFrame:
     pbp_quarters.loc[pbp_quarters["playerIn"], "PLAYTYPE"] = "ZZ IN"
     pbp_quarters.loc[pbp_quarters["playerOut"], "PLAYTYPE"] = "ZZ OUT"
 
+    # the string columns repeat a handful of values over hundreds of rows
+    for x in ["CODETEAM", "PLAYER_ID", "PLAYTYPE", "PLAYER"]:
+        pbp_quarters[x] = pbp_quarters[x].astype("category")
+
     return pbp_quarters.reset_index(drop=True)
 
 
-def make_players_df(players_data: list):
-    return pd.DataFrame.from_records(players_data).reset_index(drop=True)
+def make_players_df(players_data: dict):
+    return pd.DataFrame(players_data)
 
 
 def make_points_df(points: dict):
-    return pd.DataFrame.from_records(points.get("Rows"))
+    return pd.DataFrame(points)
 
 
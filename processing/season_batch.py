@@ -0,0 +1,280 @@
+import numpy as np
+import pandas as pd
+
+from processing.game_data import GameData
+from processing.lineups import frame_membership, lineup_membership, membership_totals
+from processing.play_flags import BOX_STAT_KEYS, REPLACE_DICT, decode_flags, playtype_flags
+
+LINEUP_KEYS = ["duration"] + BOX_STAT_KEYS
+
+
+class SeasonBatch:
+    # a whole season on one stacked table, only the stints are found game by game, the team views of every game are
+    # then stacked and keyed by frame, home teams first, and the stat flags, lineups, team stats and box scores run
+    # as grouped operations over the season, giving the same frames as the SeasonData.concatenate_* methods
+
+    def __init__(self, season):
+        self.season = season
+        self.game_count = 0
+        self.game_codes = []
+
+        self.frames = []
+        self.frame_info = []
+        self.stint_strings = []
+        self.rosters = []
+        self.points = []
+
+        self.player_data: pd.DataFrame
+        self.lineup_data: pd.DataFrame
+        self.team_data: pd.DataFrame
+        self.points_data: pd.DataFrame
+        self.assists_data: pd.DataFrame
+
+    def add_game(self, game):
+        views = {}
+        for home in [True, False]:
+            pbp = game.get_lineups(home)
+            stints = game.stints_home if home else game.stints_away
+            time = pbp["time"].to_numpy()
+            views[home] = pbp, stints, time, game.game_epochs(time, stints)
+
+        for home in [True, False]:
+            pbp, stints, time, game_epochs = views[home]
+            opp_epochs = views[not home][3]
+
+            # epoch is the row's epoch for its own lineups, opp_epoch the one it is summed under for the opponent's
+            self.frames.append(pd.DataFrame({"game": self.game_count,
+                                             "away": not home,
+                                             "position": np.arange(len(time)),
+                                             "time": time,
+                                             "PLAYER_ID": pbp["PLAYER_ID"].astype(object),
+                                             "PLAYTYPE": pbp["PLAYTYPE"].astype(object),
+                                             "duration": np.diff(time, prepend=0),
+                                             "stint": len(self.stint_strings) + stints.row_stint,
+                                             "epoch": GameData.epoch_index(time, game_epochs),
+                                             "opp_epoch": GameData.epoch_index(time, opp_epochs)}))
+            self.stint_strings.extend("; ".join(x) for x in stints.lineups())
+
+            epoch_labels = pd.IntervalIndex.from_breaks(game_epochs).astype(str).to_numpy(dtype=object)
+            self.frame_info.append({"game": self.game_count,
+                                    "away": not home,
+                                    "CODETEAM": game.home_team if home else game.away_team,
+                                    "OPP": game.away_team if home else game.home_team,
+                                    "game_code": game.game_code,
+                                    "team_name": game.home_team_name if home else game.away_team_name,
+                                    "epoch_labels": np.append(epoch_labels, "nan")})
+
+            players = game.home_players if home else game.away_players
+            self.rosters.append(players[["ac", "na", "p", "im"]].assign(game=self.game_count, away=not home))
+
+        points = game.points.copy()
+        points["game"] = self.game_count
+        points["home_team"] = game.home_team
+        points["away_team"] = game.away_team
+        self.points.append(points)
+
+        self.game_codes.append(game.game_code)
+        self.game_count += 1
+
+    def frame_of(self, df):
+        return df["away"].astype(int).to_numpy() * self.game_count + df["game"].to_numpy()
+
+    def opp_frame(self, frame):
+        return (frame + self.game_count) % (2 * self.game_count)
+
+    def process(self):
+        info = pd.DataFrame(self.frame_info)
+        info = info.iloc[np.argsort(self.frame_of(info), kind="stable")].reset_index(drop=True)
+
+        pbp = pd.concat(self.frames, ignore_index=True)
+        pbp["frame"] = self.frame_of(pbp)
+        pbp = pbp.sort_values("frame", kind="stable").reset_index(drop=True)
+        pbp["CODETEAM"] = info["CODETEAM"].to_numpy()[pbp["frame"].to_numpy()]
+        pbp["OPP"] = info["OPP"].to_numpy()[pbp["frame"].to_numpy()]
+
+        rosters = pd.concat(self.rosters, ignore_index=True)
+        rosters["frame"] = self.frame_of(rosters)
+        rosters = rosters.sort_values("frame", kind="stable").reset_index(drop=True)
+
+        pbp["PLAYTYPE"] = pbp["PLAYTYPE"].replace(REPLACE_DICT)
+        pbp["flags"] = playtype_flags(pbp["PLAYTYPE"])
+        flags, pos, assisting_player = GameData.extra_stats(pbp, "frame")
+        pbp["flags"] = flags
+        pbp["pos"] = pos
+        pbp["assisting_player"] = assisting_player
+
+        lineups = self.lineup_stats(pbp, info)
+        team_stats = self.team_stats(lineups, info)
+        players = self.player_stats(pbp, lineups, info, rosters)
+        assists = self.assist_data(pbp, info, rosters)
+
+        # names of the lineups are rendered once per lineup and frame, with the frame's roster like replace_player_ids
+        frame_names = [{} for _ in range(info.shape[0])]
+        for frame, ac, na in zip(rosters["frame"], rosters["ac"], rosters["na"]):
+            frame_names[frame][ac] = na
+        lineup_keys = lineups[["frame", "lineups_string"]].drop_duplicates()
+        lineup_names = pd.Series(
+            ["; ".join(frame_names[x].get(z, z) for z in y.split("; ")).title()
+             for x, y in zip(lineup_keys["frame"], lineup_keys["lineups_string"])],
+            index=pd.MultiIndex.from_frame(lineup_keys), dtype=object)
+        lineups["lineups"] = lineup_names.reindex(
+            pd.MultiIndex.from_frame(lineups[["frame", "lineups_string"]])).to_numpy()
+
+        self.lineup_data = self.drop_frame(lineups)
+        self.lineup_data["season"] = self.season
+        self.team_data = team_stats
+        self.team_data["season"] = self.season
+        self.player_data = self.drop_frame(players)
+        self.player_data["season"] = self.season
+        self.assists_data = assists
+        self.points_data = self.points_stats()
+
+    @staticmethod
+    def drop_frame(df):
+        # rows are numbered per frame like the frames of a single game
+        df.index = df.groupby("frame").cumcount().to_numpy()
+        return df.drop(columns="frame")
+
+    def lineup_stats(self, pbp, info):
+        stat_dict = {x: "sum" for x in LINEUP_KEYS}
+
+        lineup_codes, lineup_strings = pd.factorize(np.array(self.stint_strings, dtype=object), sort=True)
+        pbp["lineup"] = lineup_codes[pbp["stint"].to_numpy()]
+
+        values = decode_flags(pbp, LINEUP_KEYS)
+        df = values.groupby([pbp[x] for x in ["frame", "epoch", "lineup", "CODETEAM", "OPP"]]).agg(
+            stat_dict).reset_index()
+        df = df.loc[df["duration"] != 0, :].reset_index(drop=True)
+
+        # the opponent's rows summed under this frame's epochs, epochs without opponent plays stay empty
+        opp_frame = pd.Series(self.opp_frame(pbp["frame"].to_numpy()), name="frame")
+        df_opp = values.groupby([opp_frame, pbp["opp_epoch"].rename("epoch")]).agg(stat_dict)
+        df_opp = df_opp.reindex(pd.MultiIndex.from_frame(df[["frame", "epoch"]])).rename(
+            columns={x: f"opp_{x}" for x in LINEUP_KEYS}).reset_index(drop=True)
+
+        label_counts = info["epoch_labels"].map(len).to_numpy()
+        label_offsets = np.cumsum(label_counts) - label_counts
+        frame = df["frame"].to_numpy()
+        epoch = df["epoch"].to_numpy()
+        labels = np.concatenate(info["epoch_labels"].to_list())
+        df["epoch"] = labels[label_offsets[frame] + np.where(epoch < 0, label_counts[frame] - 1, epoch)]
+        df["lineup"] = lineup_strings[df["lineup"].to_numpy()]
+        df = df.rename(columns={"epoch": "game_epochs", "lineup": "lineups_string"})
+
+        df = pd.concat([df, df_opp], axis=1)
+        df["game_code"] = info["game_code"].to_numpy()[frame]
+        return df
+
+    def team_stats(self, lineups, info):
+        stats = lineups.drop(columns=["game_epochs", "lineups_string"]).groupby(
+            ["frame", "CODETEAM", "OPP"]).agg(sum).reset_index()
+        frame = stats["frame"].to_numpy()
+
+        stats["points_scored"] = stats["FTM"] + 2 * stats["2FGM"] + 3 * stats["3FGM"]
+        stats["opp_points_scored"] = stats.set_index("frame")["points_scored"].reindex(
+            self.opp_frame(frame)).to_numpy()
+        stats["win"] = (stats["points_scored"] > stats["opp_points_scored"]).astype(int)
+        stats["home"] = frame < self.game_count
+
+        GameData.team_ratios(stats)
+        stats["team_name"] = info["team_name"].to_numpy()[frame]
+        stats["game_code"] = info["game_code"].to_numpy()[frame]
+
+        # home and away rows of each game next to each other, like concatenating the games' team_stats
+        stats = stats.iloc[np.lexsort((frame >= self.game_count, frame % self.game_count))]
+        stats.index = np.zeros(stats.shape[0], dtype=np.int64)
+        return stats.drop(columns="frame")
+
+    def player_stats(self, pbp, lineups, info, rosters):
+        stat_dict = {x: "sum" for x in BOX_STAT_KEYS}
+        stat_keys_extended = ["duration"] + BOX_STAT_KEYS + [f"opp_{x}" for x in BOX_STAT_KEYS]
+        stat_keys_off = BOX_STAT_KEYS + ["opp_pos", "opp_2FGM", "opp_3FGM", "opp_FTM"]
+
+        df = decode_flags(pbp, BOX_STAT_KEYS).groupby([pbp[x] for x in ["frame", "PLAYER_ID", "CODETEAM", "OPP"]]).agg(
+            stat_dict).reset_index()
+        df = df.loc[df["PLAYER_ID"] != "", :]
+
+        # on court totals of every player of the season in one product, off court totals are the rest of the
+        # player's frame
+        frame_count = info.shape[0]
+        player_frames = df["frame"].to_numpy()
+        player_ids = df["PLAYER_ID"].to_numpy()
+        lineup_frames = lineups["frame"].to_numpy()
+
+        membership = lineup_membership(player_ids, lineups["lineups_string"], player_frames, lineup_frames)
+        lineup_count = np.asarray(membership.sum(axis=1)).ravel()
+        frame_rows = np.bincount(lineup_frames, minlength=frame_count)[player_frames]
+        on_court = lineup_count > 0
+        some_off = on_court & (lineup_count < frame_rows)
+        off_membership = frame_membership(player_frames, lineup_frames, frame_count) - membership
+
+        player_df_list = membership_totals(membership[on_court], lineups[stat_keys_extended], player_ids[on_court])
+        player_df_list.insert(0, "frame", player_frames[on_court])
+        player_df_list_off = membership_totals(off_membership[some_off], lineups[stat_keys_off],
+                                               player_ids[some_off])
+        player_df_list_off.insert(0, "frame", player_frames[some_off])
+
+        player_df_list = player_df_list.rename(columns={x: f"team_{x}" for x in BOX_STAT_KEYS})
+        player_df_list_off = player_df_list_off.rename(columns={x: f"off_{x}" for x in stat_keys_off})
+
+        df = df.merge(player_df_list, how="left", on=["frame", "PLAYER_ID"])
+        for x in BOX_STAT_KEYS:
+            if x != "tech_ft":
+                df[f"{x}_ratio"] = df[x] / df[f"team_{x}"]
+        df = df.merge(player_df_list_off, how="left", on=["frame", "PLAYER_ID"])
+
+        frame = df["frame"].to_numpy()
+        df["pts"] = df["FTM"] + 2 * df["2FGM"] + 3 * df["3FGM"]
+        df["off_pts"] = df["off_FTM"] + 2 * df["off_2FGM"] + 3 * df["off_3FGM"]
+        df["team_pts"] = df["team_FTM"] + 2 * df["team_2FGM"] + 3 * df["team_3FGM"]
+        df["opp_pts"] = df["opp_FTM"] + 2 * df["opp_2FGM"] + 3 * df["opp_3FGM"]
+        df["plus_minus"] = df["team_pts"] - df["opp_pts"]
+        df["game_code"] = info["game_code"].to_numpy()[frame]
+        df["home"] = frame < self.game_count
+        df = df.loc[df["PLAYER_ID"].str.match("^P"), :]
+        GameData.player_ratings(df)
+
+        df["playerName"] = self.player_names(rosters, df["frame"], df["PLAYER_ID"])
+        return df.merge(rosters[["frame", "ac", "p", "im"]], how="left", left_on=["frame", "PLAYER_ID"],
+                        right_on=["frame", "ac"])
+
+    @staticmethod
+    def player_names(rosters, frames, player_ids):
+        # the last roster entry of an id wins, like the dictionaries of replace_player_ids
+        names = rosters.drop_duplicates(["frame", "ac"], keep="last").set_index(["frame", "ac"])["na"]
+        return names.reindex(pd.MultiIndex.from_arrays([frames, player_ids])).str.title().to_numpy()
+
+    def assist_data(self, pbp, info, rosters):
+        df = pbp.loc[pbp["assisting_player"].notna(),
+                     ["frame", "position", "PLAYER_ID", "assisting_player", "CODETEAM", "PLAYTYPE", "time"]]
+        frame = df["frame"].to_numpy()
+
+        df["OPP"] = info["OPP"].to_numpy()[frame]
+        df["game_code"] = info["game_code"].to_numpy()[frame]
+        df["season"] = self.season
+        df.loc[:, "assisting_player"] = df["assisting_player"].str.replace(" ", "")
+        df["home"] = frame < self.game_count
+        df["playerName"] = self.player_names(rosters, df["frame"], df["PLAYER_ID"])
+        df["playerNameAssisting"] = self.player_names(rosters, df["frame"], df["assisting_player"])
+
+        # rows keep their position in the team's play-by-play as index
+        df.index = df.pop("position").to_numpy()
+        return df.drop(columns="frame")
+
+    def points_stats(self):
+        df = pd.concat(self.points)
+        df["season"] = self.season
+        df.loc[:, "TEAM"] = df["TEAM"].str.replace(" ", "")
+        df.loc[:, "ID_PLAYER"] = df["ID_PLAYER"].str.replace(" ", "")
+        df["OPP"] = np.where(df["TEAM"] == df["home_team"], df["away_team"], df["home_team"])
+        df["missed"] = df["ID_ACTION"].isin(["2FGA", "3FGA"])
+        home = (df["TEAM"] == df["home_team"]).to_numpy()
+        game_codes = np.array(self.game_codes)[df["game"].to_numpy()]
+
+        df = df[["ID_PLAYER", "TEAM", "OPP", "season", "PLAYER", "ID_ACTION", "COORD_X", "COORD_Y", "ZONE",
+                 "missed"]].copy()
+        df.loc[:, "game_code"] = game_codes
+        df["x_new"] = df["COORD_X"] * 416 / 1500 + 218
+        df["y_new"] = df["COORD_Y"] * 776 / 2800 + 56
+        df["home"] = home
+        return df.loc[~df["ID_ACTION"].isin(["FTM", "FTA"]), :]
@@ -0,0 +1,130 @@
+import math
+
+import numpy as np
+
+DEFAULT_K = 200
+
+
+def k_for_error(error):
+    # normalized rank error of a kll sketch is about 2.296 / k^0.9723, this is its inverse
+    return max(8, math.ceil((2.296 / error) ** (1 / 0.9723)))
+
+
+class QuantileSketch:
+    # kll sketch, level h holds values of weight 2^h, a level over its capacity is sorted and every other value moves
+    # one level up, so about 3k values are kept whatever the count, sketches of any sizes can be merged
+
+    def __init__(self, k=DEFAULT_K, seed=None):
+        self.k = k
+        self.count = 0
+        self.min = np.nan
+        self.max = np.nan
+        self.levels = [np.array([], dtype=float)]
+        self.rng = np.random.default_rng(seed)
+
+    @classmethod
+    def with_error(cls, error, seed=None):
+        return cls(k_for_error(error), seed)
+
+    def error(self):
+        # rank error bound, holds with high probability
+        return 2.296 / self.k ** 0.9723
+
+    def capacity(self, level):
+        return max(2, math.ceil(self.k * (2 / 3) ** (len(self.levels) - level - 1)))
+
+    def update(self, values):
+        # nan values are skipped as in Series.quantile and rank
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values) > 0:
+            self.min = np.fmin(self.min, values.min())
+            self.max = np.fmax(self.max, values.max())
+
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.count += len(values)
+        self.compress()
+        return self
+
+    def merge(self, other):
+        # levels of the same weight are stacked, the merged sketch keeps the larger error of the two
+        for idx, x in enumerate(other.levels):
+            if idx == len(self.levels):
+                self.levels.append(np.array([], dtype=float))
+            self.levels[idx] = np.concatenate([self.levels[idx], x])
+
+        self.k = min(self.k, other.k)
+        self.count += other.count
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        self.compress()
+        return self
+
+    def compress(self):
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) <= self.capacity(level):
+                level += 1
+                continue
+
+            if level + 1 == len(self.levels):
+                self.levels.append(np.array([], dtype=float))
+
+            # an odd value out stays behind, half of the rest picked at a random offset carries double weight up
+            values = np.sort(self.levels[level])
+            odd = len(values) % 2
+            self.levels[level] = values[:odd]
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1],
+                                                     values[odd + self.rng.integers(2)::2]])
+            # capacities shrink when a level is added, so the lower levels are checked again
+            level = 0
+
+    def weighted(self):
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(x), 2 ** idx, dtype=np.int64) for idx, x in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        return values[order], np.cumsum(weights[order])
+
+    def quantile(self, q):
+        # linear interpolation between the values at the positions either side of q * (count - 1), as Series.quantile
+        # does, every kept value takes up as many positions as its weight, q can be an array, the minimum and maximum
+        # are exact
+        if self.count == 0:
+            return np.full(np.shape(q), np.nan)
+
+        q = np.asarray(q, dtype=float)
+        values, cum_weights = self.weighted()
+        position = np.clip(q, 0, 1) * (cum_weights[-1] - 1)
+        lower, upper = np.floor(position), np.ceil(position)
+        lower_value = values[np.minimum(np.searchsorted(cum_weights, lower, side="right"), len(values) - 1)]
+        upper_value = values[np.minimum(np.searchsorted(cum_weights, upper, side="right"), len(values) - 1)]
+        values = np.where(upper > lower, lower_value + (position - lower) * (upper_value - lower_value), lower_value)
+        return np.where(q <= 0, self.min, np.where(q >= 1, self.max, values))
+
+    def rank(self, value):
+        # share of the values up to the average position of the values equal to value, ties get the mean of their
+        # ranks as in Series.rank(pct=True), a value not in the sketch gets the share of values below it, value can be
+        # an array
+        if self.count == 0:
+            return np.full(np.shape(value), np.nan)
+
+        values, cum_weights = self.weighted()
+        value = np.asarray(value, dtype=float)
+        left = np.searchsorted(values, value, side="left")
+        right = np.searchsorted(values, value, side="right")
+        below = np.where(left > 0, cum_weights[np.maximum(left - 1, 0)], 0)
+        equal = np.where(right > 0, cum_weights[np.maximum(right - 1, 0)], 0) - below
+        return np.where(equal > 0, below + (equal + 1) / 2, below) / cum_weights[-1]
+
+    def to_dict(self):
+        return {"k": self.k, "count": self.count, "min": float(self.min), "max": float(self.max),
+                "levels": [x.tolist() for x in self.levels]}
+
+    @classmethod
+    def from_dict(cls, data, seed=None):
+        sketch = cls(data["k"], seed)
+        sketch.count = data["count"]
+        sketch.min = data["min"]
+        sketch.max = data["max"]
+        sketch.levels = [np.array(x, dtype=float) for x in data["levels"]]
+        return sketch
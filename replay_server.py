@@ -0,0 +1,191 @@
+import argparse
+import hashlib
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+from el_api_wrapper import ELAPI, RateLimiter
+from season_store import atomic_write
+
+
+class FixtureStore:
+    # recorded response bodies, one file per (path, query) pair, live games keep numbered snapshots next to it
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def key(path, params):
+        query = urlencode(sorted((str(x), str(y)) for x, y in params.items()))
+        return f"{path.strip('/')}?{query}"
+
+    def file_path(self, path, params, snapshot=0):
+        digest = hashlib.sha1(self.key(path, params).encode()).hexdigest()
+        suffix = f".{snapshot}" if snapshot > 0 else ""
+        return os.path.join(self.path, f"{digest}{suffix}.json")
+
+    def put(self, path, params, body, snapshot=0):
+        atomic_write(self.file_path(path, params, snapshot), body)
+
+    def get(self, path, params, snapshot=0):
+        # the latest snapshot at or before the requested one, a response that never changed only has snapshot 0
+        for x in range(snapshot, -1, -1):
+            file_path = self.file_path(path, params, x)
+            if os.path.exists(file_path):
+                with open(file_path, "rb") as file:
+                    return file.read()
+
+        return None
+
+
+class ReplayServer:
+    # serves recorded fixtures under /api/ and /feeds/, the same layout ELAPI records them with
+
+    def __init__(self, store, host="127.0.0.1", port=0, latency=0.0, error_rate=0.0, rate_limit=None, seed=None):
+        self.store = store
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.random = random.Random(seed)
+        self.snapshot = 0
+
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "served": 0, "errors": 0, "throttled": 0, "missing": 0}
+
+        self.httpd = ThreadingHTTPServer((host, port), self.handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def client_urls(self):
+        return {"root_url": f"{self.url}api/", "feeds_url": f"{self.url}feeds/"}
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def advance(self):
+        # moves live games on to their next recorded snapshot
+        with self.lock:
+            self.snapshot += 1
+
+    def advance_every(self, interval):
+        def advance_loop():
+            while True:
+                time.sleep(interval)
+                self.advance()
+
+        threading.Thread(target=advance_loop, daemon=True).start()
+
+    def inject_error(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def respond(self, path, params):
+        self.count("requests")
+
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        if self.rate_limiter is not None:
+            wait = self.rate_limiter.try_acquire()
+            if wait > 0:
+                self.count("throttled")
+                return 429, b"", {"Retry-After": f"{wait:.3f}"}
+
+        if self.inject_error():
+            self.count("errors")
+            return 503, b"", {}
+
+        body = self.store.get(path, params, self.snapshot)
+        if body is None:
+            self.count("missing")
+            return 404, b"", {}
+
+        self.count("served")
+        return 200, body, {"Content-Type": "application/json"}
+
+    def handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                status, body, headers = server.respond(url.path, dict(parse_qsl(url.query, keep_blank_values=True)))
+
+                self.send_response(status)
+                for key, val in headers.items():
+                    self.send_header(key, val)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+
+    record_parser = subparsers.add_parser("record", help="download a season and store every response as a fixture")
+    record_parser.add_argument("season", type=int)
+    record_parser.add_argument("fixtures", help="fixture directory")
+    record_parser.add_argument("--workers", type=int, default=1)
+
+    serve_parser = subparsers.add_parser("serve", help="serve recorded fixtures")
+    serve_parser.add_argument("fixtures", help="fixture directory")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8000)
+    serve_parser.add_argument("--latency", help="seconds added to every response", type=float, default=0.0)
+    serve_parser.add_argument("--error-rate", help="share of requests answered with a 503", type=float, default=0.0)
+    serve_parser.add_argument("--rate-limit", help="requests per second before answering 429", type=float,
+                              default=None)
+    serve_parser.add_argument("--seed", type=int, default=None)
+    serve_parser.add_argument("--advance-every", help="seconds between live game snapshots", type=float,
+                              default=None)
+
+    args = parser.parse_args()
+
+    if args.mode == "record":
+        el = ELAPI(max_workers=args.workers, recorder=FixtureStore(args.fixtures))
+        games = el.get_season_stats(args.season)
+        print(f"recorded {len(games)} games of season {args.season} into {args.fixtures}")
+
+    else:
+        server = ReplayServer(FixtureStore(args.fixtures), args.host, args.port, args.latency, args.error_rate,
+                              args.rate_limit, args.seed)
+        print(f"serving {args.fixtures} on {server.url}, point ELAPI at {server.client_urls()}")
+        if args.advance_every is not None:
+            server.advance_every(args.advance_every)
+        try:
+            server.httpd.serve_forever()
+        except KeyboardInterrupt:
+            server.stop()
@@ -0,0 +1,114 @@
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from processing import decoding
+
+
+class CachePolicy:
+    # finished games never change so their responses are pinned, everything else expires after a ttl
+
+    def __init__(self, live_ttl=60, schedule_ttl=6 * 3600, max_entries=None):
+        self.live_ttl = live_ttl
+        self.schedule_ttl = schedule_ttl
+        self.max_entries = max_entries
+
+    def is_fresh(self, endpoint, stored_at, final, game_final, now):
+        if final:
+            return True
+
+        # an entry stored while the game was live is stale as soon as the game is known to be over
+        if game_final:
+            return False
+
+        ttl = self.schedule_ttl if endpoint == "games" else self.live_ttl
+        return now - stored_at < ttl
+
+    def to_evict(self, entries, now):
+        # entries are (rowid, endpoint, stored_at, final), returns the rowids to drop
+        expired = [x[0] for x in entries if not self.is_fresh(x[1], x[2], x[3], False, now)]
+
+        if self.max_entries is None:
+            return expired
+
+        expired_set = set(expired)
+        remaining = sorted([x for x in entries if (x[0] not in expired_set) and not x[3]], key=lambda x: x[2])
+        overflow = len(entries) - len(expired) - self.max_entries
+
+        return expired + [x[0] for x in remaining[:max(overflow, 0)]]
+
+
+class ResponseCache:
+
+    def __init__(self, path="el_api_cache.sqlite", policy=None):
+        self.path = path
+        self.policy = policy if policy is not None else CachePolicy()
+
+        self.lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                endpoint TEXT NOT NULL,
+                season INTEGER NOT NULL,
+                game INTEGER NOT NULL,
+                team TEXT NOT NULL,
+                stored_at REAL NOT NULL,
+                final INTEGER NOT NULL,
+                payload BLOB NOT NULL,
+                PRIMARY KEY (endpoint, season, game, team)
+            )""")
+        self.conn.commit()
+
+    def get(self, endpoint, season, game=0, team=""):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT stored_at, final, payload FROM responses WHERE endpoint=? AND season=? AND game=? AND team=?",
+                (endpoint, season, int(game), team)).fetchone()
+
+            fresh = (row is not None) and self.policy.is_fresh(endpoint, row[0], bool(row[1]),
+                                                               self.game_is_final(season, game), time.time())
+            if fresh:
+                self.hits[endpoint] += 1
+                return decoding.loads(row[2])
+
+            self.misses[endpoint] += 1
+            return None
+
+    def put(self, endpoint, season, game, team, payload, final):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                              (endpoint, season, int(game), team, time.time(), int(final), decoding.dumps(payload)))
+            self.conn.commit()
+
+    def game_is_final(self, season, game):
+        row = self.conn.execute(
+            "SELECT final FROM responses WHERE endpoint='Header' AND season=? AND game=? AND team=''",
+            (season, int(game))).fetchone()
+        return (row is not None) and bool(row[0])
+
+    def is_final(self, season, game):
+        with self.lock:
+            return self.game_is_final(season, game)
+
+    def prune(self):
+        with self.lock:
+            entries = self.conn.execute("SELECT rowid, endpoint, stored_at, final FROM responses").fetchall()
+            evict = self.policy.to_evict(entries, time.time())
+            self.conn.executemany("DELETE FROM responses WHERE rowid=?", [(x,) for x in evict])
+            self.conn.commit()
+
+        return len(evict)
+
+    def report(self):
+        endpoints = sorted(set(self.hits) | set(self.misses))
+        for x in endpoints:
+            print(f"cache {x}: {self.hits[x]} hits, {self.misses[x]} misses")
+        print(f"cache total: {sum(self.hits.values())} hits, {sum(self.misses.values())} misses")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,103 @@
+import gzip
+import os
+import pickle
+import tempfile
+
+from processing import decoding
+
+
+def atomic_write(path, data, compress=False):
+    # write next to the target and swap it in, readers never see a half written file
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", dir=os.path.dirname(os.path.abspath(path)))
+
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(gzip.compress(data) if compress else data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def games_to_sync(stored_games, max_game_count):
+    # stored_games maps game codes to their final flag
+    return [x for x in range(1, max_game_count + 1) if not stored_games.get(x, False)]
+
+
+class SeasonStore:
+    # one gzipped json file per game plus a manifest, the manifest is only rewritten after the game files are in place,
+    # every write of a game bumps its revision so a processed state knows which games changed since it was saved
+
+    def __init__(self, season, root="."):
+        self.season = season
+        self.path = os.path.join(root, f"season_{season}")
+        self.legacy_path = os.path.join(root, f"season_{season}.json")
+        self.manifest_path = os.path.join(self.path, "manifest.json")
+        self.state_path = os.path.join(self.path, "state.pkl.gz")
+
+        os.makedirs(self.path, exist_ok=True)
+        self.manifest = self.read_manifest()
+
+        if (len(self.manifest["games"]) == 0) & os.path.exists(self.legacy_path):
+            self.migrate_legacy()
+
+    def read_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {"season": self.season, "games": {}}
+
+        with open(self.manifest_path, "rb") as file:
+            return decoding.loads(file.read())
+
+    def game_path(self, game_code):
+        return os.path.join(self.path, f"game_{game_code}.json.gz")
+
+    def stored_games(self):
+        return {int(x): y["final"] for x, y in self.manifest["games"].items()}
+
+    def game_revisions(self):
+        return {int(x): y.get("revision", 0) for x, y in self.manifest["games"].items()}
+
+    def write_games(self, games_list):
+        for game_dict in games_list:
+            atomic_write(self.game_path(game_dict["game_code"]), decoding.dumps(game_dict), compress=True)
+
+            # files written before the final flag existed only ever held complete downloads
+            game_code = str(game_dict["game_code"])
+            revision = self.manifest["games"].get(game_code, {}).get("revision", 0) + 1
+            self.manifest["games"][game_code] = {"final": game_dict.get("final", True), "revision": revision}
+
+        atomic_write(self.manifest_path, decoding.dumps(self.manifest))
+
+    def iter_games(self, game_codes=None):
+        game_codes = self.stored_games() if game_codes is None else game_codes
+        for game_code in sorted(game_codes):
+            with gzip.open(self.game_path(game_code), "rb") as file:
+                yield decoding.loads(file.read())
+
+    def write_state(self, state):
+        # the processed season, only ever read back by the same code base, written after the season is processed
+        atomic_write(self.state_path, pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL), compress=True)
+
+    def read_state(self):
+        # None when there is no state or it was written by code it no longer loads with
+        if not os.path.exists(self.state_path):
+            return None
+
+        try:
+            with gzip.open(self.state_path, "rb") as file:
+                return pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+
+    def __len__(self):
+        return len(self.manifest["games"])
+
+    def migrate_legacy(self):
+        with open(self.legacy_path, "rb") as file:
+            season_games_list = decoding.loads(file.read())
+
+        self.write_games(season_games_list)
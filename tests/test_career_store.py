@@ -0,0 +1,51 @@
+import tempfile
+import unittest
+
+import pandas as pd
+
+from career_store import CareerStore
+from processing.game_data import process_game
+from test_season_aggregates import aggregated_season
+from test_season_batch import make_game
+
+
+def finished_season(season, games):
+    # the handmade games are far too short for the 1800 seconds cutoff
+    season_instance = aggregated_season([process_game(make_game(*x) | {"season": season}) for x in games], season)
+    season_instance.calculate_per_season_based(min_duration=0)
+    season_instance.get_percentile_ranks(min_duration=0)
+    return season_instance
+
+
+class CareerStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.store = CareerStore(self.root.name)
+        self.seasons = [finished_season(2021, [(1, "MAD", "BAR"), (2, "PAN", "OLY")]),
+                        finished_season(2022, [(1, "MAD", "OLY")])]
+        for x in self.seasons:
+            self.store.write_season(x)
+
+    def tearDown(self):
+        self.root.cleanup()
+
+    def test_single_season_matches_season_aggregates(self):
+        window = self.store.combine([2021], view="team", min_duration=0)
+        season_agg = self.seasons[0].player_data_agg
+
+        pd.testing.assert_frame_equal(window.player_data_agg[season_agg.columns], season_agg, check_dtype=False)
+
+    def test_career_sums_seasons(self):
+        window = self.store.combine(view="career")
+        career = window.player_data_agg.set_index("PLAYER_ID")
+
+        self.assertEqual(self.store.seasons(), [2021, 2022])
+        self.assertEqual(career.loc["P1", "game_count"], 3)
+        self.assertEqual(career.loc["P1", "CODETEAM"], "MAD")
+        self.assertEqual(career.loc["P1", "season_count"], 2)
+        self.assertEqual(window.team_data_agg.set_index("CODETEAM").loc["OLY", "game_count"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+
+import pymongo
+
+from processing.db_connection import MongoConnectionSeason
+from processing.game_data import process_game
+from test_season_aggregates import aggregated_season
+from test_season_batch import make_game
+
+
+def matches(document, query):
+    for key, value in query.items():
+        if isinstance(value, dict):
+            if ("$ne" in value) and (document.get(key) == value["$ne"]):
+                return False
+        elif document.get(key) != value:
+            return False
+    return True
+
+
+class FakeCollection:
+    # the few collection methods insert_season uses, documents are kept per upsert filter
+
+    def __init__(self):
+        self.documents = {}
+
+    def create_index(self, keys):
+        pass
+
+    def bulk_write(self, operations, ordered=True):
+        for x in operations:
+            self.documents[repr(sorted(x._filter.items()))] = x._doc
+
+    def delete_many(self, query):
+        self.documents = {x: y for x, y in self.documents.items() if not matches(y, query)}
+
+    def find_one(self, query):
+        return next((x for x in self.documents.values() if matches(x, query)), None)
+
+    def update_one(self, query, update, upsert=False):
+        document = self.find_one(query)
+        if document is None:
+            document = self.documents[repr(sorted(query.items()))] = dict(query)
+        document.update(update["$set"])
+
+
+class FakeClient(dict):
+
+    def __missing__(self, key):
+        self[key] = FakeDatabase()
+        return self[key]
+
+
+class FakeDatabase(dict):
+
+    def __missing__(self, key):
+        self[key] = FakeCollection()
+        return self[key]
+
+
+class SeasonDocumentsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        season_instance = aggregated_season([process_game(make_game(x, "MAD", "BAR")) for x in [1, 2]])
+        season_instance.concatenate_quantile_data()
+        # nothing is sent before a collection is written to
+        self.conn = MongoConnectionSeason(season_instance, pymongo.MongoClient("mongodb://localhost:1", connect=False))
+
+    def test_upsert_keys_are_unique(self):
+        for name, (documents, keys) in self.conn.season_documents().items():
+            filters = [tuple(str(x[y]) for y in keys) for x in documents]
+            self.assertEqual(len(filters), len(set(filters)), name)
+
+    def test_documents_are_the_same_on_reruns(self):
+        first, second = self.conn.season_documents(), self.conn.season_documents()
+        for name, (documents, keys) in first.items():
+            self.assertEqual([[x[y] for y in keys] for x in documents],
+                             [[x[y] for y in keys] for x in second[name][0]], name)
+
+    def test_reruns_leave_one_copy_of_the_season(self):
+        client = FakeClient()
+        slots = []
+        for _ in range(3):
+            conn = MongoConnectionSeason(self.conn.season_data, client, batch_size=3)
+            written = conn.insert_season()
+            slots.append(conn.live_filter()["slot"])
+
+            for name, (count, seconds) in written.items():
+                documents = list(client["euroleague_dashboard"][name].documents.values())
+                self.assertEqual(len(documents), count, name)
+                self.assertTrue(all(x["slot"] == slots[-1] for x in documents), name)
+
+        self.assertEqual(slots, ["a", "b", "a"])
+
+
+if __name__ == '__main__':
+    unittest.main()
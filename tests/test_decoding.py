@@ -0,0 +1,73 @@
+import unittest
+
+from processing import decoding
+from processing.decoding import GameDecodeError, decode_game
+from test_season_batch import make_game, play
+
+
+class DecodingTestCase(unittest.TestCase):
+
+    def test_game_is_decoded_into_columns(self):
+        game = make_game(7, "MAD", "BAR")
+        plays = game["play_by_play"]["FirstQuarter"]
+        game["play_by_play"] = {"FirstQuarter": plays[:5], "Live": False, "SecondQuarter": plays[5:]}
+        game["points"] = {"Rows": None}
+
+        decoded = decode_game(decoding.loads(decoding.dumps(game)))
+
+        self.assertEqual((decoded["game_code"], decoded["home_team"], decoded["away_team"]), (7, "MAD", "BAR"))
+        self.assertEqual(decoded["play_by_play"]["PLAYTYPE"], [x["PLAYTYPE"] for x in plays])
+        self.assertEqual(decoded["home_players"]["ac"], ["P1", "P2", "P3"])
+        self.assertEqual(decoded["points"], {x: [] for x in decoding.POINTS_SCHEMA.fields})
+
+    def check_error(self, game, endpoint, detail):
+        with self.assertRaises(GameDecodeError) as err:
+            decode_game(game)
+
+        self.assertEqual((err.exception.season, err.exception.game_code, err.exception.endpoint), (2022, 1, endpoint))
+        self.assertIn(detail, str(err.exception))
+
+    def test_malformed_payloads_raise(self):
+        game = make_game(1, "MAD", "BAR")
+        del game["away_players"]
+        self.check_error(game, "game", "missing away_players")
+
+        game = make_game(1, "MAD", "BAR")
+        game["play_by_play"]["FirstQuarter"][3]["MINUTE"] = "1"
+        self.check_error(game, "PlayByPlay", "row 3 field MINUTE is str")
+
+        game = make_game(1, "MAD", "BAR")
+        del game["home_players"][1]["st"]
+        self.check_error(game, "Players", "missing field st")
+
+        game = make_game(1, "MAD", "BAR")
+        game["points"] = {"Rows": ["2FGM"]}
+        self.check_error(game, "Points", "rows are not objects")
+
+        game = make_game(1, "MAD", "BAR")
+        game["points"] = []
+        self.check_error(game, "Points", "expected an object, got list")
+
+        game = make_game(1, "MAD", "BAR")
+        game["play_by_play"] = {"FirstQuarter": []}
+        self.check_error(game, "PlayByPlay", "no plays")
+
+    def test_header(self):
+        self.assertEqual(decoding.decode_header({"CodeTeamA": "MAD", "CodeTeamB": "BAR", "Live": True}, 2022, 1),
+                         {"CodeTeamA": "MAD", "CodeTeamB": "BAR"})
+
+        with self.assertRaises(GameDecodeError):
+            decoding.decode_header({"CodeTeamA": "MAD", "CodeTeamB": None}, 2022, 1)
+        with self.assertRaises(GameDecodeError):
+            decoding.decode_header(-1, 2022, 1)
+
+    def test_play_by_play_rows_keep_period_order(self):
+        plays = {"FirstQuarter": [play("", "", "BP", "", 1)], "ForthQuarter": [play("", "", "EG", "00:00", 40)],
+                 "SecondQuarter": [], "ThirdQuarter": None}
+
+        rows = decoding.play_by_play_rows(plays, 2022, 1)
+        self.assertEqual([x["PLAYTYPE"] for x in rows], ["BP", "EG"])
+
+
+if __name__ == '__main__':
+    unittest.main()
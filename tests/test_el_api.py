@@ -0,0 +1,124 @@
+import json
+import os
+import tempfile
+import unittest
+
+from el_api_wrapper import ELAPI, IncompleteSeasonError
+from processing import decoding
+from replay_server import FixtureStore, ReplayServer
+from test_replay import record_game
+
+
+class CountingServer(ReplayServer):
+    # keeps the highest number of requests it was answering at the same time
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def respond(self, path, params):
+        with self.lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return super().respond(path, params)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+class FailingServer(ReplayServer):
+    # answers every request of one game with a 503
+
+    def __init__(self, *args, failing_game=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failing_game = failing_game
+
+    def respond(self, path, params):
+        if params.get("gamecode") == str(self.failing_game):
+            self.count("errors")
+            return 503, b"", {}
+        return super().respond(path, params)
+
+
+class ELAPITestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fixtures = tempfile.TemporaryDirectory()
+        self.store = FixtureStore(self.fixtures.name)
+
+        for game in range(1, 11):
+            record_game(self.store, 2022, game, f"H{game:02d}", f"A{game:02d}")
+        self.store.put("feeds/competitions/E/seasons/E2022/games", {"phaseTypeCode": "FF"},
+                       json.dumps({"data": [{"code": x} for x in range(1, 11)]}).encode())
+
+    def tearDown(self):
+        self.fixtures.cleanup()
+
+    def test_concurrent_download_matches_serial(self):
+        with CountingServer(self.store, latency=0.02) as server:
+            serial = ELAPI(max_workers=1, **server.client_urls()).get_season_stats(2022)
+        self.assertEqual([x["game_code"] for x in serial], list(range(1, 11)))
+
+        with CountingServer(self.store, latency=0.02) as server:
+            concurrent = ELAPI(max_workers=4, **server.client_urls()).get_season_stats(2022)
+
+        self.assertEqual(concurrent, serial)
+        # more than the four requests of a single game were in flight
+        self.assertGreater(server.peak_in_flight, 4)
+
+    def test_requests_reuse_pooled_connections(self):
+        with ReplayServer(self.store) as server:
+            accepted = []
+            get_request = server.httpd.get_request
+
+            def counting_get_request():
+                accepted.append(1)
+                return get_request()
+
+            server.httpd.get_request = counting_get_request
+            ELAPI(**server.client_urls()).get_season_stats(2022)
+
+        self.assertEqual(server.stats["served"], 51)
+        # one connection per thread of the per game pool, kept alive across games
+        self.assertLessEqual(len(accepted), 8)
+
+    def test_backoff_honours_retry_after_and_its_cap(self):
+        el = ELAPI(backoff_factor=1, backoff_max=4)
+
+        self.assertEqual(el.backoff(0, "0.5"), 0.5)
+        self.assertEqual(el.backoff(0, "120"), 4)
+        self.assertLessEqual(el.backoff(0, "soon"), 1)
+        self.assertTrue(all(0 <= el.backoff(10) <= 4 for _ in range(100)))
+
+    def test_throttled_requests_are_retried(self):
+        with ReplayServer(self.store, rate_limit=20) as server:
+            games = ELAPI(max_workers=4, max_retries=20, **server.client_urls()).get_season_stats(2022)
+
+        self.assertEqual([x["game_code"] for x in games], list(range(1, 11)))
+        self.assertGreater(server.stats["throttled"], 0)
+
+    def test_failing_game_dumps_the_retrieved_games(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as root:
+            os.chdir(root)
+            try:
+                for max_workers in [1, 4]:
+                    with FailingServer(self.store, failing_game=3) as server:
+                        el = ELAPI(max_workers=max_workers, max_retries=2, backoff_factor=0.01,
+                                   **server.client_urls())
+                        with self.assertRaises(IncompleteSeasonError) as err:
+                            el.get_season_stats(2022)
+
+                    self.assertEqual(err.exception.failed_games, [3])
+                    with open("crash_dump.json", "rb") as file:
+                        dumped = decoding.loads(file.read())
+                    self.assertEqual(sorted(x["game_code"] for x in dumped), [1, 2, 4, 5, 6, 7, 8, 9, 10])
+                    os.remove("crash_dump.json")
+            finally:
+                os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    unittest.main()
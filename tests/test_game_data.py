@@ -0,0 +1,367 @@
+import random
+import re
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from processing.decoding import decode_game
+from processing.game_data import GameData
+from processing.play_flags import BOX_STAT_KEYS, EXTRA_KEYS, decode_flags, get_flag
+from test_season_batch import play, player
+
+TEAMS = ["MAD", "BAR", "PAN", "OLY"]
+
+
+def random_game(game_code, seed, glitch_rate=0.05):
+    # a full game of random plays logged in random order within each second, with free throw trips, and-ones,
+    # technicals and substitutions, some of which take off a player who is not on court
+    rng = random.Random(seed)
+    home, away = rng.sample(TEAMS, 2)
+    rosters = {x: [f"P{TEAMS.index(x) * 100 + idx:06d}" for idx in range(10)] for x in [home, away]}
+    on_court = {x: rosters[x][:5] for x in rosters}
+    plays, points = [play("", "", "BP", "", 1)], []
+
+    # the clock moves on with every possession, so a second holds at most a dozen plays, the per second sort of
+    # reference_pbp is only stable up to 16
+    time, offense = 0, home
+    while True:
+        time += rng.randint(1, 20)
+        if time > 2400:
+            break
+        defense = away if offense == home else home
+        shooter, defender = rng.choice(on_court[offense]), rng.choice(on_court[defense])
+        teammate = rng.choice([x for x in on_court[offense] if x != shooter])
+        change = True
+
+        r = rng.random()
+        if r < 0.3:
+            events = [(offense, shooter, rng.choice(["2FGM", "LAYUPMD", "DUNK", "3FGM"]))]
+            if rng.random() < 0.6:
+                events.append((offense, teammate, "AS"))
+            if rng.random() < 0.1:
+                events += [(defense, defender, "CM"), (offense, shooter, "RV"),
+                           (offense, shooter, rng.choice(["FTM", "FTA"]))]
+            elif rng.random() < 0.05:
+                events += [(defense, defender, "CMT"), (offense, shooter, rng.choice(["FTM", "FTA"]))]
+        elif r < 0.55:
+            events = [(offense, shooter, rng.choice(["2FGA", "3FGA", "LAYUPATT"]))]
+            if rng.random() < 0.7:
+                events.append((defense, defender, "D"))
+            else:
+                events.append((offense, teammate, "O"))
+                change = False
+        elif r < 0.7:
+            events = [(defense, defender, "CM"), (offense, shooter, "RV")]
+            events += [(offense, shooter, rng.choice(["FTM", "FTM", "FTA"])) for _ in range(rng.choice([1, 2, 2, 3]))]
+            if rng.random() < 0.3:
+                events.append((offense, teammate, "AS"))
+        elif r < 0.82:
+            events = [(offense, shooter, "TO")] + ([(defense, defender, "ST")] if rng.random() < 0.5 else [])
+        elif r < 0.88:
+            events = [(defense, defender, rng.choice(["CMT", "CMU", "CMD"])),
+                      (offense, shooter, rng.choice(["FTM", "FTA"]))]
+            change = False
+        elif r < 0.92:
+            events = [(offense, shooter, rng.choice(["FTM", "FTA"]))]
+        else:
+            events = [(offense, shooter, "2FGA"), (defense, defender, "FV"), (offense, shooter, "AG"),
+                      (offense, shooter, "OF")]
+
+        if rng.random() < 0.2:
+            team = rng.choice([home, away])
+            count = rng.randint(1, 2)
+            going_out = rng.sample(on_court[team], count)
+            coming_in = rng.sample([x for x in rosters[team] if x not in on_court[team]], count)
+            on_court[team] = [x for x in on_court[team] if x not in going_out] + coming_in
+            if rng.random() < glitch_rate:
+                going_out[0] = rng.choice([x for x in rosters[team] if x not in on_court[team]])
+            events += [(team, x, "OUT") for x in going_out] + [(team, x, "IN") for x in coming_in]
+
+        rng.shuffle(events)
+        quarter = max(1, min(4, (time - 1) // 600 + 1))
+        remaining = quarter * 600 - time
+        for team, player_id, playtype in events:
+            plays.append(play(team, player_id, playtype, f"{remaining // 60:02d}:{remaining % 60:02d}",
+                              min(quarter * 10, time // 60 + 1)))
+            if playtype in ["2FGM", "LAYUPMD", "DUNK", "3FGM", "2FGA", "3FGA", "LAYUPATT"]:
+                points.append({"TEAM": team, "ID_PLAYER": player_id, "PLAYER": player_id, "ID_ACTION": playtype,
+                               "COORD_X": rng.randint(-700, 700), "COORD_Y": rng.randint(-100, 1000), "ZONE": "A"})
+
+        if change:
+            offense = defense
+
+    # a play on the buzzer sorting after EG has to be moved before it
+    plays.append(play(offense, on_court[offense][0], rng.choice(["2FGA", "FTA", "TO"]), "00:00", 40))
+    plays.append(play("", "", "EG", "00:00", 41))
+
+    return {"season": 2022, "game_code": game_code, "home_team": home, "away_team": away,
+            "points": {"Rows": points},
+            "home_players": [player(x, idx < 5) for idx, x in enumerate(rosters[home])],
+            "away_players": [player(x, idx < 5) for idx, x in enumerate(rosters[away])],
+            "play_by_play": {"FirstQuarter": plays}}
+
+
+def as_objects(df):
+    # the reference code ran on plain object columns
+    return df.astype({x: object for x in df.select_dtypes("category").columns})
+
+
+def reference_pbp(play_by_play, team):
+    # GameData.get_pbp before normalize_pbp, it sorted and fixed up the whole play-by-play again on every call
+    play_by_play = play_by_play.groupby("time").apply(lambda x: x.sort_values("PLAYTYPE")).reset_index(drop=True)
+
+    def swap_rows(df, row1, row2):
+        df.iloc[row1, :], df.iloc[row2, :] = df.iloc[row2, :].copy(), df.iloc[row1, :].copy()
+        return df
+
+    if play_by_play.iloc[-1]["PLAYTYPE"] != "EG":
+        idx = play_by_play.index.values[play_by_play["PLAYTYPE"] == "EG"][0]
+        play_by_play = swap_rows(play_by_play, -1, idx).reset_index(drop=True)
+
+    check_team = play_by_play["CODETEAM"].str.contains(team).tolist()
+    return play_by_play, play_by_play.loc[check_team, :].reset_index().rename(columns={"index": "index_pbp"})
+
+
+def reference_extra_stats(pbp):
+    # GameData.extra_stats_finder before the free throw flags were vectorized, run on a frame holding one boolean
+    # column per stat key
+    pbp_sub = pbp.groupby(["time", "PLAYER_ID"]).apply(
+        lambda x: list(x["PLAYTYPE"])).reset_index().rename(columns={0: "PLAYTYPE"})
+
+    def finder(row):
+        if len(row) > 1:
+            multi_ft = sum([bool(re.match("FT", a)) for a in row]) > 1 or (
+                    (sum([bool(re.match("FT", a)) for a in row]) == 1) &
+                    any([bool(re.match("RV", a)) for a in row]) &
+                    all([not (item in row) for item in ["3FGM", "2FGM"]])
+            )
+
+            and_one_2fg = all([item in row for item in ["2FGM", "RV"]]) and (sum(
+                [bool(re.match("FT", a)) for a in row]) == 1)
+            and_one_3fg = all([item in row for item in ["3FGM", "RV"]]) and (sum(
+                [bool(re.match("FT", a)) for a in row]) == 1)
+            tech_ft = (sum([bool(re.match("FT", a)) for a in row]) == 1) & (
+                all([not (item in row) for item in ["3FGM", "2FGM", "RV"]]))
+
+            return {"multi_ft": multi_ft, "and_one_2fg": and_one_2fg, "and_one_3fg": and_one_3fg, "tech_ft": tech_ft}
+        elif (len(row) == 1) & ((row[0] == "FTM") | (row[0] == "FTA")):
+            return {"multi_ft": False, "and_one_2fg": False, "and_one_3fg": False, "tech_ft": True}
+        else:
+            return {"multi_ft": False, "and_one_2fg": False, "and_one_3fg": False, "tech_ft": False}
+
+    pbp_sub["extra_stats"] = pbp_sub["PLAYTYPE"].apply(lambda x: finder(x))
+    pbp_sub2 = pd.json_normalize(pbp_sub["extra_stats"])
+    pbp_sub3 = pbp.loc[pbp["PLAYTYPE"].isin(["2FGM", "3FGM", "AS", "FTM"]), ["PLAYER_ID", "PLAYTYPE", "time"]]
+    pbp_sub3["PLAYTYPE"] = pbp_sub3["PLAYTYPE"].replace({"2FGM": "Two", "3FGM": "Three", "FTM": "FTM", "AS": "AS"})
+
+    pbp_sub3 = pbp_sub3.reset_index()
+    pbp_sub3 = pbp_sub3.groupby("time").apply(lambda x: x.sort_values("PLAYTYPE", ascending=False)).reset_index(
+        drop=True)
+
+    assist_queue = []
+    idx = pbp_sub3.shape[0] - 1
+    pbp_sub3["assisting_player"] = np.nan
+
+    while idx >= 0:
+        if pbp_sub3.loc[:, "PLAYTYPE"].iloc[idx] == "AS":
+            assist_queue.append(pbp_sub3.loc[:, "PLAYER_ID"].iloc[idx])
+        elif len(assist_queue) > 0:
+            if pbp_sub3.loc[idx, "PLAYER_ID"] == assist_queue[0]:
+                pbp_sub3.loc[idx, "assisting_player"] = assist_queue.pop()
+            else:
+                pbp_sub3.loc[idx, "assisting_player"] = assist_queue.pop(0)
+        idx -= 1
+
+    pbp_sub3 = pbp_sub3.set_index("index")
+    pbp_sub3["index_to_fix"] = pbp_sub3.index
+    pbp_sub3 = pbp_sub3.groupby("time").apply(
+        lambda x: x.sort_values("assisting_player", ascending=False)).reset_index(drop=True)
+
+    pbp_sub3 = pbp_sub3.set_index("index_to_fix")
+    pbp_sub3["assisted_2fg"] = (pbp_sub3["PLAYTYPE"] == "Two") & (~pbp_sub3["assisting_player"].isna())
+    pbp_sub3["assisted_3fg"] = (pbp_sub3["PLAYTYPE"] == "Three") & (~pbp_sub3["assisting_player"].isna())
+    pbp_sub3["assisted_ft"] = (pbp_sub3["PLAYTYPE"] == "FTM") & (~pbp_sub3["assisting_player"].isna())
+
+    pbp_sub = pbp_sub.drop("extra_stats", axis=1)
+    pbp_sub = pd.concat([pbp_sub, pbp_sub2], axis=1)
+    pbp_sub = pbp_sub.drop(["PLAYTYPE"], axis=1)
+    mask = pbp.duplicated(["PLAYER_ID", "time"])
+
+    col_names = [str(x) for x in pbp_sub.columns]
+    pbp = pbp.merge(pbp_sub, how="left", on=["time", "PLAYER_ID"])
+    pbp["multi_ft"] = pbp["multi_ft"] & pbp["FTA"]
+    pbp["multi_ft_count"] = pbp["multi_ft"] & pbp["FTA"]
+    pbp.loc[mask, col_names[3:]] = False
+
+    ft_mask = pbp[["multi_ft_count", "time"]].duplicated()
+    pbp.loc[ft_mask, "multi_ft"] = False
+
+    for x in ["assisted_2fg", "assisted_3fg", "assisted_ft"]:
+        pbp[x] = pbp_sub3[x].reindex(pbp.index).fillna(False)
+    pbp["assisting_player"] = pbp_sub3["assisting_player"]
+
+    pbp["pos"] = pbp["multi_ft"].astype(int) + pbp["2FGA"].astype(int) + pbp["3FGA"].astype(int) + pbp["TO"].astype(
+        int) - pbp["O"].astype(int)
+    return pbp
+
+
+def reference_on_off(player_ids, lineup):
+    # on and off court totals of calculate_player_stats before the membership matrix, the lineup strings were
+    # searched with str.contains, which matches the same lineups as the exact match for fixed width ids
+    player_df_list = []
+    player_df_list_off = []
+    for x in player_ids:
+        dfx = lineup.loc[lineup["lineups_string"].str.contains(x), :].copy()
+        dfx_off = lineup.loc[~lineup["lineups_string"].str.contains(x), :].copy()
+
+        if dfx.shape[0] > 0:
+            dfx["PLAYER_ID"] = x
+            dfx_off["PLAYER_ID"] = x
+            player_df_list.append(dfx)
+            player_df_list_off.append(dfx_off)
+
+    stat_keys_extended = BOX_STAT_KEYS + [f"opp_{x}" for x in BOX_STAT_KEYS]
+    stat_keys_extended.insert(0, "duration")
+    stat_keys_off = BOX_STAT_KEYS + ["opp_pos", "opp_2FGM", "opp_3FGM", "opp_FTM"]
+
+    player_df_list = pd.concat(player_df_list, axis=0).groupby("PLAYER_ID").agg(
+        {x: "sum" for x in stat_keys_extended}).reset_index()
+    player_df_list_off = pd.concat(player_df_list_off, axis=0).groupby("PLAYER_ID").agg(
+        {x: "sum" for x in stat_keys_off}).reset_index()
+
+    return (player_df_list.rename(columns={x: f"team_{x}" for x in BOX_STAT_KEYS}),
+            player_df_list_off.rename(columns={x: f"off_{x}" for x in stat_keys_off}))
+
+
+def reference_lineup_frame(pbp, stints):
+    # the play-by-play as the old opp_stat_calculator saw it, with the lineup and stint bounds on every row and one
+    # boolean column per stat key
+    stint_lineups = stints.lineups()
+    df = as_objects(pbp.drop(columns="flags"))
+    df[BOX_STAT_KEYS] = decode_flags(pbp, BOX_STAT_KEYS)
+    df["lineups"] = [stint_lineups[x] for x in stints.row_stint]
+    df["index_left"] = stints.index_left[stints.row_stint]
+    df["index_right"] = stints.index_right[stints.row_stint]
+    return df
+
+
+def reference_opp_stats(df_lineups, df_lineups_opp, team, game_code):
+    # GameData.opp_stat_calculator before the integer epochs, stints were grouped by lineup string and the game
+    # epochs cut with pd.cut
+    df_lineups["CODETEAM"] = team
+    stat_dict = {x: "sum" for x in ["duration"] + BOX_STAT_KEYS}
+
+    df_lineups["lineups_string"] = df_lineups["lineups"].apply(lambda x: "; ".join(x))
+
+    df = df_lineups.groupby(["lineups_string", "CODETEAM", "index_left", "index_right"]).agg(
+        stat_dict).reset_index()
+
+    df["min"] = df.apply(lambda x: df_lineups["time"][x["index_left"]], axis=1)
+    df["max"] = df.apply(lambda x: df_lineups["time"][x["index_right"] - 1], axis=1)
+    df = df.loc[df["min"] != df["max"], :]
+
+    game_epochs = sorted(pd.concat([df["min"], df["max"]]).unique().tolist())
+
+    df_lineups["game_epochs"] = pd.cut(df_lineups["time"], game_epochs).astype(str)
+    df_lineups_opp["game_epochs"] = pd.cut(df_lineups_opp["time"], game_epochs).astype(str)
+
+    df = df_lineups.groupby(["game_epochs", "lineups_string", "CODETEAM", "OPP"]).agg(stat_dict).reset_index()
+    df = df.loc[df["duration"] != 0, :]
+
+    df_opp = df_lineups_opp.groupby("game_epochs").agg(stat_dict).reset_index()
+    df_opp = df_opp.rename(columns={x: f"opp_{x}" for x in stat_dict})
+
+    df = df.merge(df_opp, how="left", on="game_epochs")
+    df["game_code"] = game_code
+    return df
+
+
+class GameDataTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.games = [random_game(x, seed=x, glitch_rate=[0.05, 0.5][x % 2]) for x in range(1, 9)]
+
+    def test_pbp_views_match_reference(self):
+        for x in self.games:
+            game = GameData(**decode_game(x))
+            play_by_play, expected = as_objects(game.play_by_play), {}
+            # the home view was asked for first and sorted the play-by-play the away view started from
+            for home, team in [(True, game.home_team), (False, game.away_team)]:
+                play_by_play, expected[home] = reference_pbp(play_by_play, team)
+
+            for home in [True, False]:
+                pd.testing.assert_frame_equal(as_objects(game.get_pbp(home)), expected[home])
+
+    def test_extra_stats_match_reference(self):
+        for x in self.games:
+            game = GameData(**decode_game(x))
+            game.extract_home_away_lineups()
+            for home in [True, False]:
+                game.stat_calculator(home)
+                pbp = game.pbp_processed_home if home else game.pbp_processed_away
+                flags, pos, assisting_player = GameData.extra_stats(pbp)
+
+                keys = pd.DataFrame({y: get_flag(pbp["flags"].to_numpy(), y) for y in ["FTA", "2FGA", "3FGA", "TO",
+                                                                                        "O"]})
+                expected = reference_extra_stats(pd.concat([as_objects(pbp), keys], axis=1))
+
+                for y in EXTRA_KEYS:
+                    np.testing.assert_array_equal(get_flag(flags, y), expected[y].to_numpy(dtype=bool), y)
+                np.testing.assert_array_equal(pos, expected["pos"])
+                pd.testing.assert_series_equal(assisting_player.astype(object), expected["assisting_player"],
+                                               check_names=False)
+
+    def test_on_off_totals_match_reference(self):
+        for x in self.games:
+            game = GameData(**decode_game(x))
+            game.extract_home_away_lineups()
+            for home in [True, False]:
+                game.stat_calculator(home)
+                game.extra_stats_finder(home)
+            for home in [True, False]:
+                game.opp_stat_calculator(home)
+                game.calculate_player_stats(home)
+
+                players = game.home_players_processed if home else game.away_players_processed
+                on, off = reference_on_off(players["PLAYER_ID"], game.lineups_home if home else game.lineups_away)
+                expected = players[["PLAYER_ID"]].merge(on, how="left", on="PLAYER_ID").merge(off, how="left",
+                                                                                               on="PLAYER_ID")
+                pd.testing.assert_frame_equal(players[expected.columns].reset_index(drop=True), expected)
+
+    def test_lineup_epochs_match_reference(self):
+        for x in self.games:
+            game = GameData(**decode_game(x))
+            game.extract_home_away_lineups()
+            for home in [True, False]:
+                game.stat_calculator(home)
+                game.extra_stats_finder(home)
+
+            frames = {True: reference_lineup_frame(game.pbp_processed_home, game.stints_home),
+                      False: reference_lineup_frame(game.pbp_processed_away, game.stints_away)}
+            for home in [True, False]:
+                game.opp_stat_calculator(home)
+                expected = reference_opp_stats(frames[home], frames[not home],
+                                               game.home_team if home else game.away_team, game.game_code)
+
+                # the old rows came out ordered by epoch label, they are now in the order of the game
+                lineups = game.lineups_home if home else game.lineups_away
+                pd.testing.assert_frame_equal(
+                    lineups.sort_values(["game_epochs", "lineups_string"]).reset_index(drop=True),
+                    expected.sort_values(["game_epochs", "lineups_string"]).reset_index(drop=True))
+
+    def test_lineup_names(self):
+        names = {"P01": "DOE, JOHN", "P02": "ROE, JANE"}
+        lineups_string = pd.Series(["P01; P02", "P02; P77", "P01; P02"])
+
+        # the regex replace this took over from, on ids none of which is the prefix of another
+        expected = lineups_string.replace(names, regex=True).str.title()
+        self.assertEqual(GameData.lineup_names(lineups_string, names).tolist(), expected.tolist())
+
+        # an id that starts with another one keeps its own name
+        self.assertEqual(GameData.lineup_names(pd.Series(["P01; P011"]), dict(names, P011="POE, JIM")).tolist(),
+                         ["Doe, John; Poe, Jim"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from pipeline import save_state, sync_season
+from processing.leaderboards import Leaderboard, LeaderboardIndex
+from season_store import SeasonStore
+from test_pipeline import built_season
+from test_season_batch import make_game
+
+
+def team_table(values):
+    return pd.DataFrame({"CODETEAM": [f"T{x}" for x in range(len(values))],
+                         "conference": ["A", "B"] * (len(values) // 2),
+                         "duration": 2400,
+                         "ORtg": values})
+
+
+class LeaderboardTestCase(unittest.TestCase):
+
+    def test_updates_match_rebuilt_leaderboards(self):
+        rng = np.random.default_rng(1)
+        boards = [Leaderboard("team", "ORtg", k=3), Leaderboard("team", "ORtg", ascending=True, k=3),
+                  Leaderboard("team", "ORtg", group_by="conference", k=2)]
+        df = team_table(rng.normal(110, 5, 40))
+        index = LeaderboardIndex(boards)
+        index.touch("team")
+        index.update({"team": (df, ["CODETEAM"])})
+
+        for _ in range(20):
+            # a few teams change, the best ones included
+            changed = rng.choice(len(df), 4, replace=False)
+            df.loc[changed, "ORtg"] = rng.normal(110, 8, 4)
+            index.touch("team", pd.MultiIndex.from_frame(df.loc[changed, ["CODETEAM"]]))
+            index.update({"team": (df, ["CODETEAM"])})
+
+            for x in boards:
+                expected = x.build(df, ["CODETEAM"])
+                for group, (rows, bound) in expected.items():
+                    pd.testing.assert_frame_equal(index.top(x.name, group), rows.head(x.k))
+
+    def test_documents(self):
+        index = LeaderboardIndex([Leaderboard("team", "ORtg", k=2)])
+        index.touch("team")
+        index.update({"team": (team_table([100.0, 120.0, np.nan, 110.0]), ["CODETEAM"])})
+
+        documents = index.documents(2022)
+        self.assertEqual(len(documents), 1)
+        self.assertEqual([x["CODETEAM"] for x in documents[0]["rows"]], ["T1", "T3"])
+
+    def test_synced_season_updates_leaderboards_in_place(self):
+        with tempfile.TemporaryDirectory() as root:
+            store = SeasonStore(2022, root)
+            store.write_games([make_game(1, "MAD", "BAR"), make_game(2, "PAN", "OLY"), make_game(3, "MAD", "OLY")])
+            save_state(store, built_season(store))
+            store.write_games([make_game(4, "BAR", "PAN"), make_game(2, "OLY", "BAR")])
+
+            with mock.patch.object(Leaderboard, "build", autospec=True, side_effect=Leaderboard.build) as build:
+                synced, game_count = sync_season(store)
+            full = built_season(store)
+
+        # only the leaderboards of season wide metrics are built again
+        self.assertTrue(all(x.args[0].season_wide() for x in build.call_args_list))
+        for x in full.leaderboards.boards:
+            self.assertEqual(set(synced.leaderboards.buffers[x.name]), set(full.leaderboards.buffers[x.name]), x.name)
+            for group in full.leaderboards.buffers[x.name]:
+                pd.testing.assert_series_equal(synced.leaderboards.top(x.name, group)[x.metric],
+                                               full.leaderboards.top(x.name, group)[x.metric])
+        self.assertGreater(len(synced.leaderboards.top("team_ORtg")), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import random
+import unittest
+
+import pandas as pd
+
+from processing.lineups import find_stints
+
+ROSTER = [f"P{x:02d}" for x in range(12)]
+
+
+def reference_lineups(pbp, starting_lineup):
+    # GameData.get_lineups before the stint engine, kept as the reference find_stints is checked against
+    ins_and_outs = pbp.loc[pbp["playerIn"] | pbp["playerOut"], :]
+
+    inc_player = ins_and_outs.loc[ins_and_outs["playerIn"], ["PLAYER_ID", "time"]].reset_index().rename(
+        columns={"index": "index_inc", "PLAYER_ID": "PLAYER_ID_IN"})
+    out_player = ins_and_outs.loc[ins_and_outs["playerOut"], ["PLAYER_ID", "time"]].reset_index().rename(
+        columns={"index": "index_out", "PLAYER_ID": "PLAYER_ID_OUT"})
+
+    inc_player = inc_player.groupby("time").agg(
+        {"PLAYER_ID_IN": lambda x: list(x), "index_inc": lambda x: list(x)}).reset_index()
+    out_player = out_player.groupby("time").agg(
+        {"PLAYER_ID_OUT": lambda x: list(x), "index_out": lambda x: list(x)}).reset_index()
+
+    subs_df = pd.concat([inc_player, out_player], axis=1).copy()
+
+    def length_finder(x):
+        return len(x) if type(x) == list else 0
+
+    subs_df_check = [length_finder(x) == length_finder(y) for x, y in zip(subs_df["PLAYER_ID_OUT"],
+                                                                          subs_df["PLAYER_ID_IN"])]
+
+    if not all(subs_df_check):
+        subs_df_test = subs_df.loc[~pd.Series(subs_df_check), :]
+        idx = min(subs_df_test.index)
+        for x in ["PLAYER_ID_IN", "PLAYER_ID_OUT", "index_inc", "index_out"]:
+            column = subs_df[x].tolist()
+            column[idx] = subs_df_test[x].explode().dropna().tolist()
+            subs_df[x] = pd.Series(column, index=subs_df.index, dtype=object)
+        subs_df = subs_df.dropna()
+
+    current_lineup = list(starting_lineup)
+    anti_zone = []
+    prev_lineup = current_lineup
+
+    def substitution(in_player, off_player):
+        nonlocal current_lineup
+        nonlocal prev_lineup
+
+        err_count = 0
+        prev_lineup = current_lineup
+        current_lineup = [*current_lineup, *in_player]
+
+        for x in off_player:
+            try:
+                current_lineup.remove(x)
+                if len(anti_zone) > 0:
+                    current_lineup.remove(anti_zone.pop())
+                    prev_lineup = current_lineup
+            except ValueError:
+                anti_zone.append(x)
+                err_count += 1
+
+        return tuple(prev_lineup) if err_count > 0 else tuple(current_lineup)
+
+    lineups = [substitution(x, y) for x, y in zip(subs_df["PLAYER_ID_IN"], subs_df["PLAYER_ID_OUT"])]
+    subs_df["lineups"] = pd.Series([sorted(list(x)) for x in lineups])
+    subs_df["index_left"] = subs_df.apply(lambda x: max(max(x["index_inc"]), max(x["index_out"])), axis=1)
+    subs_df["index_right"] = subs_df["index_left"].tolist()[1:] + [pbp.shape[0]]
+
+    pbp_lineups = [None] * pbp.shape[0]
+    left_right_indices = [None] * pbp.shape[0]
+    first = subs_df["index_left"][0]
+    pbp_lineups[0:first] = [list(starting_lineup)] * first
+    left_right_indices[0:first] = [[0, first]] * first
+
+    for x, y, z in zip(subs_df["index_left"], subs_df["index_right"], subs_df["lineups"]):
+        pbp_lineups[x:y] = [z] * (y - x)
+        left_right_indices[x:y] = [[x, y]] * (y - x)
+
+    return pbp_lineups, [x[0] for x in left_right_indices], [x[1] for x in left_right_indices]
+
+
+def make_pbp(rng, glitch_rate):
+    # plays of one team with substitution groups, glitched rows are shifted by a second, dropped, duplicated or
+    # given a player who never played
+    on_court, bench = ROSTER[:5], ROSTER[5:]
+    starting_lineup = sorted(on_court)
+    rows = []
+    for time in range(0, 2400, 20):
+        rows.append((rng.choice(on_court), time, False, False))
+        if rng.random() < 0.3:
+            count = rng.randint(1, 3)
+            going_out, coming_in = rng.sample(on_court, count), rng.sample(bench, count)
+            on_court = [x for x in on_court if x not in going_out] + coming_in
+            bench = [x for x in bench if x not in coming_in] + going_out
+
+            subs = [(x, time, True, False) for x in coming_in] + [(x, time, False, True) for x in going_out]
+            rng.shuffle(subs)
+            for x in subs:
+                if rng.random() < glitch_rate:
+                    glitch = rng.randrange(4)
+                    if glitch == 0:
+                        x = (x[0], x[1] - 1, x[2], x[3])
+                    elif glitch == 1:
+                        continue
+                    elif glitch == 2:
+                        rows.append(x)
+                    else:
+                        x = ("P99", *x[1:])
+                rows.append(x)
+
+    return pd.DataFrame(rows, columns=["PLAYER_ID", "time", "playerIn", "playerOut"]), starting_lineup
+
+
+class FindStintsTestCase(unittest.TestCase):
+
+    def check_against_reference(self, glitch_rate, seed):
+        rng = random.Random(seed)
+        compared = 0
+        for _ in range(150):
+            pbp, starting_lineup = make_pbp(rng, glitch_rate)
+            try:
+                expected = reference_lineups(pbp, starting_lineup)
+            except (KeyError, TypeError):
+                # the old code failed on these games outright
+                continue
+
+            stints = find_stints(pbp["PLAYER_ID"].to_numpy(), pbp["time"].to_numpy(), pbp["playerIn"].to_numpy(),
+                                 pbp["playerOut"].to_numpy(), starting_lineup)
+            stint_lineups = stints.lineups()
+
+            self.assertEqual([stint_lineups[x] for x in stints.row_stint], expected[0])
+            self.assertEqual(stints.index_left[stints.row_stint].tolist(), expected[1])
+            self.assertEqual(stints.index_right[stints.row_stint].tolist(), expected[2])
+            compared += 1
+        return compared
+
+    def test_matches_reference_with_few_glitches(self):
+        self.assertGreater(self.check_against_reference(0.05, seed=1), 100)
+
+    def test_matches_reference_with_many_glitches(self):
+        self.assertGreater(self.check_against_reference(0.5, seed=2), 50)
+
+    def test_clean_substitutions(self):
+        pbp = pd.DataFrame([("P00", 0, False, False), ("P05", 10, True, False), ("P00", 10, False, True),
+                            ("P05", 20, False, False)], columns=["PLAYER_ID", "time", "playerIn", "playerOut"])
+        stints = find_stints(pbp["PLAYER_ID"].to_numpy(), pbp["time"].to_numpy(), pbp["playerIn"].to_numpy(),
+                             pbp["playerOut"].to_numpy(), ROSTER[:5])
+
+        self.assertEqual(stints.lineups(), [ROSTER[:5], ROSTER[1:6]])
+        self.assertEqual(stints.row_stint.tolist(), [0, 0, 1, 1])
+        self.assertEqual(stints.index_left.tolist(), [0, 2])
+        self.assertEqual(stints.index_right.tolist(), [2, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
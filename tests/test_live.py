@@ -0,0 +1,123 @@
+import json
+import tempfile
+import unittest
+
+from el_api_wrapper import ELAPI
+from live import LivePoller
+from processing.live_game import LiveGame
+from replay_server import FixtureStore, ReplayServer
+
+
+def play(team, player, playtype, marker_time, minute):
+    return {"CODETEAM": team, "PLAYER_ID": player, "PLAYTYPE": playtype, "PLAYER": player, "MARKERTIME": marker_time,
+            "MINUTE": minute}
+
+
+def player(code, starter):
+    return {"ac": code, "na": f"PLAYER {code}", "st": int(starter), "sl": 1, "nn": 1, "p": None, "im": None}
+
+
+PLAYS = [play("", "", "BP", "", 1),
+         play("HOM", "H1", "2FGM", "09:40", 1),
+         play("AWY", "A1", "3FGM", "09:10", 1),
+         play("HOM", "H2", "2FGA", "08:50", 1),
+         play("AWY", "A2", "D", "08:50", 1),
+         play("HOM", "H3", "IN", "08:30", 2),
+         play("HOM", "H1", "OUT", "08:30", 2),
+         play("HOM", "H3", "FTM", "08:30", 2),
+         play("HOM", "H3", "3FGM", "07:00", 3),
+         play("AWY", "A1", "TO", "06:00", 4),
+         play("", "", "EG", "00:00", 11)]
+
+SNAPSHOTS = [4, 8, len(PLAYS)]
+
+
+class LivePollingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fixtures = tempfile.TemporaryDirectory()
+        self.store = FixtureStore(self.fixtures.name)
+        params = {"gamecode": 5, "seasoncode": "E2023"}
+
+        header = {"CodeTeamA": "HOM", "CodeTeamB": "AWY", "Live": True}
+        self.store.put("api/Header", params, json.dumps(header).encode())
+        for team, players in [("HOM", [player("H1", True), player("H2", True), player("H3", False)]),
+                              ("AWY", [player("A1", True), player("A2", True)])]:
+            self.store.put("api/Players", {**params, "temp": "E2023", "equipo": team}, json.dumps(players).encode())
+
+        for snapshot, count in enumerate(SNAPSHOTS):
+            self.store.put("api/PlayByPlay", params, json.dumps({"FirstQuarter": PLAYS[:count]}).encode(), snapshot)
+
+            shots = [{"TEAM": x["CODETEAM"], "ID_PLAYER": x["PLAYER_ID"], "PLAYER": x["PLAYER"],
+                      "ID_ACTION": x["PLAYTYPE"], "COORD_X": 0, "COORD_Y": 0, "ZONE": None}
+                     for x in PLAYS[:count] if x["PLAYTYPE"] in ["2FGM", "2FGA", "3FGM"]]
+            self.store.put("api/Points", params, json.dumps({"Rows": shots}).encode(), snapshot)
+
+    def tearDown(self):
+        self.fixtures.cleanup()
+
+    def test_polls_only_feed_new_plays(self):
+        with ReplayServer(self.store) as server:
+            poller = LivePoller(ELAPI(**server.client_urls()), 2023, [5], interval=0)
+
+            new_plays = [poller.poll_once()]
+            for _ in SNAPSHOTS[1:]:
+                server.advance()
+                new_plays.append(poller.poll_once())
+
+        game = poller.games[5]
+        self.assertEqual([x[5] for x in new_plays], [4, 4, 3])
+        self.assertTrue(game.final)
+        self.assertEqual(game.score(), (6, 3))
+        self.assertEqual(len(game.points()), 4)
+
+        box_score = game.box_score().set_index("PLAYER_ID")
+        self.assertEqual(box_score.loc["H3", "pts"], 4)
+        self.assertEqual(box_score.loc["H3", "plus_minus"], 3)
+        self.assertEqual(box_score.loc["H1", "duration"], 90)
+        self.assertEqual(box_score.loc["A1", "playerName"], "Player A1")
+
+        # the free throw at the substitution second still belongs to the five that was on court
+        lineups = game.lineups().set_index(["CODETEAM", "lineups_string"])
+        self.assertEqual(lineups.loc[("HOM", "H1; H2"), "FTM"], 1)
+        self.assertEqual(lineups.loc[("HOM", "H2; H3"), "3FGM"], 1)
+
+        replayed = LiveGame(2023, 5, "HOM", "AWY", ["H1", "H2"], ["A1", "A2"])
+        replayed.update({"FirstQuarter": PLAYS})
+        self.assertTrue(replayed.box_score().drop(columns="playerName").equals(
+            game.box_score().drop(columns="playerName")))
+        self.assertTrue(replayed.lineups().equals(game.lineups()))
+
+    def test_recorded_polls_replay_in_order(self):
+        recorded = tempfile.TemporaryDirectory()
+        with ReplayServer(self.store) as server:
+            poller = LivePoller(ELAPI(recorder=FixtureStore(recorded.name), **server.client_urls()), 2023, [5])
+            poller.poll_once()
+            server.advance()
+            poller.poll_once()
+
+        with ReplayServer(FixtureStore(recorded.name)) as server:
+            poller = LivePoller(ELAPI(**server.client_urls()), 2023, [5])
+            new_plays = [poller.poll_once()[5]]
+            for _ in range(2):
+                server.advance()
+                new_plays.append(poller.poll_once()[5])
+
+        recorded.cleanup()
+        # the replay stays on the last recorded poll
+        self.assertEqual(new_plays, [4, 4, 0])
+        self.assertEqual(poller.games[5].score(), (3, 3))
+
+    def test_corrected_plays_are_reprocessed(self):
+        game = LiveGame(2023, 5, "HOM", "AWY", ["H1", "H2"], ["A1", "A2"])
+        game.update({"FirstQuarter": PLAYS[:4]})
+
+        corrected = [*PLAYS[:3], play("HOM", "H2", "3FGM", "08:50", 1), *PLAYS[4:8]]
+        game.update({"FirstQuarter": corrected})
+
+        self.assertEqual(game.resets, 1)
+        self.assertEqual(game.score(), (6, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import json
+import os
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from el_api_wrapper import ELAPI
+from pipeline import (BatchRunner, aggregate_season, concatenate_season, parse_seasons, peak_memory,
+                      process_games_parallel, process_games_streaming, reset_peak_memory, save_state, sync_season)
+from processing.game_data import SeasonData
+from replay_server import FixtureStore, ReplayServer
+from season_store import SeasonStore
+from test_season_batch import make_game
+
+
+def built_season(store):
+    season = SeasonData(store.season)
+    process_games_streaming(season, store.iter_games())
+    concatenate_season(season)
+    season.release_games()
+    aggregate_season(season)
+    return season
+
+
+class PipelineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.games = [make_game(x, "MAD", "BAR") for x in range(1, 9)]
+
+    def test_parallel_matches_streaming(self):
+        streamed = SeasonData(2022)
+        process_games_streaming(streamed, self.games)
+        concatenate_season(streamed)
+
+        parallel = SeasonData(2022)
+        read = []
+
+        def game_list():
+            for x in self.games:
+                # two chunks of two games at most are out with the workers
+                self.assertLessEqual(len(read) - len(parallel.game_list), 4)
+                read.append(x)
+                yield x
+
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            worker_peak = process_games_parallel(parallel, game_list(), executor, chunksize=2, max_chunks=2)
+        concatenate_season(parallel)
+
+        self.assertGreater(worker_peak, 0)
+
+        for x in ["player_data", "lineup_data", "team_data", "points_data", "assists_data"]:
+            pd.testing.assert_frame_equal(getattr(parallel, x), getattr(streamed, x))
+
+    def test_sync_matches_full_rebuild(self):
+        with tempfile.TemporaryDirectory() as root:
+            store = SeasonStore(2022, root)
+            store.write_games([make_game(1, "MAD", "BAR"), make_game(2, "PAN", "OLY"), make_game(3, "MAD", "OLY")])
+            self.assertEqual(sync_season(store), (None, 0))
+            save_state(store, built_season(store))
+
+            # a new game and a game downloaded again with other teams
+            store.write_games([make_game(4, "BAR", "PAN"), make_game(2, "OLY", "BAR")])
+            synced, game_count = sync_season(store)
+            full = built_season(store)
+
+        self.assertEqual(game_count, 2)
+        self.assertEqual(sorted(synced.team_data["game_code"]), sorted(full.team_data["game_code"]))
+        for x in ["player_data_agg", "lineup_data_agg", "team_data_agg"]:
+            pd.testing.assert_frame_equal(getattr(synced, x), getattr(full, x))
+
+    @unittest.skipUnless(os.path.exists("/proc/self/clear_refs"), "needs linux /proc")
+    def test_peak_memory_is_reset(self):
+        reset_peak_memory()
+        values = np.ones(2 ** 24)
+        values[:] = 2
+        del values
+        peak = peak_memory()
+
+        reset_peak_memory()
+        self.assertLess(peak_memory(), peak - 64)
+
+
+def record_season(fixtures, season, games):
+    # every endpoint of the games as the api would answer it
+    for x in games:
+        params = {"gamecode": x["game_code"], "seasoncode": f"E{season}"}
+        header = {"CodeTeamA": x["home_team"], "CodeTeamB": x["away_team"], "Live": False}
+        fixtures.put("api/Header", params, json.dumps(header).encode())
+        fixtures.put("api/Points", params, json.dumps(x["points"]).encode())
+        fixtures.put("api/PlayByPlay", params, json.dumps(x["play_by_play"]).encode())
+        for team, players in [(x["home_team"], x["home_players"]), (x["away_team"], x["away_players"])]:
+            fixtures.put("api/Players", dict(params, temp=f"E{season}", equipo=team), json.dumps(players).encode())
+
+    fixtures.put(f"feeds/competitions/E/seasons/E{season}/games", {"phaseTypeCode": "FF"},
+                 json.dumps({"data": [{"code": x["game_code"]} for x in games]}).encode())
+
+
+class BatchRunnerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.fixtures = FixtureStore(os.path.join(self.root.name, "fixtures"))
+        self.games = {2021: [make_game(1, "MAD", "BAR"), make_game(2, "PAN", "OLY"), make_game(3, "BAR", "OLY")],
+                      2022: [make_game(1, "OLY", "MAD"), make_game(2, "BAR", "PAN")]}
+        for season, games in self.games.items():
+            record_season(self.fixtures, season, games)
+
+        self.cwd = os.getcwd()
+        os.chdir(self.root.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.root.cleanup()
+
+    def run_batch(self, mode, processes=1):
+        with ReplayServer(self.fixtures) as server:
+            el = ELAPI(max_workers=4, **server.client_urls())
+            runner = BatchRunner(el, [2021, 2022], mode=mode, workers=4, store=False, processes=processes)
+            runner.run()
+        return runner, server.stats["requests"]
+
+    def test_parse_seasons(self):
+        self.assertEqual(parse_seasons("2022"), [2022])
+        self.assertEqual(parse_seasons("2019-2022"), [2019, 2020, 2021, 2022])
+
+    def test_seasons_are_downloaded_processed_and_synced(self):
+        runner, requests = self.run_batch("download")
+
+        # the schedule of each season and five requests per game
+        self.assertEqual(requests, 2 + 5 * 5)
+        for season, games in self.games.items():
+            store = SeasonStore(season)
+            self.assertEqual(list(store.iter_games()), [dict(x, season=season, final=True) for x in games])
+            self.assertEqual(runner.progress[season].processed_games, len(games))
+            self.assertIsNone(runner.progress[season].error)
+
+            state = store.read_state()["season"]
+            full = built_season(store)
+            pd.testing.assert_frame_equal(state.team_data_agg, full.team_data_agg)
+
+        # nothing is left to fetch, the saved states are used as they are
+        runner, requests = self.run_batch("sync")
+        self.assertEqual(requests, 2)
+        self.assertEqual([runner.progress[x].processed_games for x in [2021, 2022]], [0, 0])
+
+    def test_worker_processes_start_while_downloading(self):
+        # the workers are started while the download threads are busy
+        runner, requests = self.run_batch("download", processes=2)
+
+        for season in self.games:
+            store = SeasonStore(season)
+            self.assertGreater(runner.progress[season].worker_peak_memory, 0)
+            pd.testing.assert_frame_equal(store.read_state()["season"].team_data_agg, built_season(store).team_data_agg)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from processing.play_flags import (FLAG_BITS, FLAG_KEYS, STAT_COMPOSITE_KEYS, STAT_KEYS, decode_flags, get_flag,
+                                   playtype_flags, set_flag)
+
+
+class PlayFlagsTestCase(unittest.TestCase):
+
+    def test_flags_match_per_row_matching(self):
+        # every play type the processing knows of, prefixes of them and a missing one
+        playtype = pd.Series(STAT_KEYS + ["3FGA", "2FGA", "FTA", "3FGMX", "OD", "DO", "BP", "EG", "IN", "OUT", "",
+                                          None] * 3)
+        flags = playtype_flags(playtype)
+        self.assertEqual(flags.dtype, np.int32)
+
+        # stat_calculator before the flags were packed
+        for x in STAT_KEYS:
+            np.testing.assert_array_equal(get_flag(flags, x), (playtype == x).to_numpy(), x)
+        for key, val in STAT_COMPOSITE_KEYS.items():
+            np.testing.assert_array_equal(get_flag(flags, key), playtype.str.match(val).fillna(False).to_numpy(),
+                                          key)
+
+        # a categorical column gives the same flags
+        np.testing.assert_array_equal(playtype_flags(playtype.astype("category")), flags)
+
+    def test_set_and_get_flags(self):
+        # the sign bit is left alone
+        self.assertLessEqual(len(FLAG_KEYS), 31)
+        self.assertEqual(len(set(FLAG_BITS.values())), len(FLAG_KEYS))
+
+        rng = np.random.default_rng(1)
+        masks = {x: rng.random(50) < 0.5 for x in FLAG_KEYS}
+        flags = np.zeros(50, dtype=np.int32)
+        for x in FLAG_KEYS:
+            flags = set_flag(flags, x, masks[x])
+        flags = set_flag(flags, "RV", ~masks["RV"])
+
+        self.assertEqual(flags.dtype, np.int32)
+        for x in FLAG_KEYS:
+            np.testing.assert_array_equal(get_flag(flags, x), ~masks[x] if x == "RV" else masks[x], x)
+
+    def test_decode_flags(self):
+        df = pd.DataFrame({"flags": [FLAG_BITS["AS"] | FLAG_BITS["multi_ft"], 0], "pos": [1, 0]}, index=[5, 7])
+
+        decoded = decode_flags(df, ["AS", "multi_ft", "TO", "pos"])
+        pd.testing.assert_frame_equal(decoded, pd.DataFrame({"AS": [True, False], "multi_ft": [True, False],
+                                                             "TO": [False, False], "pos": [1, 0]}, index=[5, 7]))
+
+
+if __name__ == '__main__':
+    unittest.main()
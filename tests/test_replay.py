@@ -0,0 +1,71 @@
+import json
+import tempfile
+import unittest
+
+from el_api_wrapper import ELAPI
+from replay_server import FixtureStore, ReplayServer
+
+
+def record_game(store, season, game, home, away):
+    header = {"CodeTeamA": home, "CodeTeamB": away, "Live": False}
+    points = {"Rows": [{"TEAM": home, "ID_PLAYER": "P1", "ID_ACTION": "2FGM"}]}
+    play_by_play = {"FirstQuarter": [{"PLAYTYPE": "BP"}, {"PLAYTYPE": "EG"}]}
+
+    store.put("api/Header", {"gamecode": game, "seasoncode": f"E{season}"}, json.dumps(header).encode())
+    store.put("api/Points", {"gamecode": game, "seasoncode": f"E{season}"}, json.dumps(points).encode())
+    store.put("api/PlayByPlay", {"gamecode": game, "seasoncode": f"E{season}"}, json.dumps(play_by_play).encode())
+    for team in [home, away]:
+        store.put("api/Players", {"gamecode": game, "seasoncode": f"E{season}", "temp": f"E{season}", "equipo": team},
+                  json.dumps([{"ac": f"{team}1"}]).encode())
+
+
+class ReplayServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fixtures = tempfile.TemporaryDirectory()
+        self.store = FixtureStore(self.fixtures.name)
+
+        for game in range(1, 13):
+            record_game(self.store, 2022, game, f"H{game:02d}", f"A{game:02d}")
+        self.store.put("feeds/competitions/E/seasons/E2022/games", {"phaseTypeCode": "FF"},
+                       json.dumps({"data": [{"code": x} for x in range(1, 13)]}).encode())
+
+    def tearDown(self):
+        self.fixtures.cleanup()
+
+    def test_concurrent_download_survives_errors_and_throttling(self):
+        with ReplayServer(self.store, latency=0.01, error_rate=0.2, rate_limit=200, seed=1) as server:
+            el = ELAPI(max_workers=4, backoff_factor=0.01, max_retries=10, **server.client_urls())
+            games = el.get_season_stats(2022)
+
+        self.assertEqual([x["game_code"] for x in games], list(range(1, 13)))
+        self.assertEqual(games[4]["home_team"], "H05")
+        self.assertEqual(games[4]["away_players"], [{"ac": "A051"}])
+        self.assertGreater(server.stats["errors"], 0)
+
+    def test_games_not_played_yet_are_left_out(self):
+        # the schedule lists two games nothing was recorded for, the server answers them with 404
+        self.store.put("feeds/competitions/E/seasons/E2022/games", {"phaseTypeCode": "FF"},
+                       json.dumps({"data": [{"code": x} for x in range(1, 15)]}).encode())
+
+        for max_workers in [1, 4]:
+            with ReplayServer(self.store) as server:
+                el = ELAPI(max_workers=max_workers, backoff_factor=0.01, **server.client_urls())
+                games = el.get_season_stats(2022)
+
+            self.assertEqual([x["game_code"] for x in games], list(range(1, 13)))
+
+    def test_recorded_fixtures_replay_identically(self):
+        with ReplayServer(self.store) as server:
+            recorded = tempfile.TemporaryDirectory()
+            games = ELAPI(recorder=FixtureStore(recorded.name), **server.client_urls()).get_season_stats(2022)
+
+        with ReplayServer(FixtureStore(recorded.name)) as server:
+            replayed = ELAPI(**server.client_urls()).get_season_stats(2022)
+
+        recorded.cleanup()
+        self.assertEqual(games, replayed)
+
+
+if __name__ == '__main__':
+    unittest.main()
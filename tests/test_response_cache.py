@@ -0,0 +1,118 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from el_api_wrapper import ELAPI
+from replay_server import FixtureStore, ReplayServer
+from response_cache import CachePolicy, ResponseCache
+from test_replay import record_game
+
+
+class CachePolicyTestCase(unittest.TestCase):
+
+    def test_final_entries_are_pinned(self):
+        policy = CachePolicy(live_ttl=60)
+
+        self.assertTrue(policy.is_fresh("Points", 0, True, True, 10 ** 9))
+        self.assertTrue(policy.is_fresh("Points", 0, False, False, 59))
+        self.assertFalse(policy.is_fresh("Points", 0, False, False, 60))
+        self.assertFalse(policy.is_fresh("Points", 0, False, True, 1))
+        self.assertTrue(policy.is_fresh("games", 0, False, False, 3600))
+
+    def test_overflow_evicts_the_oldest_live_entries(self):
+        # (rowid, endpoint, stored_at, final)
+        entries = [(1, "Header", 0, True), (2, "Points", 50, False), (3, "Points", 10, False),
+                   (4, "Points", 30, False), (5, "Points", 0, False)]
+
+        self.assertEqual(CachePolicy(live_ttl=60).to_evict(entries, 65), [5])
+        self.assertEqual(CachePolicy(live_ttl=60, max_entries=2).to_evict(entries, 65), [5, 3, 4])
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(os.path.join(self.root.name, "cache.sqlite"), CachePolicy(live_ttl=60))
+
+    def tearDown(self):
+        self.cache.close()
+        self.root.cleanup()
+
+    def test_live_entries_expire_and_go_stale_once_the_game_is_over(self):
+        with mock.patch("response_cache.time.time", return_value=1000):
+            self.cache.put("Header", 2022, 1, "", {"Live": True}, final=False)
+            self.cache.put("Points", 2022, 1, "", {"Rows": []}, final=False)
+
+        with mock.patch("response_cache.time.time", return_value=1030):
+            self.assertEqual(self.cache.get("Points", 2022, 1), {"Rows": []})
+        with mock.patch("response_cache.time.time", return_value=1070):
+            self.assertIsNone(self.cache.get("Points", 2022, 1))
+
+        with mock.patch("response_cache.time.time", return_value=1000):
+            self.cache.put("Points", 2022, 1, "", {"Rows": []}, final=False)
+        with mock.patch("response_cache.time.time", return_value=1010):
+            self.cache.put("Header", 2022, 1, "", {"Live": False}, final=True)
+            self.assertIsNone(self.cache.get("Points", 2022, 1))
+            self.assertTrue(self.cache.is_final(2022, 1))
+
+    def test_prune_keeps_final_entries(self):
+        with mock.patch("response_cache.time.time", return_value=1000):
+            self.cache.put("Header", 2022, 1, "", {"Live": False}, final=True)
+            self.cache.put("Header", 2022, 2, "", {"Live": True}, final=False)
+
+        with mock.patch("response_cache.time.time", return_value=2000):
+            self.assertEqual(self.cache.prune(), 1)
+            self.assertEqual(self.cache.get("Header", 2022, 1), {"Live": False})
+            self.assertIsNone(self.cache.get("Header", 2022, 2))
+
+    def test_second_download_is_served_from_the_cache(self):
+        fixtures = FixtureStore(os.path.join(self.root.name, "fixtures"))
+        for game in range(1, 5):
+            record_game(fixtures, 2022, game, f"H{game:02d}", f"A{game:02d}")
+        fixtures.put("feeds/competitions/E/seasons/E2022/games", {"phaseTypeCode": "FF"},
+                     json.dumps({"data": [{"code": x} for x in range(1, 5)]}).encode())
+
+        with ReplayServer(fixtures) as server:
+            el = ELAPI(max_workers=2, cache=self.cache, **server.client_urls())
+            downloaded = el.get_season_stats(2022)
+            requests = server.stats["requests"]
+            cached = el.get_season_stats(2022)
+
+        self.assertEqual(requests, 21)
+        self.assertEqual(server.stats["requests"], requests)
+        self.assertEqual(cached, downloaded)
+
+    def download(self, games, live=()):
+        fixtures = FixtureStore(os.path.join(self.root.name, "fixtures"))
+        for game in games:
+            record_game(fixtures, 2022, game, f"H{game:02d}", f"A{game:02d}")
+        for game in live:
+            fixtures.put("api/Header", {"gamecode": game, "seasoncode": "E2022"},
+                         json.dumps({"CodeTeamA": f"H{game:02d}", "CodeTeamB": f"A{game:02d}", "Live": True}).encode())
+        fixtures.put("feeds/competitions/E/seasons/E2022/games", {"phaseTypeCode": "FF"},
+                     json.dumps({"data": [{"code": x} for x in games]}).encode())
+
+        with ReplayServer(fixtures) as server:
+            ELAPI(max_workers=2, cache=self.cache, **server.client_urls()).get_season_stats(2022)
+        return server.stats["requests"]
+
+    def test_finished_season_is_served_from_the_cache_for_good(self):
+        self.download(range(1, 5))
+
+        # long after the schedule would have expired
+        with mock.patch("response_cache.time.time", return_value=time.time() + 30 * 24 * 3600):
+            self.assertEqual(self.download(range(1, 5)), 0)
+
+    def test_season_in_progress_asks_for_its_game_count_again(self):
+        self.download(range(1, 5), live=[4])
+
+        with mock.patch("response_cache.time.time", return_value=time.time() + 30 * 24 * 3600):
+            # the schedule and the five requests of the live game
+            self.assertEqual(self.download(range(1, 5), live=[4]), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
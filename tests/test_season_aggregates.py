@@ -0,0 +1,161 @@
+import pickle
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from processing.game_data import PLAYER_RANK_COLUMNS, SeasonData, process_game
+from test_game_data import random_game
+from test_season_batch import make_game
+
+
+def aggregated_season(game_outputs, season=2022):
+    season = SeasonData(season)
+    season.game_list = game_outputs
+    season.concatenate_player_data()
+    season.concatenate_lineup_data()
+    season.concatenate_team_data()
+    season.concatenate_points_data()
+    season.concatenate_assists_data()
+    season.aggregate_player_data()
+    season.aggregate_lineup_data()
+    season.aggregate_team_data()
+    season.sketch_game_data(season.player_data, season.team_data, reset=True)
+    return season
+
+
+def reference_u_per(season, per_season):
+    # the row-wise uPER of calculate_per_game_based and calculate_per_season_based before they went column-wise,
+    # returns uPER and team pace per player row
+    league_vop, league_drp, league_factor, league_foul, league_pace = season.league_constants()
+    df = season.player_data_agg if per_season else season.player_data
+
+    def u_per(row):
+        if per_season:
+            team_stats = season.team_data_agg.loc[(season.team_data_agg["CODETEAM"] == row["CODETEAM"]), :]
+            fouls = row["CM"] + row["OF"] + row["CMU"]
+            team_pace = team_stats["pos"].iloc[0] / team_stats["game_count"].iloc[0]
+        else:
+            team_stats = season.team_data.loc[(season.team_data["game_code"] == row["game_code"]) &
+                                              (season.team_data["CODETEAM"] == row["CODETEAM"]), :]
+            fouls = row["CM"]
+            team_pace = (team_stats["pos"].iloc[0] + team_stats["opp_pos"].iloc[0]) / 2
+
+        fg = row["2FGM"] + row["3FGM"]
+        fga = row["2FGA"] + row["3FGA"]
+        team_fg = team_stats["2FGM"].iloc[0] + team_stats["3FGM"].iloc[0]
+        c0 = (1 / (row["duration"] / 60))
+        c1 = row["3FGM"] + 0.66 * row["AS"]
+        c2 = (2 - league_factor * team_stats["AS"].iloc[0] / team_fg) * fg
+        c3_1 = 0.5 * row["FTM"]
+        c3_2 = 2 - team_stats["AS"].iloc[0] / (team_fg * 3)
+        c4 = league_vop * row["TO"]
+        c5 = league_vop * league_drp * (fga - fg)
+        c6 = league_vop * 0.44 * (0.44 + (0.56 * league_drp)) * (row["FTA"] - row["FTM"])
+        c7 = league_vop * (1 - league_drp) * row["D"]
+        c8 = league_vop * league_drp * row["O"]
+        c9 = league_vop * row["ST"]
+        c10 = league_vop * league_drp * row["FV"]
+        c11 = league_foul * fouls
+
+        return c0 * (c1 + c2 + (c3_1 * c3_2) - c4 - c5 - c6 + c7 + c8 + c9 + c10 - c11), team_pace
+
+    df_tmp = df.loc[df["duration"] > 0, :].apply(lambda x: u_per(x), axis=1, result_type="expand")
+    df_tmp.columns = ["uPER", "team_pace"]
+    return df_tmp, league_pace
+
+
+class SeasonAggregatesTestCase(unittest.TestCase):
+
+    def test_applied_games_match_full_aggregation(self):
+        games = [process_game(make_game(1, "MAD", "BAR")), process_game(make_game(2, "PAN", "OLY")),
+                 process_game(make_game(3, "MAD", "OLY"))]
+        full = aggregated_season(games)
+
+        # game 2 is applied again and replaces its earlier copy
+        season = aggregated_season(games[:2])
+        season.apply_games(games[1:])
+
+        self.assertEqual(sorted(season.team_data["game_code"]), [1, 1, 2, 2, 3, 3])
+        for x in ["player_data_agg", "lineup_data_agg", "team_data_agg"]:
+            pd.testing.assert_frame_equal(getattr(season, x), getattr(full, x))
+
+    def test_percentile_ranks_are_read_off_the_sketches(self):
+        games = [process_game(make_game(x, *y)) for x, y in
+                 enumerate([("MAD", "BAR"), ("PAN", "OLY"), ("MAD", "OLY"), ("BAR", "PAN")], 1)]
+        exact, sketched = aggregated_season(games), aggregated_season(games)
+        # a small sketch is compacted well before the 15 players of the season
+        sketched.sketch_k = 8
+        for x in [exact, sketched]:
+            x.calculate_per_season_based(min_duration=0)
+            x.get_percentile_ranks(min_duration=0)
+
+        for x, y in PLAYER_RANK_COLUMNS.items():
+            ranks = exact.player_data_agg[y].rank(pct=True) * 100
+            pd.testing.assert_series_equal(exact.player_data_agg[x], ranks, check_names=False)
+            self.assertLessEqual((sketched.player_data_agg[x] - ranks).abs().max(),
+                                 sketched.sketches[f"player_{y}"].error() * 100, x)
+            self.assertTrue(sketched.player_data_agg[x].isna().equals(ranks.isna()), x)
+
+        # the season quantiles come out as Series.quantile gives them
+        exact.concatenate_quantile_data()
+        exact.aggregate_quantile_data()
+        percentiles = [0.25, 0.50, 0.75, 0.95, 1]
+        expected = [exact.player_data["PIR"].quantile(percentiles).tolist(),
+                    exact.team_data["PPP"].quantile(percentiles).tolist(),
+                    exact.player_data_agg["PIR_avg"].quantile(percentiles).tolist()]
+        np.testing.assert_allclose(exact.quantiles["quantiles"].tolist(), expected)
+
+    def test_per_matches_reference(self):
+        season = aggregated_season([process_game(random_game(x, seed=x)) for x in range(1, 9)])
+        season.calculate_per_game_based()
+        season.calculate_per_season_based(min_duration=600)
+
+        for per_season, df, suffix, min_duration in [(False, season.player_data, "", 180),
+                                                     (True, season.player_data_agg, "_season", 600)]:
+            expected, league_pace = reference_u_per(season, per_season)
+            self.assertGreater(len(expected), 20)
+            played = df["duration"] > 0
+            qualified = df["duration"] >= min_duration
+            per = (expected["uPER"] * league_pace / expected["team_pace"]) * 15 / np.mean(
+                expected.loc[qualified[played], "uPER"])
+
+            pd.testing.assert_series_equal(df.loc[played, f"uPER{suffix}"], expected["uPER"], check_names=False)
+            pd.testing.assert_series_equal(df.loc[played & qualified, f"PER{suffix}"], per[qualified[played]],
+                                           check_names=False)
+            self.assertTrue(df.loc[~qualified, f"PER{suffix}"].isna().all())
+            # players who never got on court come out as inf or nan instead of raising
+            self.assertFalse(np.isfinite(df.loc[~played, f"uPER{suffix}"]).any())
+
+    def test_lineup_aggregates_match_grouping_on_strings(self):
+        season = aggregated_season([process_game(random_game(x, seed=x)) for x in range(1, 9)])
+
+        # aggregate_lineup_data before the lineups were keyed by integer
+        cols_to_sum = season.lineup_data.select_dtypes(include=np.number).columns.tolist()
+        expected = season.lineup_data.groupby(["lineups_string", "lineups", "CODETEAM"]).agg(
+            {x: "sum" for x in cols_to_sum}).reset_index()
+        expected["season"] = season.season
+
+        df = season.lineup_data_agg.sort_values(["lineups_string", "CODETEAM"], ignore_index=True)
+        self.assertGreater(len(expected), 50)
+        pd.testing.assert_frame_equal(df[expected.columns], expected)
+        self.assertEqual(sorted(season.lineup_keys["lineups_string"]), sorted(set(expected["lineups_string"])))
+        self.assertEqual(season.lineup_sums.index.names, ["lineup_key", "CODETEAM"])
+
+    def test_lineup_keys_are_stable(self):
+        games = [process_game(random_game(x, seed=x)) for x in range(1, 6)]
+        season = aggregated_season(games[:3])
+        lineup_keys = season.lineup_keys.copy()
+
+        # games replaced or added later keep the keys of the lineups seen before, also after a state round trip
+        season = pickle.loads(pickle.dumps(season))
+        season.apply_games(games[2:])
+        pd.testing.assert_frame_equal(season.lineup_keys.iloc[:len(lineup_keys)], lineup_keys)
+        self.assertEqual(season.lineup_keys["lineups_string"].nunique(), len(season.lineup_keys))
+
+        full = aggregated_season(games)
+        pd.testing.assert_frame_equal(season.lineup_data_agg, full.lineup_data_agg)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+
+import pandas as pd
+
+from processing.decoding import decode_game
+from processing.game_data import GameData, SeasonData
+from processing.season_batch import SeasonBatch
+
+
+def play(team, player, playtype, marker_time, minute):
+    return {"CODETEAM": team, "PLAYER_ID": player, "PLAYTYPE": playtype, "PLAYER": player, "MARKERTIME": marker_time,
+            "MINUTE": minute}
+
+
+def player(code, starter):
+    return {"ac": code, "na": f"PLAYER {code}", "st": int(starter), "sl": 1, "nn": 1, "p": "G", "im": f"{code}.png"}
+
+
+def make_game(game_code, home, away):
+    plays = [play("", "", "BP", "", 1),
+             play(home, "P1", "2FGM", "09:40", 1),
+             play(home, "P2", "AS", "09:40", 1),
+             play(away, "P5", "AS", "09:10", 1),
+             play(away, "P4", "3FGM", "09:10", 1),
+             play(home, "P2", "2FGA", "08:50", 1),
+             play(away, "P5", "D", "08:50", 1),
+             play(home, "P3", "IN", "08:30", 2),
+             play(home, "P1", "OUT", "08:30", 2),
+             play(away, "P5", "CM", "08:30", 2),
+             play(home, "P3", "RV", "08:30", 2),
+             play(home, "P3", "FTM", "08:30", 2),
+             play(home, "P3", "FTA", "08:30", 2),
+             play(home, "P2", "LAYUPMD", "07:00", 3),
+             play(away, "P4", "2FGA", "06:50", 3),
+             play(home, "P1", "D", "06:50", 3),
+             play(home, "P2", "3FGA", "06:30", 3),
+             play(away, "P5", "D", "06:30", 3),
+             play(away, "P4", "TO", "06:00", 4),
+             play(home, "P3", "ST", "06:00", 4),
+             play("", "", "EG", "00:00", 11)]
+    points = [{"TEAM": x["CODETEAM"], "ID_PLAYER": x["PLAYER_ID"], "PLAYER": x["PLAYER"], "ID_ACTION": x["PLAYTYPE"],
+               "COORD_X": 10, "COORD_Y": 20, "ZONE": "A"} for x in plays if x["PLAYTYPE"] in ["2FGM", "2FGA", "3FGM"]]
+
+    return {"season": 2022, "game_code": game_code, "home_team": home, "away_team": away,
+            "points": {"Rows": points},
+            "home_players": [player("P1", True), player("P2", True), player("P3", False)],
+            "away_players": [player("P4", True), player("P5", True)],
+            "play_by_play": {"FirstQuarter": plays}}
+
+
+class SeasonBatchTestCase(unittest.TestCase):
+
+    def test_matches_game_by_game_processing(self):
+        games = [make_game(1, "MAD", "BAR"), make_game(2, "PAN", "OLY")]
+
+        season = SeasonData(2022)
+        season.store_games_list(games)
+        for x in season.game_list:
+            x.process_game_data()
+        season.concatenate_player_data()
+        season.concatenate_lineup_data()
+        season.concatenate_team_data()
+        season.concatenate_points_data()
+        season.concatenate_assists_data()
+
+        batch = SeasonBatch(2022)
+        for x in games:
+            batch.add_game(GameData(**decode_game(x)))
+        batch.process()
+
+        self.assertEqual(batch.game_count, 2)
+        for x in ["player_data", "lineup_data", "team_data", "points_data", "assists_data"]:
+            pd.testing.assert_frame_equal(getattr(batch, x), getattr(season, x))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import json
+import os
+import tempfile
+import unittest
+
+from el_api_wrapper import ELAPI, IncompleteSeasonError
+from replay_server import FixtureStore, ReplayServer
+from processing import decoding
+from season_store import SeasonStore, atomic_write, games_to_sync
+from test_el_api import FailingServer
+from test_replay import record_game
+from test_season_batch import make_game
+
+
+class SyncTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.fixtures = FixtureStore(os.path.join(self.root.name, "fixtures"))
+
+        for game in range(1, 11):
+            record_game(self.fixtures, 2022, game, f"H{game:02d}", f"A{game:02d}")
+        self.fixtures.put("feeds/competitions/E/seasons/E2022/games", {"phaseTypeCode": "FF"},
+                          json.dumps({"data": [{"code": x} for x in range(1, 11)]}).encode())
+
+    def tearDown(self):
+        self.root.cleanup()
+
+    def test_games_to_sync(self):
+        self.assertEqual(games_to_sync({1: True, 2: False, 4: True}, 5), [2, 3, 5])
+        self.assertEqual(games_to_sync({}, 2), [1, 2])
+
+    def test_every_game_is_checkpointed_once_in_batches(self):
+        for max_workers in [1, 4]:
+            batches = []
+            with ReplayServer(self.fixtures) as server:
+                el = ELAPI(max_workers=max_workers, **server.client_urls())
+                el.checkpoint_every = 3
+                el.get_season_stats(2022, checkpoint=batches.append)
+
+            self.assertEqual([len(x) for x in batches], [3, 3, 3, 1])
+            self.assertEqual(sorted(y["game_code"] for x in batches for y in x), list(range(1, 11)))
+
+    def test_failed_games_are_synced_on_the_next_run(self):
+        cwd = os.getcwd()
+        os.chdir(self.root.name)
+        try:
+            store = SeasonStore(2022)
+            with FailingServer(self.fixtures, failing_game=3) as server:
+                el = ELAPI(max_workers=4, max_retries=1, backoff_factor=0.01, **server.client_urls())
+                with self.assertRaises(IncompleteSeasonError):
+                    el.get_season_stats(2022, checkpoint=store.write_games)
+
+            # the games retrieved before giving up are on disk instead of in a crash dump
+            self.assertFalse(os.path.exists("crash_dump.json"))
+            self.assertEqual(SeasonStore(2022).stored_games(), {x: True for x in range(1, 11) if x != 3})
+
+            to_sync = games_to_sync(store.stored_games(), 10)
+            self.assertEqual(to_sync, [3])
+
+            with ReplayServer(self.fixtures) as server:
+                el = ELAPI(**server.client_urls())
+                el.get_games_stats(2022, to_sync, checkpoint=store.write_games)
+
+            self.assertEqual(games_to_sync(SeasonStore(2022).stored_games(), 10), [])
+        finally:
+            os.chdir(cwd)
+
+
+class SeasonStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.root.cleanup()
+
+    def test_games_round_trip(self):
+        store = SeasonStore(2022, self.root.name)
+        live = dict(make_game(3, "PAN", "OLY"), final=False)
+        store.write_games([make_game(2, "MAD", "BAR"), live, make_game(1, "BAR", "PAN")])
+        store.write_games([dict(make_game(3, "PAN", "OLY"), final=True)])
+
+        reopened = SeasonStore(2022, self.root.name)
+        self.assertEqual(len(reopened), 3)
+        self.assertEqual(reopened.stored_games(), {1: True, 2: True, 3: True})
+        self.assertEqual(reopened.game_revisions(), {1: 1, 2: 1, 3: 2})
+        self.assertEqual([x["game_code"] for x in reopened.iter_games()], [1, 2, 3])
+        self.assertEqual(list(reopened.iter_games([2])), [make_game(2, "MAD", "BAR")])
+
+    def test_legacy_season_file_is_migrated(self):
+        # season files written before the final flag only held complete downloads
+        games = [make_game(1, "MAD", "BAR"), make_game(2, "PAN", "OLY")]
+        with open(os.path.join(self.root.name, "season_2022.json"), "wb") as file:
+            file.write(decoding.dumps(games))
+
+        store = SeasonStore(2022, self.root.name)
+        self.assertEqual(store.stored_games(), {1: True, 2: True})
+        self.assertEqual(list(store.iter_games()), games)
+
+    def test_unreadable_state_is_ignored(self):
+        store = SeasonStore(2022, self.root.name)
+        self.assertIsNone(store.read_state())
+
+        store.write_state({"games": [1, 2]})
+        self.assertEqual(store.read_state(), {"games": [1, 2]})
+
+        with open(store.state_path, "wb") as file:
+            file.write(b"not a pickle")
+        self.assertIsNone(store.read_state())
+
+    def test_failed_write_keeps_the_old_file(self):
+        path = os.path.join(self.root.name, "manifest.json")
+        atomic_write(path, b"old")
+
+        with self.assertRaises(TypeError):
+            atomic_write(path, "not bytes")
+
+        with open(path, "rb") as file:
+            self.assertEqual(file.read(), b"old")
+        self.assertEqual(os.listdir(self.root.name), ["manifest.json"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from processing.sketches import QuantileSketch, k_for_error
+
+
+class QuantileSketchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.values = np.random.default_rng(0).normal(size=100000)
+        self.sorted_values = np.sort(self.values)
+
+    def true_rank(self, x):
+        return np.searchsorted(self.sorted_values, x, side="right") / len(self.values)
+
+    def test_exact_below_capacity(self):
+        sketch = QuantileSketch().update([3, 1, 2, np.nan])
+
+        np.testing.assert_array_equal(sketch.rank([0, 1, 2.5, 3]), [0, 1 / 3, 2 / 3, 1])
+        np.testing.assert_array_equal(sketch.quantile([0, 0.5, 1]), [1, 2, 3])
+
+    def test_exact_sketch_matches_pandas(self):
+        # ties and quantiles between two values
+        values = pd.Series(np.random.default_rng(1).integers(0, 20, 150).astype(float))
+        sketch = QuantileSketch().update(values)
+
+        np.testing.assert_allclose(sketch.rank(values), values.rank(pct=True))
+        q = [0, 0.1, 0.25, 0.5, 0.75, 0.95, 1]
+        np.testing.assert_allclose(sketch.quantile(q), values.quantile(q))
+
+    def test_rank_error_bound(self):
+        sketch = QuantileSketch.with_error(0.02, seed=1)
+        for x in np.array_split(self.values, 500):
+            sketch.update(x)
+
+        queries = np.linspace(-2, 2, 41)
+        self.assertLess(np.abs(sketch.rank(queries) - self.true_rank(queries)).max(), 0.02)
+        self.assertLess(sum(len(x) for x in sketch.levels), 4 * k_for_error(0.02))
+        self.assertEqual(sketch.quantile(1), self.values.max())
+
+    def test_merge_and_round_trip(self):
+        sketch = QuantileSketch(seed=1).update(self.values[:50000])
+        sketch.merge(QuantileSketch(seed=2).update(self.values[50000:]))
+        sketch = QuantileSketch.from_dict(sketch.to_dict())
+
+        self.assertEqual(sketch.count, len(self.values))
+        q = np.array([0.05, 0.25, 0.5, 0.75, 0.95])
+        self.assertLess(np.abs(self.true_rank(sketch.quantile(q)) - q).max(), sketch.error())
+
+
+if __name__ == '__main__':
+    unittest.main()